@@ -0,0 +1,284 @@
+"""
+Benchmarks for the main code paths, run against synthetic asset trees.
+
+Usage:
+
+    python -m benchmarks.run [--scale N] [--repeat N] [--output results.json]
+
+Results are written as JSON so they can be compared across commits. Node
+tools are replaced by stub executables which just copy their input, so the
+timings reflect our own overhead rather than the compilers'.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+
+
+STUB_LESSC = """#!{python}
+# Stands in for lessc: copies the input file (the second to last
+# argument) to the output file (the last argument), dropping imports
+import sys
+with open(sys.argv[-2]) as infile, open(sys.argv[-1], 'w') as outfile:
+    outfile.writelines(line for line in infile if not line.startswith('@import'))
+"""
+
+STUB_UGLIFYJS = """#!{python}
+# Stands in for uglifyjs: copies stdin to stdout
+import sys
+stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+stdout.write(stdin.read())
+"""
+
+
+class AssetTree(object):
+    """
+    Generates a tree of static files with a few different shapes:
+
+      * `deep` bundles, each of which requires a long chain of files
+      * `wide` bundles, each of which requires many files from a shared pool
+      * bundles which require a large vendor library
+      * LESS stylesheets which import a shared set of partials
+    """
+
+    def __init__(self, root, scale):
+        self.root = root
+        self.static_dir = os.path.join(root, 'static')
+        self.scale = scale
+        self.bundles = []
+        self.stylesheets = []
+
+    def write(self, name, contents):
+        path = os.path.join(self.static_dir, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(contents.encode('utf-8'))
+
+    def generate(self):
+        self.generate_deep()
+        self.generate_wide()
+        self.generate_vendor()
+        self.generate_less()
+        return self
+
+    def generate_deep(self, depth=50):
+        for n in range(depth):
+            requires = '//= require ./link{}.js\n'.format(n + 1) if n + 1 < depth else ''
+            self.write('_deep/link{}.js'.format(n),
+                       requires + 'var link{} = {};\n'.format(n, n) * 20)
+        for n in range(5 * self.scale):
+            self.add_bundle('deep/bundle{}.js'.format(n), ['_deep/link0.js'])
+
+    def generate_wide(self, pool_size=500, requires_per_bundle=100):
+        for n in range(pool_size * self.scale):
+            self.write('_wide/module{}.js'.format(n),
+                       'function module{}() {{ return {}; }}\n'.format(n, n) * 10)
+        for n in range(20 * self.scale):
+            modules = ['_wide/module{}.js'.format((n * 37 + m * 13) % (pool_size * self.scale))
+                       for m in range(requires_per_bundle)]
+            self.add_bundle('wide/bundle{}.js'.format(n), modules)
+
+    def generate_vendor(self, size=4 * 1024 * 1024):
+        line = 'vendor.fn = function() { return "some fairly typical code"; };\n'
+        self.write('_vendor/vendor.js', line * (size // len(line)))
+        for n in range(5 * self.scale):
+            self.add_bundle('vendor/bundle{}.js'.format(n), ['_vendor/vendor.js'])
+
+    def generate_less(self, partials=50):
+        for n in range(partials):
+            self.write('_less/partial{}.less'.format(n),
+                       '.class{} {{ color: red; }}\n'.format(n) * 20)
+        for n in range(20 * self.scale):
+            imports = ''.join('@import "_less/partial{}.less";\n'.format(m)
+                              for m in range(0, partials, 5))
+            name = 'styles/sheet{}.less'.format(n)
+            self.write(name, imports + 'body { margin: 0; }\n')
+            self.stylesheets.append(name)
+
+    def add_bundle(self, name, requires):
+        self.write(name, ''.join('//= require {}\n'.format(r) for r in requires)
+                   + 'main();\n')
+        self.bundles.append(name)
+
+
+def write_stub(directory, name, template):
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write(template.format(python=sys.executable))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+
+def configure(root, tree, compress):
+    from django.conf import settings
+    bin_dir = os.path.join(root, 'bin')
+    os.makedirs(bin_dir)
+    settings.configure(
+        DEBUG=False,
+        STATIC_URL='/static/',
+        STATIC_ROOT=os.path.join(root, 'collected'),
+        STATICFILES_DIRS=(tree.static_dir,),
+        INSTALLED_APPS=('django.contrib.staticfiles',),
+        STATICFILES_FINDERS=('staticfilesplus.finders.FileSystemFinder',),
+        STATICFILES_STORAGE='staticfilesplus.storage.CachedStaticFilesPlusStorage',
+        STATICFILESPLUS_PROCESSORS=(
+            'staticfilesplus.processors.less.LESSProcessor',
+            'staticfilesplus.processors.js.JavaScriptProcessor',
+        ),
+        STATICFILESPLUS_TMP_DIR=os.path.join(root, 'tmp'),
+        STATICFILESPLUS_LESS_BIN=write_stub(bin_dir, 'lessc', STUB_LESSC),
+        STATICFILESPLUS_JS_COMPRESS=compress,
+        STATICFILESPLUS_JS_COMPRESS_BIN=write_stub(bin_dir, 'uglifyjs', STUB_UGLIFYJS),
+        STATICFILESPLUS_JS_COMPRESS_ARGS=[],
+    )
+
+
+def measure(function, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.time()
+        function()
+        timings.append(time.time() - start)
+    timings.sort()
+    return {
+        'min': timings[0],
+        'median': timings[len(timings) // 2],
+        'max': timings[-1],
+        'repeat': repeat,
+    }
+
+
+def run_benchmarks(root, tree, repeat):
+    from django.conf import settings
+    from staticfilesplus.finders import FileSystemFinder
+    from staticfilesplus.lib.directive_processor import DirectiveProcessor
+    from staticfilesplus.lib.lru_cache import LRUCache
+    from staticfilesplus.lib.stat_index import StatIndex
+    from staticfilesplus.storage import (CachedStaticFilesPlusStorage,
+            JSONFileCache, MmapFileCache)
+
+    results = {}
+
+    def clear_tmp():
+        shutil.rmtree(settings.STATICFILESPLUS_TMP_DIR, ignore_errors=True)
+
+    def clear_collected():
+        shutil.rmtree(settings.STATIC_ROOT, ignore_errors=True)
+
+    processed_names = [name for name in tree.bundles] + \
+        [name[:-len('.less')] + '.css' for name in tree.stylesheets]
+    missing_names = ['missing{}.css'.format(n) for n in range(len(processed_names))]
+
+    def find_all(names):
+        finder = FileSystemFinder()
+        return lambda: [finder.find(name) for name in names]
+
+    # Cold: nothing has been processed yet
+    results['finder.find.cold'] = measure(
+            lambda: find_all(processed_names)(), repeat, setup=clear_tmp)
+    # Warm: repeated requests for unchanged files, as in development
+    warm_finder = find_all(processed_names)
+    warm_finder()
+    results['finder.find.warm'] = measure(warm_finder, repeat)
+    missing_finder = find_all(missing_names)
+    results['finder.find.missing'] = measure(missing_finder, repeat)
+
+    def list_all():
+        for _ in FileSystemFinder().list([]):
+            pass
+    results['finder.list.cold'] = measure(list_all, repeat, setup=clear_tmp)
+    results['finder.list.warm'] = measure(list_all, repeat)
+
+    for shape in ('deep', 'wide', 'vendor'):
+        bundles = [os.path.join(tree.static_dir, name)
+                   for name in tree.bundles if name.startswith(shape + '/')]
+        processor = DirectiveProcessor(load_paths=[tree.static_dir])
+        results['directive_processor.load.' + shape] = measure(
+                lambda: [processor.load(bundle) for bundle in bundles], repeat)
+        cached_processor = DirectiveProcessor(load_paths=[tree.static_dir],
+                cache=LRUCache(64 * 1024 * 1024),
+                file_index=StatIndex([tree.static_dir], '', track_mtimes=False))
+        results['directive_processor.load.{}.cached'.format(shape)] = measure(
+                lambda: [cached_processor.load(bundle) for bundle in bundles], repeat)
+
+    # Collect everything once so we have files to post-process
+    from django.core.management import call_command
+    clear_collected()
+    call_command('collectstatic', interactive=False, verbosity=0)
+    finder = FileSystemFinder()
+    paths = dict((name, (storage, name)) for name, storage in finder.list([]))
+
+    def post_process():
+        storage = CachedStaticFilesPlusStorage(remove_unversioned=False)
+        for _ in storage.post_process(paths):
+            pass
+    results['storage.post_process'] = measure(post_process, repeat)
+
+    manifest_entries = dict(('path/to/file{}.css'.format(n),
+                             'path/to/file{}.0123456789ab.css'.format(n))
+                            for n in range(60000))
+    json_manifest = os.path.join(root, 'manifest.json')
+    JSONFileCache(json_manifest).set_many(manifest_entries)
+    results['manifest.json.load'] = measure(
+            lambda: JSONFileCache(json_manifest).get('path/to/file1.css'), repeat)
+    mmap_manifest = os.path.join(root, 'manifest.bin')
+    MmapFileCache(mmap_manifest).set_many(manifest_entries)
+    results['manifest.binary.load'] = measure(
+            lambda: MmapFileCache(mmap_manifest).get('path/to/file1.css'), repeat)
+
+    return results
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                cwd=os.path.dirname(os.path.abspath(__file__))).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type=int, default=1,
+            help='multiplier for the number of generated files')
+    parser.add_argument('--repeat', type=int, default=5,
+            help='number of times to run each benchmark')
+    parser.add_argument('--compress', action='store_true',
+            help='run JavaScript through the (stub) compressor')
+    parser.add_argument('--output', help='file to write results to (default: stdout)')
+    args = parser.parse_args(argv)
+    root = tempfile.mkdtemp()
+    try:
+        tree = AssetTree(root, args.scale).generate()
+        configure(root, tree, args.compress)
+        results = run_benchmarks(root, tree, args.repeat)
+    finally:
+        shutil.rmtree(root)
+    output = json.dumps({
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'scale': args.scale,
+        'compress': args.compress,
+        'results': results,
+    }, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,495 @@
+import errno
+import hashlib
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.six import string_types
+
+from .lib.stat_index import StatIndex
+from .utils import write_atomic
+
+
+# Settings holding filesystem paths, which differ between checkouts
+PATH_SETTINGS = ('STATICFILES_DIRS', 'STATIC_ROOT', 'STATICFILESPLUS_TMP_DIR')
+
+
+class BuildCache(object):
+    """
+    Records a fingerprint of the inputs used to produce each processed file
+    so that we can skip processing if nothing has changed since last time.
+
+    The fingerprint covers the processor class, any settings it depends on,
+    and the contents of the input file and all its dependencies. Each output
+    file gets its own small JSON entry so that multiple worker processes can
+    update the cache without stepping on each other.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        # Maps path -> (mtime, size, digest) so we don't re-hash files shared
+        # by many outputs
+        self.file_hashes = {}
+
+    def is_fresh(self, processor, input_path, output_path):
+        entry = self.read_entry(output_path)
+        if entry is None:
+            return False
+        if entry['input'] != input_path or \
+                entry['processor'] != self.get_processor_name(processor) or \
+                entry['settings'] != self.get_settings_fingerprint(processor):
+            return False
+        try:
+            stat = os.stat(output_path)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return False
+            raise
+        if [stat.st_mtime, stat.st_size] != entry['output']:
+            return False
+        for path, digest in entry['files']:
+            if self.get_file_hash(path) != digest:
+                return False
+        return True
+
+    def store(self, processor, input_path, output_path, dependencies=None):
+        """
+        Records the fingerprint of a freshly processed file and returns the
+        list of its dependencies (or None if these aren't known). If
+        `dependencies` isn't supplied the processor is asked for them.
+        """
+        if dependencies is None:
+            dependencies = processor.get_dependencies(input_path)
+        # If the processor can't tell us what files it used then we can't
+        # safely cache its output
+        if dependencies is None:
+            self.delete_entry(output_path)
+            return None
+        files = [input_path] + sorted(set(dependencies) - set([input_path]))
+        algorithm = get_hash_algorithm()
+        stat = os.stat(output_path)
+        entry = {
+            'input': input_path,
+            'processor': self.get_processor_name(processor),
+            'settings': self.get_settings_fingerprint(processor),
+            'output': [stat.st_mtime, stat.st_size],
+            'files': [(path, self.get_file_hash(path)) for path in files],
+            # Saves collectstatic reading the output again to name it
+            'digest': [algorithm, get_file_digest(output_path, algorithm)],
+        }
+        self.write_entry(output_path, entry)
+        return dependencies
+
+    def get_output_digest(self, output_path, stat, algorithm):
+        """
+        Returns the `algorithm` digest of the output recorded when it was
+        built, or None if the output has changed since
+        """
+        entry = self.read_entry(output_path)
+        if entry is None or 'digest' not in entry:
+            return None
+        if entry['output'] != [stat.st_mtime, stat.st_size] or \
+                entry['digest'][0] != algorithm:
+            return None
+        return entry['digest'][1]
+
+    def get_processor_name(self, processor):
+        cls = processor.__class__
+        return '{}.{}'.format(cls.__module__, cls.__name__)
+
+    def get_settings_fingerprint(self, processor):
+        # DEBUG determines the defaults for most processor settings
+        names = ('DEBUG',) + tuple(processor.settings_names)
+        values = [(name, self.get_setting(name)) for name in names]
+        return hashlib.sha1(repr(values).encode('utf-8')).hexdigest()
+
+    def get_setting(self, name):
+        return getattr(settings, name, None)
+
+    def get_file_hash(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        cached = self.file_hashes.get(path)
+        if cached and cached[:2] == (stat.st_mtime, stat.st_size):
+            return cached[2]
+        digest = get_file_digest(path, 'sha1')
+        if time.time() - stat.st_mtime < StatIndex.RACY_INTERVAL:
+            self.file_hashes.pop(path, None)
+        else:
+            self.file_hashes[path] = (stat.st_mtime, stat.st_size, digest)
+        return digest
+
+    def get_entry_path(self, output_path):
+        key = hashlib.sha1(output_path.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + '.json')
+
+    def read_entry(self, output_path):
+        try:
+            with open(self.get_entry_path(output_path), 'rb') as f:
+                return json.loads(f.read().decode('utf-8'))
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        except ValueError:
+            # Treat a corrupt entry as a cache miss
+            return None
+
+    def write_entry(self, output_path, entry):
+        write_atomic(self.get_entry_path(output_path),
+                     json.dumps(entry).encode('utf-8'))
+
+    def delete_entry(self, output_path):
+        try:
+            os.remove(self.get_entry_path(output_path))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+
+class DigestCache(object):
+    """
+    Remembers the digest of every file collectstatic hashes, checked against
+    the file's mtime and size, so that files which haven't changed since the
+    last deploy don't have to be read again just to name them.
+
+    Only the digests used by the latest run are kept, so files which have
+    gone don't accumulate. Files modified very recently aren't remembered, as
+    a further change within the resolution of the filesystem's timestamps
+    might not change their mtime.
+    """
+
+    def __init__(self, cache_file, algorithm):
+        self.cache_file = cache_file
+        self.algorithm = algorithm
+        self.digests = {}
+        self.used = set()
+        try:
+            with open(self.cache_file, 'rb') as f:
+                contents = json.loads(f.read().decode('utf-8'))
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        except ValueError:
+            # Treat a corrupt file as empty
+            pass
+        else:
+            # Digests made with a different algorithm are no use to us
+            if contents.get('algorithm') == algorithm:
+                self.digests = contents['files']
+
+    def get(self, path, stat):
+        entry = self.digests.get(path)
+        if entry is None or entry[:2] != [stat.st_mtime, stat.st_size]:
+            return None
+        self.used.add(path)
+        return entry[2]
+
+    def set(self, path, stat, digest):
+        if time.time() - stat.st_mtime < StatIndex.RACY_INTERVAL:
+            self.digests.pop(path, None)
+            return
+        self.digests[path] = [stat.st_mtime, stat.st_size, digest]
+        self.used.add(path)
+
+    def save(self):
+        contents = {
+            'algorithm': self.algorithm,
+            'files': dict((path, self.digests[path]) for path in self.used),
+        }
+        write_atomic(self.cache_file, json.dumps(contents).encode('utf-8'))
+
+
+class SizeLimitedCache(BuildCache):
+    """
+    A cache which deletes its least recently used files once it grows beyond
+    `max_size` bytes. Subclasses call `stored` after adding to the cache and
+    `touch` files when they're used.
+    """
+
+    # How many outputs to store between checks on the size of the cache
+    EVICT_INTERVAL = 50
+
+    def __init__(self, directory, max_size):
+        super(SizeLimitedCache, self).__init__(directory)
+        self.max_size = max_size
+        self.stores_since_eviction = 0
+
+    def stored(self):
+        # Walking the whole cache is slow so only check its size now and then
+        self.stores_since_eviction += 1
+        if self.stores_since_eviction >= self.EVICT_INTERVAL:
+            self.stores_since_eviction = 0
+            self.evict()
+
+    def evict(self):
+        """
+        Deletes the least recently used files until the cache is under
+        `max_size`
+        """
+        files = []
+        total_size = 0
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError as e:
+                    # Another process may be evicting at the same time
+                    if e.errno == errno.ENOENT:
+                        continue
+                    raise
+                files.append((stat.st_mtime, stat.st_size, path))
+                total_size += stat.st_size
+        files.sort()
+        for mtime, size, path in files:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            total_size -= size
+
+    def touch(self, path):
+        try:
+            os.utime(path, None)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+
+class StageCache(SizeLimitedCache):
+    """
+    Caches the output of each stage of a processor pipeline. Entries are keyed
+    by the stage, its settings, the input path and a digest of the content the
+    stage was given, so a change to one stage (or its settings) only means
+    re-running that stage and the ones after it. Once the cache grows beyond
+    `max_size` bytes the least recently used entries are deleted.
+    """
+
+    def get(self, processor, input_path, content):
+        """
+        Returns a tuple of the cached output and the list of files the stage
+        depended on, or None if there isn't any output or any of those files
+        have changed
+        """
+        key = self.get_key(processor, input_path, content)
+        entry = self.read_entry(key)
+        if entry is None:
+            return None
+        for path, digest in entry['files']:
+            if self.get_file_hash(path) != digest:
+                return None
+        output_path = self.get_output_path(key)
+        try:
+            with open(output_path, 'rb') as f:
+                output = f.read()
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        if hashlib.sha1(output).hexdigest() != entry['output']:
+            return None
+        # Mark as recently used
+        self.touch(self.get_entry_path(key))
+        self.touch(output_path)
+        return output, [path for path, digest in entry['files']]
+
+    def set(self, processor, input_path, content, output):
+        dependencies = processor.get_dependencies(input_path)
+        # As with BuildCache, we can only cache output if we know what
+        # went into it
+        if dependencies is None:
+            return
+        key = self.get_key(processor, input_path, content)
+        files = sorted(set(dependencies) - set([input_path]))
+        self.write_output(key, output)
+        self.write_entry(key, {
+            'output': hashlib.sha1(output).hexdigest(),
+            'files': [(path, self.get_file_hash(path)) for path in files],
+        })
+        self.stored()
+
+    def get_key(self, processor, input_path, content):
+        key = [self.get_processor_name(processor),
+               self.get_settings_fingerprint(processor),
+               input_path,
+               hashlib.sha1(content).hexdigest()]
+        return hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+
+    def get_entry_path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get_output_path(self, key):
+        return os.path.join(self.directory, key + '.out')
+
+    def write_output(self, key, output):
+        write_atomic(self.get_output_path(key), output)
+
+
+class SharedCache(SizeLimitedCache):
+    """
+    A content-addressed store of processed files which can be shared between
+    machines, e.g. on a network mount.
+
+    Outputs are stored under the digest of their contents. Manifests, keyed
+    by the processor, its settings, the output name and the digest of the
+    input file, list the dependencies (with their digests) which each stored
+    output was built from. Dependency paths are recorded relative to the input
+    file so that builds in different locations can share entries.
+
+    Everything is written to a temporary file and renamed into place, so
+    readers never see partial files. Once the cache grows beyond `max_size`
+    bytes the least recently used files are deleted.
+    """
+
+    # How many different sets of dependencies to remember for each input
+    MAX_CANDIDATES = 8
+
+    def __init__(self, directory, root, max_size):
+        """
+        `root` is the directory outputs are written to, against which output
+        names are taken
+        """
+        super(SharedCache, self).__init__(directory, max_size)
+        self.root = root
+
+    def fetch(self, processor, input_path, output_path):
+        """
+        Copies a matching output into place and returns its list of
+        dependencies, or returns None on a cache miss
+        """
+        manifest_key = self.get_manifest_key(processor, input_path, output_path)
+        for candidate in self.read_manifest(manifest_key):
+            dependencies = [self.from_relative(input_path, path)
+                            for path, digest in candidate['files']]
+            if all(self.get_file_hash(path) == digest
+                   for path, (_, digest) in zip(dependencies, candidate['files'])):
+                object_path = self.get_object_path(candidate['output'])
+                if self.copy_object(object_path, output_path):
+                    return dependencies
+        return None
+
+    def publish(self, processor, input_path, output_path, dependencies):
+        if dependencies is None:
+            return
+        files = sorted(set(dependencies) - set([input_path]))
+        candidate = {
+            'files': [(self.to_relative(input_path, path), self.get_file_hash(path))
+                      for path in files],
+            'output': self.get_file_hash(output_path),
+        }
+        object_path = self.get_object_path(candidate['output'])
+        if not os.path.exists(object_path):
+            self.write_file(object_path, output_path)
+        manifest_key = self.get_manifest_key(processor, input_path, output_path)
+        candidates = [other for other in self.read_manifest(manifest_key)
+                      if other['files'] != candidate['files']]
+        candidates = [candidate] + candidates[:self.MAX_CANDIDATES - 1]
+        self.write_entry(manifest_key, candidates)
+        self.stored()
+
+    def get_setting(self, name):
+        value = super(SharedCache, self).get_setting(name)
+        if name in PATH_SETTINGS:
+            value = self.to_relative_paths(value)
+        return value
+
+    def to_relative_paths(self, value):
+        """
+        Makes any absolute paths in `value` relative to `root`, so builds in
+        different locations agree on the settings fingerprint
+        """
+        # STATICFILES_DIRS entries can be (prefix, path) pairs
+        if isinstance(value, (list, tuple)):
+            return [self.to_relative_paths(item) for item in value]
+        if isinstance(value, string_types) and os.path.isabs(value):
+            return os.path.relpath(value, self.root)
+        return value
+
+    def get_manifest_key(self, processor, input_path, output_path):
+        key = [self.get_processor_name(processor),
+               self.get_settings_fingerprint(processor),
+               os.path.relpath(output_path, self.root),
+               self.get_file_hash(input_path)]
+        return hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+
+    def get_entry_path(self, key):
+        return os.path.join(self.directory, 'manifests', key[:2], key + '.json')
+
+    def get_object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    def read_manifest(self, key):
+        manifest = self.read_entry(key)
+        if manifest is not None:
+            # Mark as recently used
+            self.touch(self.get_entry_path(key))
+        return manifest or []
+
+    def write_entry(self, key, entry):
+        # Other build nodes may run as different users
+        write_atomic(self.get_entry_path(key), json.dumps(entry).encode('utf-8'),
+                     mode=0o644)
+
+    def write_file(self, path, source_path):
+        with open(source_path, 'rb') as source:
+            content = source.read()
+        write_atomic(path, content, mode=0o644)
+
+    def copy_object(self, object_path, output_path):
+        try:
+            self.write_file(output_path, object_path)
+        except IOError as e:
+            # The object may have been evicted
+            if e.errno == errno.ENOENT:
+                return False
+            raise
+        self.touch(object_path)
+        return True
+
+    def to_relative(self, input_path, path):
+        return os.path.relpath(path, os.path.dirname(input_path))
+
+    def from_relative(self, input_path, path):
+        return os.path.normpath(os.path.join(os.path.dirname(input_path), path))
+
+
+def get_hash_algorithm():
+    """
+    Returns the name of the hashlib algorithm used to name collected files,
+    raising ImproperlyConfigured if it isn't available
+    """
+    algorithm = getattr(settings, 'STATICFILESPLUS_HASH_ALGORITHM', 'md5')
+    new_digest(algorithm)
+    return algorithm
+
+
+def new_digest(algorithm):
+    try:
+        return hashlib.new(algorithm)
+    except ValueError:
+        # e.g. blake2b, which needs Python 3.6
+        raise ImproperlyConfigured(
+            "Unknown STATICFILESPLUS_HASH_ALGORITHM '{}': expected one of "
+            "{}".format(algorithm, ', '.join(sorted(hashlib.algorithms_available))))
+
+
+def get_digest(chunks, algorithm):
+    digest = new_digest(algorithm)
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_file_digest(path, algorithm, chunk_size=65536):
+    with open(path, 'rb') as f:
+        return get_digest(iter(lambda: f.read(chunk_size), b''), algorithm)
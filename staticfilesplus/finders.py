@@ -1,5 +1,8 @@
 import errno
 import os
+import threading
+import time
+from multiprocessing.pool import Pool, ThreadPool
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
@@ -9,21 +12,45 @@ from django.contrib.staticfiles.finders import (
         AppDirectoriesFinder as DjangoAppDirectoriesFinder)
 from django.core.urlresolvers import get_callable
 
+from .cache import BuildCache, SharedCache
+from .lib.lru_cache import LRUCache
+from .processors import BaseProcessor
+from .processors.base import overrides, processes_batches, get_extra_sources
+from .processors.pipeline import Pipeline
+from .signals import file_processed, command_called, directive_file_loaded
+from .utils import get_tmp_dir, get_stat_index, get_subprocess_time
+from .watch import wait_for_watcher
+
 
 class ProcessorMixin(object):
     """
     Adds pre-processor support to a StaticFilesFinder
     """
+    # Whether this finder should find the sources processors generate for
+    # themselves. Only one finder needs to, or they'd be found twice.
+    finds_extra_sources = False
 
     def __init__(self, *args, **kwargs):
         super(ProcessorMixin, self).__init__(*args, **kwargs)
         # Configure temporary storage space for processed files
-        tmp_dir = getattr(settings, 'STATICFILESPLUS_TMP_DIR',
-                          os.path.join(settings.STATIC_ROOT, 'staticfilesplus_tmp'))
+        tmp_dir = get_tmp_dir()
         self.tmp_storage = FileSystemStorage(location=tmp_dir)
         # Can't set this as None through the constructor because it will
         # default to MEDIA_URL
         self.tmp_storage.base_url = None
+        # Configure the cache which lets us skip processing unchanged files
+        if getattr(settings, 'STATICFILESPLUS_BUILD_CACHE', True):
+            self.build_cache = BuildCache(os.path.join(tmp_dir, '.build_cache'))
+        else:
+            self.build_cache = None
+        # Configure the cache of outputs shared between builds
+        shared_cache_dir = getattr(settings, 'STATICFILESPLUS_SHARED_CACHE_DIR', None)
+        if shared_cache_dir:
+            self.shared_cache = SharedCache(shared_cache_dir, root=tmp_dir,
+                    max_size=getattr(settings, 'STATICFILESPLUS_SHARED_CACHE_SIZE',
+                                     1024 * 1024 * 1024))
+        else:
+            self.shared_cache = None
         # Configure processors
         if not isinstance(settings.STATICFILESPLUS_PROCESSORS, (list, tuple)):
             raise ImproperlyConfigured(
@@ -31,54 +58,289 @@ class ProcessorMixin(object):
                 "perhaps you forgot a trailing comma?")
         self.processors = []
         for processor in settings.STATICFILESPLUS_PROCESSORS:
-            Processor = get_callable(processor)
-            self.processors.append(Processor())
+            # A list of processors is treated as a pipeline, with each one
+            # processing the output of the one before
+            if isinstance(processor, (list, tuple)):
+                stages = [get_callable(stage)() for stage in processor]
+                self.processors.append(Pipeline(stages))
+            else:
+                Processor = get_callable(processor)
+                self.processors.append(Processor())
+        self.build_processor_index()
+        # Configure the cache of find results
+        if getattr(settings, 'STATICFILESPLUS_FIND_CACHE', True):
+            locations = [storage.location for storage in self.storages.values()]
+            self.file_index = get_stat_index(locations, '', track_mtimes=False)
+            self.find_cache = LRUCache(10000)
+            self.find_cache_generation = None
+            self.find_cache_lock = threading.Lock()
+        else:
+            self.find_cache = None
 
     def find(self, path, all=False):
         if all:
             raise NotImplementedError("Staticfilesplus can't handle the `all` flag at the moment")
+        processor, match = self.resolve(path)
+        if processor is None:
+            return match
+        return self.process_file(processor, match, path)
+
+    def resolve(self, path):
+        """
+        Returns a (processor, match) pair, where match is the original file
+        which should be processed to produce `path`. If no processing is
+        needed the processor is None and match is the result of the standard
+        find method.
+
+        Results are cached until a file is added to or removed from any of
+        our storages, or the processors' extra sources change.
+        """
+        if self.find_cache is None:
+            return self.resolve_uncached(path)
+        # Extra sources live outside our storages, so the index can't see them
+        generation = (self.file_index.get_generation(), self.get_all_extra_sources())
+        with self.find_cache_lock:
+            if generation != self.find_cache_generation:
+                self.find_cache.clear()
+                self.find_cache_generation = generation
+        result = self.find_cache.get(path)
+        if result is None:
+            result = self.resolve_uncached(path)
+            self.find_cache.set(path, result, size=1)
+        return result
+
+    def resolve_uncached(self, path):
         # Walk the list of processors, seeing if any want to handle
         # this request and if there's a matching file
         tried_names = set()
-        for processor in self.processors:
+        for processor in self.get_processors(path, 'processed_suffix'):
             orig_name = processor.get_original_name(path)
             if orig_name is None or orig_name in tried_names:
                 continue
             tried_names.add(orig_name)
-            match = super(ProcessorMixin, self).find(orig_name)
+            match = super(ProcessorMixin, self).find(orig_name) or \
+                    self.find_extra_source(processor, orig_name)
             if match:
                 if processor.is_ignored_file(orig_name):
-                    return []
+                    return None, []
                 else:
-                    return self.process_file(processor, match, path)
+                    return processor, match
         # As a last resort we try the untransformed path
         if path not in tried_names:
-            return super(ProcessorMixin, self).find(path)
+            return None, super(ProcessorMixin, self).find(path)
         else:
-            return []
+            return None, []
+
+    def get_all_extra_sources(self):
+        if not self.finds_extra_sources:
+            return None
+        return [get_extra_sources(processor) for processor in self.processors]
+
+    def find_extra_source(self, processor, name):
+        if not self.finds_extra_sources:
+            return None
+        for directory, extra_name in get_extra_sources(processor):
+            if extra_name == name:
+                return os.path.join(directory, name)
+        return None
+
+    def get_processors(self, name, suffix_attr):
+        """
+        Returns, in order, the processors which might handle `name` based on
+        its suffix. Processors which don't define `suffix_attr` or which
+        override the default name handling are always included.
+        """
+        matches = list(self.unindexed_processors)
+        index = self.processor_index[suffix_attr]
+        # Suffixes needn't start with a dot, so look up the end of the name
+        # at each length a suffix has, matching BaseProcessor's endswith()
+        for length in self.suffix_lengths[suffix_attr]:
+            if length <= len(name):
+                matches.extend(index.get(name[len(name) - length:], ()))
+        return [processor for _, processor in sorted(matches)]
+
+    def build_processor_index(self):
+        self.unindexed_processors = []
+        self.processor_index = {'original_suffix': {}, 'processed_suffix': {}}
+        for position, processor in enumerate(self.processors):
+            if uses_default_naming(processor):
+                for suffix_attr, index in self.processor_index.items():
+                    suffix = getattr(processor, suffix_attr)
+                    index.setdefault(suffix, []).append((position, processor))
+            else:
+                self.unindexed_processors.append((position, processor))
+        self.suffix_lengths = dict(
+                (suffix_attr, sorted(set(len(suffix) for suffix in index)))
+                for suffix_attr, index in self.processor_index.items())
 
     def list(self, *args, **kwargs):
+        workers = getattr(settings, 'STATICFILESPLUS_WORKERS', 1)
+        matches = self.list_matches(*args, **kwargs)
+        if any(processes_batches(processor) for processor in self.processors):
+            matches = self.process_batches(list(matches), workers)
+        if workers > 1:
+            return self.list_parallel(matches, workers)
+        return self.list_serial(matches)
+
+    def list_matches(self, *args, **kwargs):
+        """
+        Yields (name, storage, processor, processed_name) for each file found
+        by the parent finder, where processor is the processor which will
+        handle the file (or None)
+        """
         for name, storage in super(ProcessorMixin, self).list(*args, **kwargs):
             # Walk the list of processors, seeing if any want to handle
             # this type of file
-            matched_processor = None
-            for processor in self.processors:
+            matched_processor = processed_name = None
+            for processor in self.get_processors(name, 'original_suffix'):
                 processed_name = processor.get_processed_name(name)
                 if processed_name is not None:
                     matched_processor = processor
                     break
-            if matched_processor is None:
+            # If the processor explicitly excludes this file then pretend
+            # we never found it
+            if matched_processor is not None and \
+                    matched_processor.is_ignored_file(name):
+                continue
+            yield name, storage, matched_processor, processed_name
+        if self.finds_extra_sources:
+            for processor in self.processors:
+                for directory, name in get_extra_sources(processor):
+                    yield (name, FileSystemStorage(location=directory), processor,
+                           processor.get_processed_name(name))
+
+    def list_serial(self, matches):
+        for name, storage, processor, processed_name in matches:
+            if processor is None:
                 yield name, storage
             else:
-                # If the processor explicitly excludes this file then pretend
-                # we never found it
-                if matched_processor.is_ignored_file(name):
+                self.process_file(processor, storage.path(name), processed_name)
+                yield processed_name, self.tmp_storage
+
+    def list_parallel(self, matches, workers):
+        """
+        Hands processing off to a pool of `workers` threads or processes,
+        depending on each processor's `parallel_mode`, but yields results
+        in the same order as `list_serial` would. The first error raised by
+        a processor aborts the run.
+        """
+        pools = {}
+        results = []
+        try:
+            for name, storage, processor, processed_name in matches:
+                if processor is None:
+                    results.append((name, storage, None))
                     continue
+                mode = processor.parallel_mode
+                if mode not in pools:
+                    pools[mode] = self.get_pool(mode, workers)
                 path = storage.path(name)
-                self.process_file(matched_processor, path, processed_name)
-                yield processed_name, self.tmp_storage
+                output_path = self.get_output_path(processed_name)
+                # Signals sent in worker processes wouldn't reach receivers
+                # here, so they're passed back with the stats
+                result = pools[mode].apply_async(run_processor,
+                        (processor, path, output_path, self.build_cache,
+                         self.shared_cache, mode == 'processes'))
+                results.append((processed_name, self.tmp_storage,
+                                (processor, path, output_path, result)))
+            for name, storage, job in results:
+                if job is not None:
+                    processor, path, output_path, result = job
+                    # Re-raises any exception from the worker. Signals are
+                    # sent from here so that receivers in this process see
+                    # them whichever parallel_mode is used.
+                    stats = result.get()
+                    self.send_file_processed(processor, path, output_path, stats)
+                yield name, storage
+        finally:
+            # If we've bailed out early there's no point waiting for
+            # outstanding jobs
+            for pool in pools.values():
+                pool.terminate()
+            for pool in pools.values():
+                pool.join()
+
+    def process_batches(self, matches, workers):
+        """
+        Processes all the files handled by processors which support batches,
+        split into at most `workers` batches per processor, and returns the
+        list of matches with these files replaced by their processed versions
+        """
+        batches = {}
+        remaining_matches = []
+        for name, storage, processor, processed_name in matches:
+            if processor is not None and processes_batches(processor):
+                batches.setdefault(processor, []).append(
+                    (storage.path(name), self.get_output_path(processed_name)))
+                # Processed files are found in tmp_storage like any other
+                remaining_matches.append((processed_name, self.tmp_storage, None, None))
+            else:
+                remaining_matches.append((name, storage, processor, processed_name))
+        # Batch processors are expected to spend their time waiting on a
+        # subprocess, so threads are all we need
+        pool = ThreadPool(workers) if batches and workers > 1 else None
+        results = []
+        try:
+            for processor, jobs in batches.items():
+                # Split into roughly equal batches, one per worker
+                batch_count = min(workers, len(jobs))
+                for n in range(batch_count):
+                    batch = jobs[n::batch_count]
+                    args = (processor, batch, self.build_cache, self.shared_cache)
+                    if pool is not None:
+                        result = pool.apply_async(run_batch, args)
+                    else:
+                        result = run_batch(*args)
+                    results.append((processor, batch, result))
+            for processor, batch, result in results:
+                # Re-raises any exception from the worker
+                stats = result.get() if pool is not None else result
+                for (path, output_path), file_stats in zip(batch, stats):
+                    self.send_file_processed(processor, path, output_path, file_stats)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        return remaining_matches
+
+    def get_pool(self, mode, workers):
+        if mode == 'threads':
+            return ThreadPool(workers)
+        elif mode == 'processes':
+            return Pool(workers)
+        raise ImproperlyConfigured(
+                "Unknown parallel_mode '{}': expected 'threads' or "
+                "'processes'".format(mode))
 
     def process_file(self, processor, path, processed_name):
+        output_path = self.get_output_path(processed_name)
+        if self.is_prebuilt(processor, path, output_path):
+            return output_path
+        stats = run_processor(processor, path, output_path, self.build_cache,
+                self.shared_cache)
+        self.send_file_processed(processor, path, output_path, stats)
+        return output_path
+
+    def is_prebuilt(self, processor, path, output_path):
+        """
+        In development, the `watchstatic` command can build files as soon as
+        their sources change. While it's running we wait for it to finish
+        any rebuild and then use its output if it's fresh. The watcher may
+        not have noticed a change yet, in which case we process the file
+        ourselves as usual.
+        """
+        if not settings.DEBUG or self.build_cache is None:
+            return False
+        return wait_for_watcher() and \
+            self.build_cache.is_fresh(processor, path, output_path)
+
+    def send_file_processed(self, processor, path, output_path, stats):
+        for name, sender, kwargs in stats.pop('signals', ()):
+            RELAYED_SIGNALS[name].send(sender=sender, **kwargs)
+        file_processed.send(sender=self.__class__, processor=processor,
+                input_path=path, output_path=output_path, **stats)
+
+    def get_output_path(self, processed_name):
         # Get the full output path
         output_path = self.tmp_storage.path(processed_name)
         # Create the required directories
@@ -87,13 +349,130 @@ class ProcessorMixin(object):
         except OSError as e:
             if e.errno != errno.EEXIST:
                 raise
-        # Process the file
-        processor.process_file(path, output_path)
         return output_path
 
 
+def uses_default_naming(processor):
+    """
+    Whether the processor derives names from its suffixes in the standard
+    BaseProcessor way
+    """
+    if not isinstance(processor, BaseProcessor):
+        return False
+    if overrides(processor, 'get_original_name') or \
+            overrides(processor, 'get_processed_name'):
+        return False
+    return processor.original_suffix is not None and \
+        processor.processed_suffix is not None
+
+
+# Signals which processors send while they work, by name so that they can
+# be passed back from worker processes
+RELAYED_SIGNALS = {
+    'command_called': command_called,
+    'directive_file_loaded': directive_file_loaded,
+}
+
+
+def run_processor(processor, path, output_path, build_cache=None, shared_cache=None,
+                  relay_signals=False):
+    """
+    Processes `path` unless the build cache says the output is fresh, or the
+    output can be fetched from the shared cache, and returns a dict of
+    timings and counts for the `file_processed` signal
+
+    If `relay_signals` is True, the RELAYED_SIGNALS sent while processing
+    are also returned, under `signals`, as (name, sender, kwargs) tuples
+    """
+    # Defined at module level so it can be pickled and sent to
+    # worker processes
+    if not relay_signals:
+        return run_batch(processor, [(path, output_path)], build_cache, shared_cache,
+                batch=False)[0]
+    sent = []
+    receivers = []
+    for name, signal in RELAYED_SIGNALS.items():
+        def receiver(sender, name=name, **kwargs):
+            kwargs.pop('signal', None)
+            sent.append((name, sender, kwargs))
+        signal.connect(receiver, weak=False)
+        receivers.append((signal, receiver))
+    try:
+        stats = run_batch(processor, [(path, output_path)], build_cache, shared_cache,
+                batch=False)[0]
+    finally:
+        for signal, receiver in receivers:
+            signal.disconnect(receiver)
+    stats['signals'] = sent
+    return stats
+
+
+def run_batch(processor, jobs, build_cache=None, shared_cache=None, batch=True):
+    """
+    As `run_processor`, but for a list of (path, output_path) pairs, returning
+    a list of stats. If `batch` is True, the files which need processing are
+    all handed to the processor's `process_files` method at once, and the
+    time taken is divided equally between them.
+    """
+    start = time.time()
+    subprocess_start = get_subprocess_time()
+    results = []
+    stale_jobs = []
+    for path, output_path in jobs:
+        result = {'cache_hit': False, 'shared_cache_hit': None, 'dependencies': None}
+        results.append(result)
+        if build_cache is not None and \
+                build_cache.is_fresh(processor, path, output_path):
+            result['cache_hit'] = True
+            continue
+        if shared_cache is not None:
+            result['dependencies'] = shared_cache.fetch(processor, path, output_path)
+            result['shared_cache_hit'] = result['dependencies'] is not None
+            if result['shared_cache_hit']:
+                continue
+        stale_jobs.append((path, output_path, result))
+    if batch and stale_jobs:
+        processor.process_files([(path, output_path)
+                                 for path, output_path, _ in stale_jobs])
+    for path, output_path, result in stale_jobs:
+        if not batch:
+            processor.process_file(path, output_path)
+        # Without a cache to store them in, dependencies would only be
+        # needed for the stats, which isn't worth the cost
+        if build_cache is None and shared_cache is None:
+            continue
+        result['dependencies'] = processor.get_dependencies(path)
+        if shared_cache is not None:
+            shared_cache.publish(processor, path, output_path, result['dependencies'])
+    stats = []
+    duration = (time.time() - start) / len(jobs)
+    subprocess_time = (get_subprocess_time() - subprocess_start) / len(jobs)
+    for (path, output_path), result in zip(jobs, results):
+        dependencies = result.pop('dependencies')
+        if build_cache is not None and not result['cache_hit']:
+            build_cache.store(processor, path, output_path, dependencies)
+        result.update({
+            'duration': duration,
+            'subprocess_time': subprocess_time,
+            'bytes_in': get_size(path),
+            'bytes_out': get_size(output_path),
+            'dependency_count': len(dependencies) if dependencies is not None else None,
+        })
+        stats.append(result)
+    return stats
+
+
+def get_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return None
+
+
 class FileSystemFinder(ProcessorMixin, DjangoFileSystemFinder):
-    pass
+    finds_extra_sources = True
 
 class AppDirectoriesFinder(ProcessorMixin, DjangoAppDirectoriesFinder):
     pass
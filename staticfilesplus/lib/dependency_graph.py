@@ -0,0 +1,147 @@
+"""
+A persistent record of which files each bundle depends on, for working out
+which bundles need rebuilding when a file changes.
+
+Each bundle's graph is stored in its own JSON file so that bundles can be
+processed in separate processes without contention.
+"""
+import errno
+import hashlib
+import json
+import os
+
+from ..utils import write_atomic
+
+
+class DependencyGraph(object):
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        # Maps each bundle to its require graph, which maps each file in the
+        # bundle to the set of files it directly depends on
+        self.bundles = {}
+        # Maps each file to the files which directly depend on it, each with
+        # the number of bundles which record that edge
+        self.reverse_edges = {}
+
+    def set_bundle(self, bundle, edges):
+        """
+        Replace the recorded graph for `bundle`, saving it to disk if we
+        have a directory to save to
+        """
+        edges = dict((path, set(deps)) for path, deps in edges.items())
+        self.remove_reverse_edges(self.bundles.get(bundle, {}))
+        self.bundles[bundle] = edges
+        self.add_reverse_edges(edges)
+        if self.directory is not None:
+            self.save_bundle(bundle)
+
+    def remove_bundle(self, bundle):
+        self.remove_reverse_edges(self.bundles.pop(bundle, {}))
+        if self.directory is not None:
+            try:
+                os.remove(self.get_bundle_path(bundle))
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+    def get_bundles(self):
+        return set(self.bundles)
+
+    def get_direct_dependencies(self, path):
+        deps = set()
+        for edges in self.bundles.values():
+            deps.update(edges.get(path, ()))
+        return deps
+
+    def get_direct_dependents(self, path):
+        return set(self.reverse_edges.get(path, ()))
+
+    def get_dependencies(self, bundle):
+        """
+        Returns every file `bundle` transitively depends on
+        """
+        edges = self.bundles.get(bundle, {})
+        return set(path for path in edges if path != bundle)
+
+    def get_dependents(self, path):
+        """
+        Returns every file which transitively depends on `path`
+        """
+        seen = set()
+        to_visit = [path]
+        while to_visit:
+            for dependent in self.reverse_edges.get(to_visit.pop(), ()):
+                if dependent not in seen:
+                    seen.add(dependent)
+                    to_visit.append(dependent)
+        seen.discard(path)
+        return seen
+
+    def get_affected_bundles(self, changed_paths):
+        """
+        Returns the bundles which need rebuilding if `changed_paths` change
+        """
+        changed_paths = set(changed_paths)
+        return set(bundle for bundle, edges in self.bundles.items()
+                   if bundle in changed_paths or changed_paths.intersection(edges))
+
+    def rebuild_reverse_edges(self):
+        self.reverse_edges = {}
+        for edges in self.bundles.values():
+            self.add_reverse_edges(edges)
+
+    def add_reverse_edges(self, edges):
+        for path, deps in edges.items():
+            for dep in deps:
+                dependents = self.reverse_edges.setdefault(dep, {})
+                dependents[path] = dependents.get(path, 0) + 1
+
+    def remove_reverse_edges(self, edges):
+        for path, deps in edges.items():
+            for dep in deps:
+                dependents = self.reverse_edges[dep]
+                dependents[path] -= 1
+                # Other bundles may still record the same edge
+                if not dependents[path]:
+                    del dependents[path]
+                    if not dependents:
+                        del self.reverse_edges[dep]
+
+    def load(self):
+        """
+        Load all the bundles previously saved to our directory
+        """
+        self.bundles = {}
+        try:
+            filenames = os.listdir(self.directory)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            filenames = []
+        for filename in filenames:
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename), 'rb') as f:
+                    data = json.loads(f.read().decode('utf-8'))
+            except ValueError:
+                # Ignore corrupt files, the bundle will just get rebuilt
+                continue
+            self.bundles[data['bundle']] = dict(
+                    (path, set(deps)) for path, deps in data['edges'].items())
+        self.rebuild_reverse_edges()
+        return self
+
+    def save_bundle(self, bundle):
+        data = {
+            'bundle': bundle,
+            'edges': dict((path, sorted(deps))
+                          for path, deps in self.bundles[bundle].items()),
+        }
+        write_atomic(self.get_bundle_path(bundle),
+                     json.dumps(data, indent=2, sort_keys=True).encode('utf-8'))
+
+    def get_bundle_path(self, bundle):
+        key = hashlib.sha1(bundle.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + '.json')
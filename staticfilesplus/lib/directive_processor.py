@@ -7,10 +7,16 @@ Implements just the `require` and `stub` directives.
 Thanks to Sam Stephenson (author of Sprockets), and to Mike Yumatov (author of Gears
 -- https://github.com/gears/gears) for inspiration.
 """
+from __future__ import unicode_literals
+
+import errno
 import re
 import os
 import shlex
 import sys
+import time
+
+from .stat_index import StatIndex
 
 
 class DirectiveProcessor(object):
@@ -35,55 +41,217 @@ class DirectiveProcessor(object):
     current_line = None
     current_file = None
 
-    def __init__(self, load_paths=None):
+    def __init__(self, load_paths=None, cache=None, file_index=None):
         self.load_paths = load_paths if load_paths is not None else []
+        # Optional LRUCache for parsed files, so that files shared between
+        # bundles only get read and parsed once
+        self.cache = cache
+        # Optional StatIndex of every file in the load paths, so that finding
+        # files doesn't require stat'ing every possible location
+        self.file_index = file_index
+        self.indexed_files = None
+        self.indexed_dirs = None
+        # The require graph of the last loaded file, mapping each file used
+        # to the set of files it directly requires or stubs
+        self.edges = {}
+        # The files whose contents made it into the output of the last loaded
+        # file (i.e. excluding stubbed files), in the order they appear
+        self.included = []
+        self.stub_depth = 0
+
+    def load(self, name, files_seen=None, contents=None, requires=()):
+        """
+        Returns the processed contents of `name`. If supplied, `files_seen` is
+        updated with the path of every file used (including any stubbed files)
+
+        If `contents` (as bytes) is supplied it is used in place of reading
+        `name` itself, though any files it requires are still read from disk
 
-    def load(self, name):
-        return self.process_file(name, path_context=os.getcwd(), files_seen=set())[0]
+        Any paths in `requires` are required before the file's own directives,
+        as if it began with a `require` directive for each of them
+        """
+        return ''.join(self.iter_chunks(name, files_seen, contents, requires))
+
+    def write(self, name, stream, files_seen=None, contents=None, requires=()):
+        """
+        As `load`, but writes the processed contents to `stream` a piece at a
+        time rather than building the whole thing up in memory
+        """
+        for chunk in self.iter_chunks(name, files_seen, contents, requires):
+            stream.write(chunk)
+
+    def iter_chunks(self, name, files_seen=None, contents=None, requires=()):
+        if files_seen is None:
+            files_seen = set()
+        self.edges = {}
+        self.included = []
+        # Take a snapshot of the file index, which we assume won't change
+        # while we're processing
+        if self.file_index is not None:
+            self.indexed_files = self.file_index.get_paths()
+            self.indexed_dirs = self.file_index.get_dirs()
+        if contents is None and not requires:
+            return self.iter_file(name, path_context=os.getcwd(), files_seen=files_seen)
+        if contents is None:
+            path = self.find_path(name, os.getcwd())
+            directives, body = self.get_parsed_file(path)
+        else:
+            path = os.path.abspath(name)
+            self.current_file = path
+            directives, body = self.extract_directives(self.decode_contents(path, contents))
+        files_seen.add(path)
+        self.edges[path] = set()
+        # Passed straight through rather than as directive text, so they can
+        # be any path at all
+        directives = [(None, 'require', required) for required in requires] + \
+            list(directives)
+        return self.iter_parsed_file(path, directives, body, files_seen)
 
     def process_file(self, name, path_context, files_seen):
+        chunks = self.iter_file(name, path_context, files_seen)
+        if chunks is None:
+            return None, files_seen
+        return ''.join(chunks), files_seen
+
+    def iter_file(self, name, path_context, files_seen):
+        """
+        Returns a generator of chunks of the processed contents of `name`,
+        or None if it has already been included
+        """
         path = self.find_path(name, path_context)
+        # Record the edge even if we've already seen the file, so the graph
+        # reflects every dependency and not just the first route to it
+        if path_context in self.edges:
+            self.edges[path_context].add(path)
         if path in files_seen:
-            return None, files_seen
+            return None
         files_seen.add(path)
-        source = self.get_file_contents(path)
-        self.current_file = path
-        directives, body = self.extract_directives(source)
-        output = []
+        self.edges[path] = set()
+        directives, body = self.get_parsed_file(path)
+        return self.iter_parsed_file(path, directives, body, files_seen)
+
+    def iter_parsed_file(self, path, directives, body, files_seen):
         for line_num, directive, arg in directives:
             # Keep track of line number for more helpful exceptions
             self.current_line = line_num
             self.current_file = path
-            content, new_files_seen = self.process_directive(
+            chunks = self.process_directive(
                     directive, arg, path_context=path, files_seen=files_seen)
             self.current_line = None
-            files_seen.update(new_files_seen)
-            if content is not None:
-                output.append(content)
-        output.append(body)
-        return '\n'.join(output), files_seen
+            if chunks is not None:
+                for chunk in chunks:
+                    yield chunk
+                yield '\n'
+        if not self.stub_depth:
+            self.included.append(path)
+        yield body
+
+    def get_parsed_file(self, path):
+        """
+        Returns the directives and body of the file at `path`, using the
+        cache if we have one and the file is unchanged
+        """
+        start = time.time()
+        key = None
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            # Leave get_file_contents to deal with missing files
+            if e.errno != errno.ENOENT:
+                raise
+            stat = None
+        if stat is not None and self.cache is not None and self.is_cacheable(path):
+            key = (path, stat.st_mtime, stat.st_size)
+            parsed = self.cache.get(key)
+            if parsed is not None:
+                self.file_loaded(path, time.time() - start, stat.st_size, True)
+                return parsed
+        source = self.get_file_contents(path)
+        self.current_file = path
+        parsed = self.extract_directives(source)
+        # Sizes are in bytes, which the decoded source may not be
+        if stat is not None:
+            size = stat.st_size
+        else:
+            size = len(source.encode('utf-8'))
+        # A file modified very recently could change again without its mtime
+        # changing, so it can't be cached yet
+        if key is not None and start - stat.st_mtime >= StatIndex.RACY_INTERVAL:
+            self.cache.set(key, parsed, size=size)
+        self.file_loaded(path, time.time() - start, size, False)
+        return parsed
+
+    def file_loaded(self, path, duration, size, cache_hit):
+        """
+        Called each time a file is loaded, with the time taken, its size
+        and whether it came from the cache. Override to collect statistics.
+        """
+        pass
+
+    def is_cacheable(self, path):
+        """
+        Whether the parsed contents of `path` depend only on the file itself
+        """
+        return True
 
     def get_file_contents(self, path):
         with open(path, 'rb') as f:
-            return f.read().decode('utf-8')
+            return self.decode_contents(path, f.read())
+
+    def decode_contents(self, path, contents):
+        """
+        Turns the raw bytes of the file at `path` into source text
+        """
+        return contents.decode('utf-8')
 
     def process_directive(self, directive, arg, path_context, files_seen):
         if directive not in ('require', 'stub'):
             raise self.error('Unimplemented directive: {}'.format(directive))
-        output, files_seen = self.process_file(arg, path_context, files_seen)
+        chunks = self.iter_file(arg, path_context, files_seen)
         if directive == 'require':
-            return output, files_seen
-        else:
-            return None, files_seen
+            return chunks
+        # Stubbed files still need processing so that they (and their
+        # dependencies) are marked as seen, but we discard the output
+        if chunks is not None:
+            self.stub_depth += 1
+            try:
+                for _ in chunks:
+                    pass
+            finally:
+                self.stub_depth -= 1
+        return None
 
     def find_path(self, name, path_context):
         options = self.find_path_options(name, path_context)
         for option in options:
-            if os.path.exists(option):
+            if self.is_indexed(option):
+                if os.path.normpath(option) in self.indexed_files:
+                    return option
+            # Fall back to checking the filesystem for anything the index
+            # doesn't cover
+            elif os.path.exists(option):
                 return option
         raise self.error('Unable to find "{}", tried:\n  {}'.format(
                 name, '\n  '.join(options)))
 
+    def is_indexed(self, path):
+        """
+        Returns True if the index can tell us whether `path` exists, i.e.
+        it's under the indexed directories and not reached through a symlink
+        """
+        if self.indexed_files is None:
+            return False
+        directory = os.path.dirname(os.path.normpath(path))
+        while directory not in self.indexed_dirs:
+            # Symlinks to directories are indexed as files, but not followed
+            if directory in self.indexed_files:
+                return False
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                return False
+            directory = parent
+        return True
+
     def find_path_options(self, name, path_context):
         """
         Given a filename and a path context in which to resolve relative
@@ -0,0 +1,120 @@
+"""
+Watches directory trees for changes, using inotify where it's available and
+falling back to polling the filesystem everywhere else.
+
+Both watchers have the same interface: `wait(timeout)` blocks until at least
+one file changes (or the timeout expires) and returns the set of paths which
+were created, modified or deleted.
+"""
+import errno
+import os
+import time
+
+from .stat_index import Inotify, inotify_available, IN_CREATE, IN_MOVED_TO, IN_ISDIR
+
+
+class InotifyWatcher(object):
+
+    def __init__(self, directories):
+        """
+        Raises OSError if inotify isn't available
+        """
+        if not inotify_available():
+            raise OSError(errno.ENOSYS, 'inotify is only available on Linux')
+        self.directories = list(directories)
+        self.inotify = Inotify()
+        for directory in self.directories:
+            self.add_tree(directory)
+
+    def add_tree(self, directory):
+        # inotify isn't recursive so each subdirectory needs its own watch
+        for root, dirs, files in os.walk(directory):
+            try:
+                self.inotify.add_watch(root)
+            except OSError as e:
+                # The directory may already have gone again
+                if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                    raise
+
+    def wait(self, timeout=None):
+        if not self.inotify.wait(timeout):
+            return set()
+        events = self.inotify.read_events()
+        if events is None:
+            # Events have been lost, so report everything and make sure
+            # every directory is watched
+            changed = set()
+            for directory in self.directories:
+                self.add_tree(directory)
+                changed.update(walk_files(directory))
+            return changed
+        changed = set()
+        for path, mask in events:
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # Watch the new directory, and report anything that was
+                # created in it before we started watching
+                self.add_tree(path)
+                changed.update(walk_files(path))
+            changed.add(path)
+        return changed
+
+    def close(self):
+        self.inotify.close()
+
+
+class PollingWatcher(object):
+
+    def __init__(self, directories, interval=1.0):
+        self.directories = list(directories)
+        self.interval = interval
+        self.snapshot = self.take_snapshot()
+
+    def take_snapshot(self):
+        snapshot = {}
+        for directory in self.directories:
+            for path in walk_files(directory):
+                try:
+                    stat = os.stat(path)
+                except OSError as e:
+                    if e.errno == errno.ENOENT:
+                        continue
+                    raise
+                snapshot[path] = (stat.st_mtime, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout=None):
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            delay = self.interval
+            if deadline is not None:
+                delay = max(0, min(delay, deadline - time.time()))
+            time.sleep(delay)
+            snapshot = self.take_snapshot()
+            changed = set(path for path in set(snapshot) | set(self.snapshot)
+                          if snapshot.get(path) != self.snapshot.get(path))
+            self.snapshot = snapshot
+            if changed or (deadline is not None and time.time() >= deadline):
+                return changed
+
+    def close(self):
+        pass
+
+
+def get_watcher(directories, polling=False, interval=1.0):
+    """
+    Returns an InotifyWatcher if possible, unless `polling` is set, and a
+    PollingWatcher otherwise
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(directories)
+        except OSError:
+            pass
+    return PollingWatcher(directories, interval=interval)
+
+
+def walk_files(directory):
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            yield os.path.join(root, name)
+
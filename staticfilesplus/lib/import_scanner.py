@@ -0,0 +1,141 @@
+"""
+Finds the files a LESS or Sass stylesheet imports, without running the
+compiler, so that we know exactly which stylesheets need rebuilding when a
+file changes.
+
+This is deliberately conservative: if a stylesheet contains an import we
+can't follow (for instance one built from a variable) the scanner gives up
+and the caller should assume the stylesheet could depend on anything.
+"""
+from __future__ import unicode_literals
+
+import errno
+import os
+import re
+import time
+
+from .stat_index import StatIndex
+
+
+class ImportScanner(object):
+
+    COMMENT_RE = re.compile(r'/\*.*?\*/|(?:^|(?<=[\s;{}]))//[^\n]*', re.DOTALL)
+    IMPORT_RE = re.compile(r'@(import|use|forward)\s+(?:\([^)]*\)\s*)?([^;\n]+)')
+    # Matches the file name at the start of each comma separated argument,
+    # ignoring anything after it such as media queries or namespaces
+    ARGUMENT_RE = re.compile(r'''\s*(?:url\(\s*)?(?:"([^"]*)"|'([^']*)'|([^\s,;"')]+))[^,]*,?''')
+    # Marks of interpolation in LESS and Sass respectively
+    INTERPOLATION_RE = re.compile(r'@\{|#\{')
+
+    class UnknownImport(Exception):
+        pass
+
+    def __init__(self, load_paths, extensions, partials=False):
+        """
+        `extensions` are tried, in order, when an import doesn't include one.
+        If `partials` is set, imports are also resolved to partials (files
+        with a leading underscore) and directory index files, as Sass does.
+        """
+        self.load_paths = list(load_paths)
+        self.extensions = tuple(extensions)
+        self.partials = partials
+        # Maps path -> (mtime, size, imports) so unchanged files shared
+        # between stylesheets are only parsed once
+        self.parsed = {}
+
+    def scan(self, path, contents=None):
+        """
+        Returns a dict mapping `path` and every file it transitively imports
+        to the set of files it directly imports, or None if some import
+        can't be followed. If supplied, `contents` is used in place of
+        reading `path`.
+        """
+        edges = {}
+        to_visit = [(path, contents)]
+        try:
+            while to_visit:
+                current, current_contents = to_visit.pop()
+                if current in edges:
+                    continue
+                edges[current] = set()
+                for name in self.get_imports(current, current_contents):
+                    imported = self.resolve(name, current)
+                    edges[current].add(imported)
+                    to_visit.append((imported, None))
+        except self.UnknownImport:
+            return None
+        return edges
+
+    def get_imports(self, path, contents=None):
+        if contents is not None:
+            return self.parse(contents.decode('utf-8'))
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                raise self.UnknownImport(path)
+            raise
+        cached = self.parsed.get(path)
+        if cached and cached[:2] == (stat.st_mtime, stat.st_size):
+            return cached[2]
+        with open(path, 'rb') as f:
+            imports = self.parse(f.read().decode('utf-8'))
+        # A file modified very recently could change again without its mtime
+        # changing, so it can't be cached yet
+        if time.time() - stat.st_mtime < StatIndex.RACY_INTERVAL:
+            self.parsed.pop(path, None)
+        else:
+            self.parsed[path] = (stat.st_mtime, stat.st_size, imports)
+        return imports
+
+    def parse(self, source):
+        imports = []
+        source = self.COMMENT_RE.sub('', source)
+        for match in self.IMPORT_RE.finditer(source):
+            directive, arguments = match.groups()
+            if self.INTERPOLATION_RE.search(arguments):
+                raise self.UnknownImport(arguments)
+            names = [argument.group(1) or argument.group(2) or argument.group(3)
+                     for argument in self.ARGUMENT_RE.finditer(arguments)]
+            # @use and @forward only take a single file
+            if directive != 'import':
+                names = names[:1]
+            imports.extend(name for name in names if not self.is_external(name))
+        return imports
+
+    def is_external(self, name):
+        # Plain CSS imports are left as @import rules in the output rather
+        # than being compiled in, and Sass's built-in modules aren't files
+        return name.endswith('.css') or '://' in name or name.startswith('//') \
+            or name.startswith('sass:')
+
+    def resolve(self, name, importing_path):
+        """
+        Returns the path of the file `name` refers to when imported from
+        `importing_path`, trying the importing file's directory first
+        """
+        directories = [os.path.dirname(importing_path)] + self.load_paths
+        for directory in directories:
+            for candidate in self.get_candidates(os.path.join(directory, name)):
+                if os.path.isfile(candidate):
+                    return os.path.normpath(candidate)
+        raise self.UnknownImport(name)
+
+    def get_candidates(self, path):
+        directory, basename = os.path.split(path)
+        if os.path.splitext(basename)[1] in self.extensions:
+            names = [basename]
+        else:
+            names = [basename + extension for extension in self.extensions]
+            # Sass allows directories with an index file to be imported
+            if self.partials:
+                names += [os.path.join(basename, 'index' + extension)
+                          for extension in self.extensions]
+        candidates = []
+        for name in names:
+            candidates.append(os.path.join(directory, name))
+            # Sass partials can be imported without their leading underscore
+            head, tail = os.path.split(name)
+            if self.partials and not tail.startswith('_'):
+                candidates.append(os.path.join(directory, head, '_' + tail))
+        return candidates
@@ -0,0 +1,63 @@
+"""
+A thread-safe in-memory cache which evicts the least recently used items
+once the total size of its contents exceeds a limit.
+"""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+
+    def __init__(self, max_size):
+        """
+        `max_size` is in whatever units the sizes passed to `set` are in
+        (usually bytes)
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value, size = self.items.pop(key)
+            except KeyError:
+                return default
+            # Re-insert to mark as most recently used
+            self.items[key] = (value, size)
+            return value
+
+    def set(self, key, value, size):
+        with self.lock:
+            if key in self.items:
+                self.size -= self.items.pop(key)[1]
+            # Don't flush the entire cache for something that won't fit
+            if size > self.max_size:
+                return
+            self.items[key] = (value, size)
+            self.size += size
+            self.evict()
+
+    def resize(self, max_size):
+        with self.lock:
+            self.max_size = max_size
+            self.evict()
+
+    def evict(self):
+        # Callers must hold the lock
+        while self.size > self.max_size:
+            self.size -= self.items.popitem(last=False)[1][1]
+
+    def delete(self, key):
+        with self.lock:
+            if key in self.items:
+                self.size -= self.items.pop(key)[1]
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self.items)
@@ -0,0 +1,337 @@
+"""
+An in-memory index of the modification times of all files with a given
+extension under a set of directories, which can be cheaply kept up to date.
+
+On Linux we use inotify so that refreshing the index only costs as much as
+the number of files which have actually changed. Elsewhere (or if we run out
+of inotify watches) we fall back to polling: directories are only re-listed
+when their own mtime changes, so we stat each directory and each matching
+file but don't have to list the contents of the entire tree every time.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+def _load_libc():
+    libc_name = ctypes.util.find_library('c')
+    # find_library returns None on Windows, which CDLL won't accept
+    if not libc_name or not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+_libc = _load_libc()
+
+
+def inotify_available():
+    return _libc is not None
+
+
+def _encode(path):
+    if isinstance(path, bytes):
+        return path
+    return path.encode(sys.getfilesystemencoding())
+
+
+class Inotify(object):
+    """
+    Minimal ctypes wrapper around the Linux inotify API
+    """
+
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+            IN_MOVED_TO | IN_CREATE | IN_DELETE)
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self):
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            self.raise_error()
+        self.watches = {}
+
+    def add_watch(self, path):
+        wd = _libc.inotify_add_watch(self.fd, _encode(path), self.MASK)
+        if wd < 0:
+            self.raise_error(path)
+        self.watches[wd] = path
+
+    def wait(self, timeout=None):
+        """
+        Blocks until there are events to read, or until `timeout` seconds
+        have passed, and returns whether there are any
+        """
+        return bool(select.select([self.fd], [], [], timeout)[0])
+
+    def read_events(self):
+        """
+        Returns a list of (path, mask) pairs for all events since the last
+        call, or None if events have been lost and a full rescan is needed
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    break
+                raise
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+                offset += self.EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                directory = self.watches.get(wd)
+                if directory is None:
+                    continue
+                if not isinstance(directory, bytes):
+                    name = name.decode(sys.getfilesystemencoding())
+                path = os.path.join(directory, name) if name else directory
+                events.append((path, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+    def raise_error(self, path=None):
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), path)
+
+
+class StatIndex(object):
+
+    # Seconds
+    RACY_INTERVAL = 2
+
+    def __init__(self, directories, extension, use_inotify=True, track_mtimes=True,
+                 poll_interval=0):
+        """
+        `extension` can be a string or tuple of strings. If we only care
+        which files exist, and not when they were modified, `track_mtimes`
+        can be set to False to avoid re-stat'ing files when polling.
+
+        Polling stats every directory, so when we're not using inotify the
+        index is refreshed at most once every `poll_interval` seconds.
+        """
+        self.directories = list(directories)
+        self.extension = extension
+        self.use_inotify = use_inotify and inotify_available()
+        self.track_mtimes = track_mtimes
+        self.poll_interval = poll_interval
+        self.last_polled = None
+        self.lock = threading.Lock()
+        self.watcher = None
+        self.pid = None
+        # Incremented whenever a file or directory is added to or removed
+        # from the index
+        self.generation = 0
+        self.paths = None
+        self.dir_paths = None
+
+    def get_files(self):
+        """
+        Returns a dict mapping the path of every matching file to its mtime
+        """
+        with self.lock:
+            self.refresh()
+            return dict(self.files)
+
+    def get_latest_mtime(self):
+        """
+        Returns the most recent mtime of any matching file, or None if there
+        aren't any
+        """
+        with self.lock:
+            self.refresh()
+            return max(self.files.values()) if self.files else None
+
+    def get_generation(self):
+        """
+        Returns a number which changes whenever a file or directory is added
+        to or removed from the index
+        """
+        with self.lock:
+            self.refresh()
+            return self.generation
+
+    def get_paths(self):
+        """
+        Returns a frozenset of the paths of every matching file. This is
+        cheap to call repeatedly if no files have been added or removed.
+        """
+        with self.lock:
+            self.refresh()
+            if self.paths is None or self.paths[0] != self.generation:
+                self.paths = (self.generation, frozenset(self.files))
+            return self.paths[1]
+
+    def get_dirs(self):
+        """
+        Returns a frozenset of every directory listed in the index. Symlinks
+        to directories aren't followed, so they're listed as files instead.
+        """
+        with self.lock:
+            self.refresh()
+            if self.dir_paths is None or self.dir_paths[0] != self.generation:
+                self.dir_paths = (self.generation, frozenset(self.dirs))
+            return self.dir_paths[1]
+
+    def refresh(self):
+        # Watches and indexes don't survive a fork intact, so child
+        # processes start again from scratch
+        if self.pid != os.getpid():
+            self.rebuild()
+        elif self.watcher is not None:
+            self.refresh_from_events()
+        elif time.time() - self.last_polled >= self.poll_interval:
+            self.refresh_by_polling()
+
+    def rebuild(self):
+        self.pid = os.getpid()
+        # Maps each directory to (mtime, set of names it contains)
+        self.dirs = {}
+        # Maps each matching file to its mtime
+        self.files = {}
+        self.generation += 1
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+        if self.use_inotify:
+            self.watcher = Inotify()
+        for directory in self.directories:
+            self.scan_dir(directory)
+        self.last_polled = time.time()
+
+    def refresh_from_events(self):
+        events = self.watcher.read_events()
+        if events is None:
+            self.rebuild()
+            return
+        for path, mask in events:
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.scan_dir(path)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self.remove_dir(path)
+            elif path.endswith(self.extension):
+                self.update_file(path)
+
+    def refresh_by_polling(self):
+        for directory in list(self.dirs):
+            if directory not in self.dirs:
+                # Removed while rescanning its parent
+                continue
+            try:
+                mtime = os.stat(directory).st_mtime
+            except OSError as e:
+                if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                    raise
+                self.remove_dir(directory)
+                continue
+            if mtime != self.dirs[directory][0]:
+                self.scan_dir(directory)
+        if self.track_mtimes:
+            for path in list(self.files):
+                self.update_file(path)
+        self.last_polled = time.time()
+
+    def scan_dir(self, directory):
+        """
+        List `directory` and update the index with anything that has been
+        added or removed since we last listed it
+        """
+        try:
+            mtime = os.stat(directory).st_mtime
+            names = set(os.listdir(directory))
+        except OSError as e:
+            if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                raise
+            self.remove_dir(directory)
+            return
+        if self.watcher is not None and directory not in self.dirs:
+            try:
+                self.watcher.add_watch(directory)
+            except OSError as e:
+                if e.errno != errno.ENOSPC:
+                    raise
+                # We've run out of inotify watches, so fall back to polling
+                # which will pick up anything we miss from here on
+                self.watcher.close()
+                self.watcher = None
+        # If the directory was modified very recently then further changes
+        # within the resolution of the filesystem's timestamps might not
+        # change its mtime, so make sure it gets listed again next time
+        if time.time() - mtime < self.RACY_INTERVAL:
+            mtime = None
+        if directory not in self.dirs:
+            self.generation += 1
+        old_names = self.dirs.get(directory, (None, set()))[1]
+        self.dirs[directory] = (mtime, names)
+        for name in old_names - names:
+            path = os.path.join(directory, name)
+            self.remove_dir(path)
+            self.remove_file(path)
+        for name in names - old_names:
+            path = os.path.join(directory, name)
+            # Don't follow symlinks, to match os.walk
+            if os.path.isdir(path) and not os.path.islink(path):
+                self.scan_dir(path)
+            elif name.endswith(self.extension):
+                self.update_file(path)
+
+    def remove_dir(self, directory):
+        prefix = os.path.join(directory, '')
+        for path in list(self.dirs):
+            if path == directory or path.startswith(prefix):
+                del self.dirs[path]
+                self.generation += 1
+        for path in list(self.files):
+            if path.startswith(prefix):
+                self.remove_file(path)
+
+    def update_file(self, path):
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError as e:
+            if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                raise
+            self.remove_file(path)
+            return
+        if path not in self.files:
+            self.generation += 1
+        self.files[path] = mtime
+
+    def remove_file(self, path):
+        if path in self.files:
+            del self.files[path]
+            self.generation += 1
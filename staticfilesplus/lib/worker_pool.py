@@ -0,0 +1,223 @@
+"""
+A pool of long-running compiler processes, to avoid paying interpreter
+start-up costs (often hundreds of milliseconds for Node or Ruby) on every
+file we process.
+
+Workers read requests from stdin and write responses to stdout. Each message
+is framed as its length in bytes, written as ASCII digits, followed by a
+newline and then the message itself, which is a UTF-8 encoded JSON object.
+
+Requests look like:
+
+    {"args": ["--compress", "/path/to/in.less"], "input": "..."}
+
+where `args` are the command line arguments the tool would have been given
+and `input` (which may be null) is what would have been written to its stdin.
+
+Responses look like:
+
+    {"status": 0, "stdout": "...", "stderr": "..."}
+
+where `status` is the exit status the tool would have returned.
+
+Workers must also respond to a health check request of `{"ping": true}` with
+a response with `status` 0.
+
+Waiting on the pipes with a timeout relies on select(), which only works for
+sockets on Windows, so workers aren't supported there (see `is_supported`).
+"""
+import errno
+import json
+import os
+import select
+import subprocess
+import sys
+import threading
+
+
+class WorkerError(Exception):
+    pass
+
+
+class WorkerTimeout(WorkerError):
+    pass
+
+
+def is_supported():
+    return sys.platform != 'win32'
+
+
+class Worker(object):
+
+    def __init__(self, command, timeout=10, job_timeout=None):
+        """
+        `timeout` is how long to wait for a response to a health check and
+        `job_timeout` (if not None) how long to wait for a job to finish
+        """
+        self.command = command
+        self.timeout = timeout
+        self.job_timeout = job_timeout
+        self.proc = subprocess.Popen(command, bufsize=0,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        if not self.ping():
+            self.close()
+            raise WorkerError("Worker '{}' failed health check".format(
+                ' '.join(command)))
+
+    def is_alive(self):
+        return self.proc.poll() is None
+
+    def ping(self):
+        try:
+            response = self.request({'ping': True}, timeout=self.timeout)
+        except WorkerError:
+            return False
+        return response.get('status') == 0
+
+    def run(self, args, input=None):
+        """
+        Returns a (status, stdout, stderr) tuple
+        """
+        if input is not None:
+            input = input.decode('utf-8')
+        response = self.request({'args': list(args), 'input': input},
+                timeout=self.job_timeout)
+        return (response['status'],
+                (response.get('stdout') or '').encode('utf-8'),
+                (response.get('stderr') or '').encode('utf-8'))
+
+    def request(self, message, timeout=None):
+        payload = json.dumps(message).encode('utf-8')
+        try:
+            self.proc.stdin.write(str(len(payload)).encode('ascii') + b'\n' + payload)
+            self.proc.stdin.flush()
+            length = self.read_line(timeout)
+            payload = self.read_exactly(int(length), timeout)
+        except WorkerTimeout:
+            # We can't tell what state it's in now, so it can't be reused
+            self.kill()
+            raise
+        except (IOError, OSError) as e:
+            if e.errno not in (errno.EPIPE, errno.EINVAL):
+                raise
+            raise WorkerError('Worker has exited')
+        except ValueError:
+            raise WorkerError('Invalid message length from worker')
+        try:
+            return json.loads(payload.decode('utf-8'))
+        except ValueError:
+            raise WorkerError('Invalid response from worker')
+
+    def read_line(self, timeout):
+        line = b''
+        while not line.endswith(b'\n'):
+            line += self.read_exactly(1, timeout)
+        return line
+
+    def read_exactly(self, size, timeout):
+        data = b''
+        fd = self.proc.stdout.fileno()
+        while len(data) < size:
+            if timeout is not None:
+                if not select.select([fd], [], [], timeout)[0]:
+                    raise WorkerTimeout('Timed out waiting for worker')
+            chunk = os.read(fd, size - len(data))
+            if not chunk:
+                raise WorkerError('Worker has exited')
+            data += chunk
+        return data
+
+    def close(self):
+        self.proc.stdin.close()
+        try:
+            self.proc.wait()
+        except OSError:
+            pass
+        self.proc.stdout.close()
+
+    def kill(self):
+        if self.is_alive():
+            try:
+                self.proc.kill()
+            except OSError:
+                pass
+        self.close()
+
+
+class WorkerPool(object):
+    """
+    Starts up to `size` copies of `command` on demand and hands out jobs to
+    whichever ones are idle. Idle workers are health checked before they're
+    reused. Workers which die are replaced, and the job they were running is
+    retried once. Workers which take longer than `job_timeout` seconds are
+    killed, and replaced when next needed, but the job isn't retried.
+    """
+
+    def __init__(self, command, size=1, timeout=10, job_timeout=None):
+        self.command = list(command)
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.job_timeout = job_timeout
+        self.idle = []
+        self.started = 0
+        self.condition = threading.Condition()
+
+    def run(self, args, input=None):
+        worker = self.checkout()
+        try:
+            try:
+                result = worker.run(args, input)
+            except WorkerTimeout:
+                raise
+            except WorkerError:
+                # Restart the worker and try again, which will raise
+                # the error if it happens a second time
+                worker.close()
+                worker = self.start_worker()
+                result = worker.run(args, input)
+        except:
+            worker.close()
+            self.discard()
+            raise
+        self.checkin(worker)
+        return result
+
+    def start_worker(self):
+        return Worker(self.command, timeout=self.timeout, job_timeout=self.job_timeout)
+
+    def checkout(self):
+        while True:
+            with self.condition:
+                while not self.idle and self.started >= self.size:
+                    self.condition.wait()
+                if not self.idle:
+                    self.started += 1
+                    break
+                worker = self.idle.pop()
+            # Check outside the lock so other threads aren't held up
+            if worker.is_alive() and worker.ping():
+                return worker
+            worker.kill()
+            self.discard()
+        try:
+            return self.start_worker()
+        except:
+            self.discard()
+            raise
+
+    def checkin(self, worker):
+        with self.condition:
+            self.idle.append(worker)
+            self.condition.notify()
+
+    def discard(self):
+        with self.condition:
+            self.started -= 1
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            for worker in self.idle:
+                worker.close()
+            self.started -= len(self.idle)
+            self.idle = []
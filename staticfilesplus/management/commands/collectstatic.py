@@ -0,0 +1,42 @@
+from __future__ import absolute_import
+
+from optparse import make_option
+
+from django.conf import settings
+from django.contrib.staticfiles.management.commands import collectstatic
+
+from ...stats import StatsCollector
+
+
+class Command(collectstatic.Command):
+    """
+    Extends the standard collectstatic command with an optional summary of
+    where the time went
+    """
+    option_list = collectstatic.Command.option_list + (
+        make_option('--stats',
+            action='store_true', dest='stats', default=False,
+            help="Print a summary of the time spent in each processor."),
+        make_option('--stats-top',
+            type='int', dest='stats_top', default=10,
+            help="Number of slowest files to list in the summary."),
+        make_option('--stats-json',
+            dest='stats_json', metavar='PATH',
+            help="Write the timings for every processed file to PATH as JSON."),
+    )
+
+    def handle_noargs(self, **options):
+        show_stats = options.get('stats') or \
+                getattr(settings, 'STATICFILESPLUS_STATS', False)
+        stats_json = options.get('stats_json')
+        if not show_stats and not stats_json:
+            return super(Command, self).handle_noargs(**options)
+        with StatsCollector() as collector:
+            summary = super(Command, self).handle_noargs(**options)
+        if stats_json:
+            with open(stats_json, 'w') as f:
+                collector.dump_json(f)
+        if show_stats:
+            summary = (summary or '') + '\n' + \
+                    collector.format_summary(options.get('stats_top', 10))
+        return summary
@@ -0,0 +1,103 @@
+from __future__ import absolute_import, division
+
+import os
+from optparse import make_option
+
+from django.contrib.staticfiles import finders
+from django.core.management.base import NoArgsCommand
+
+from ...finders import ProcessorMixin
+from ...processors.js import (JavaScriptProcessor, DjangoDirectiveProcessor,
+        load_chunk_plan, save_chunk_plan, delete_chunk_plan, find_shared_modules)
+from ...processors.pipeline import Pipeline
+
+
+class Command(NoArgsCommand):
+    """
+    Finds the files which many JavaScript bundles require and moves them into
+    a single shared chunk, so that visitors only download them once
+    """
+    help = "Moves files required by several JavaScript bundles into a shared chunk."
+    option_list = NoArgsCommand.option_list + (
+        make_option('--name',
+            dest='name', default='common.js',
+            help="Name of the shared chunk (default: common.js)."),
+        make_option('--min-bundles',
+            type='int', dest='min_bundles', default=2,
+            help="Share files required by at least this many bundles (default: 2)."),
+        make_option('--dry-run',
+            action='store_true', dest='dry_run', default=False,
+            help="Report the savings without changing anything."),
+        make_option('--clear',
+            action='store_true', dest='clear', default=False,
+            help="Remove the shared chunk, putting everything back in its bundles."),
+    )
+
+    # The same defaults as collectstatic
+    IGNORE_PATTERNS = ['CVS', '.*', '*~']
+
+    def handle_noargs(self, **options):
+        if options.get('clear'):
+            delete_chunk_plan()
+            self.stdout.write("Removed shared chunk")
+            return
+        name = options.get('name', 'common.js')
+        directive_processor = DjangoDirectiveProcessor()
+        bundles = {}
+        for path in self.get_bundle_paths():
+            directive_processor.load(path)
+            bundles[path] = list(directive_processor.included)
+        modules = find_shared_modules(bundles, options.get('min_bundles', 2))
+        shared = set(modules)
+        sizes = []
+        for path in sorted(bundles):
+            if not shared.intersection(bundles[path]):
+                continue
+            before = get_size(directive_processor.load(path))
+            after = get_size(directive_processor.load(path, files_seen=set(shared)))
+            sizes.append((path, before, after))
+        if not sizes:
+            self.stdout.write("No files are shared by {} or more bundles".format(
+                options.get('min_bundles', 2)))
+            return
+        chunk_size = get_size(directive_processor.load(
+            os.path.join(os.getcwd(), name), contents=b'', requires=modules))
+        self.report(name, modules, chunk_size, sizes)
+        if not options.get('dry_run'):
+            save_chunk_plan(name, modules, [path for path, _, _ in sizes])
+            self.stdout.write("Include {} before any of the bundles above".format(name))
+
+    def get_bundle_paths(self):
+        plan = load_chunk_plan()
+        paths = set()
+        for finder in finders.get_finders():
+            if not isinstance(finder, ProcessorMixin):
+                continue
+            for name, storage, processor, processed_name in \
+                    finder.list_matches(self.IGNORE_PATTERNS):
+                if isinstance(processor, Pipeline):
+                    processor = processor.stages[0]
+                if not isinstance(processor, JavaScriptProcessor):
+                    continue
+                path = storage.path(name)
+                # Don't count the existing chunk as a bundle
+                if plan is not None and \
+                        path == os.path.join(plan['directory'], plan['name']):
+                    continue
+                paths.add(path)
+        return paths
+
+    def report(self, name, modules, chunk_size, sizes):
+        self.stdout.write("{}: {} files, {} bytes".format(name, len(modules), chunk_size))
+        for path, before, after in sizes:
+            self.stdout.write("  {}: {} -> {} bytes".format(path, before, after))
+        before = sum(before for _, before, _ in sizes)
+        after = sum(after for _, _, after in sizes) + chunk_size
+        self.stdout.write(
+            "Loading every bundle: {} -> {} bytes before compression, "
+            "saving {} bytes ({:.0%})".format(before, after, before - after,
+                                              (before - after) / before if before else 0))
+
+
+def get_size(contents):
+    return len(contents.encode('utf-8'))
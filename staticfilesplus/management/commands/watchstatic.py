@@ -0,0 +1,183 @@
+from __future__ import absolute_import
+
+import errno
+import os
+from optparse import make_option
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import watch
+from ...finders import ProcessorMixin, run_processor
+from ...lib.file_watcher import get_watcher
+from ...utils import get_staticfiles_dirs, get_tmp_dir
+
+
+class Command(BaseCommand):
+    """
+    Watches the static files directories and rebuilds processed files as
+    soon as their sources change, so that in development pages don't have
+    to wait for them to be processed when they're requested
+    """
+    help = "Rebuilds processed static files whenever their sources change."
+    option_list = BaseCommand.option_list + (
+        make_option('--poll',
+            action='store_true', dest='poll', default=False,
+            help="Poll for changes rather than using inotify."),
+        make_option('--interval',
+            type='float', dest='interval', default=1.0,
+            help="Seconds between checks for changes when polling."),
+        make_option('--debounce',
+            type='float', dest='debounce', default=0.2,
+            help="Seconds to wait for further changes before rebuilding."),
+        make_option('--workers',
+            type='int', dest='workers', default=None,
+            help="Number of files to rebuild at once."),
+    )
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'STATICFILESPLUS_BUILD_CACHE', True):
+            raise CommandError("watchstatic needs STATICFILESPLUS_BUILD_CACHE "
+                               "to know which files need rebuilding")
+        workers = options.get('workers') or \
+                max(2, getattr(settings, 'STATICFILESPLUS_WORKERS', 1))
+        rebuilder = Rebuilder(workers)
+        watcher = get_watcher(get_staticfiles_dirs(), polling=options.get('poll'),
+                interval=options.get('interval', 1.0))
+        self.stdout.write("Watching for changes with {}".format(
+            watcher.__class__.__name__))
+        try:
+            watch.write_state(busy=True)
+            self.report(rebuilder.rebuild())
+            watch.write_state(busy=False)
+            while True:
+                changed = watcher.wait()
+                if not changed:
+                    continue
+                # Hold off requests until we've caught up
+                watch.write_state(busy=True)
+                # Editors often write several files, or the same file
+                # several times, in quick succession
+                while True:
+                    more = watcher.wait(timeout=options.get('debounce', 0.2))
+                    if not more:
+                        break
+                    changed |= more
+                self.report(rebuilder.rebuild(changed))
+                watch.write_state(busy=False)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watch.clear_state()
+            watcher.close()
+            rebuilder.close()
+
+    def report(self, results):
+        built, errors = results
+        for path in built:
+            self.stdout.write("Built {}".format(path))
+        for path, error in errors:
+            self.stderr.write("Error processing {}:\n{}".format(path, error))
+
+
+class Rebuilder(object):
+    """
+    Works out which processed files are affected by a set of changes, using
+    the dependencies recorded in the build cache, and rebuilds them using a
+    pool of workers
+    """
+
+    # The same defaults as collectstatic
+    IGNORE_PATTERNS = ['CVS', '.*', '*~']
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.finders = [finder for finder in finders.get_finders()
+                        if isinstance(finder, ProcessorMixin)]
+        self.pools = {}
+        self.known_outputs = set()
+        self.tmp_dir = get_tmp_dir()
+
+    def get_jobs(self):
+        """
+        Returns a dict mapping the output path of every processed file to a
+        (finder, processor, input_path, output_path) tuple
+        """
+        jobs = {}
+        for finder in self.finders:
+            for name, storage, processor, processed_name in \
+                    finder.list_matches(self.IGNORE_PATTERNS):
+                if processor is None:
+                    continue
+                output_path = finder.tmp_storage.path(processed_name)
+                # Earlier finders take precedence, as with find()
+                if output_path not in jobs:
+                    jobs[output_path] = (finder, processor, storage.path(name),
+                                         processed_name)
+        return jobs
+
+    def rebuild(self, changed=None):
+        """
+        Rebuilds everything affected by the `changed` paths, or everything
+        which isn't fresh if `changed` is None. Returns a list of the input
+        paths rebuilt and a list of (input_path, error) pairs.
+        """
+        jobs = self.get_jobs()
+        if changed is not None:
+            changed = set(path for path in changed
+                          if not path.startswith(self.tmp_dir + os.sep))
+            if not changed:
+                return [], []
+            jobs = dict((output_path, job) for output_path, job in jobs.items()
+                        if self.is_affected(job[0], job[2], output_path, changed))
+        self.known_outputs.update(jobs)
+        results = []
+        for output_path, (finder, processor, input_path, processed_name) in jobs.items():
+            finder.get_output_path(processed_name)
+            pool = self.get_pool(finder, processor.parallel_mode)
+            result = pool.apply_async(run_processor, (processor, input_path,
+                    output_path, finder.build_cache, finder.shared_cache))
+            results.append((finder, processor, input_path, output_path, result))
+        built, errors = [], []
+        for finder, processor, input_path, output_path, result in results:
+            try:
+                stats = result.get()
+            except Exception as e:
+                errors.append((input_path, e))
+                # Leave the finder to process the file, and report the
+                # error, when it's next requested
+                remove_file(output_path)
+                finder.build_cache.delete_entry(output_path)
+                continue
+            finder.send_file_processed(processor, input_path, output_path, stats)
+            if not stats['cache_hit']:
+                built.append(input_path)
+        return built, errors
+
+    def is_affected(self, finder, input_path, output_path, changed):
+        if input_path in changed or output_path not in self.known_outputs:
+            return True
+        entry = finder.build_cache.read_entry(output_path)
+        # If we don't know what the file depends on it could be anything
+        if entry is None:
+            return True
+        return any(path in changed for path, digest in entry['files'])
+
+    def get_pool(self, finder, mode):
+        if mode not in self.pools:
+            self.pools[mode] = finder.get_pool(mode, self.workers)
+        return self.pools[mode]
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.terminate()
+            pool.join()
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
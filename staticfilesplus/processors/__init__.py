@@ -1,5 +1,5 @@
 from __future__ import absolute_import
 
-from .base import BaseProcessor
+from .base import BaseProcessor, processes_content
 
-__all__ = [BaseProcessor]
+__all__ = [BaseProcessor, processes_content]
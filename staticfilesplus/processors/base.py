@@ -1,6 +1,14 @@
 class BaseProcessor(object):
     original_suffix = None
     processed_suffix = None
+    # Whether to use 'threads' or 'processes' when processing files in
+    # parallel. Processors which spend their time waiting on subprocesses
+    # should use threads; those doing heavy lifting in Python should use
+    # processes.
+    parallel_mode = 'threads'
+    # Names of any settings which affect the output of this processor, used
+    # to tell when cached output is out of date
+    settings_names = ()
 
     def get_original_name(self, name):
         if name.endswith(self.processed_suffix):
@@ -14,4 +22,86 @@ class BaseProcessor(object):
         return False
 
     def process_file(self, input_path, output_path):
+        # Processors which work in memory get file handling for free
+        if not overrides(self, 'process_content'):
+            raise NotImplementedError()
+        with open(input_path, 'rb') as f:
+            content = f.read()
+        content = self.process_content(content, input_path)
+        with open(output_path, 'wb') as f:
+            f.write(content)
+
+    def process_content(self, content, input_path):
+        """
+        Optional in-memory alternative to `process_file`: takes the contents
+        of `input_path` as bytes and returns the processed contents as bytes.
+        The path is supplied so that relative references can be resolved,
+        but the file itself shouldn't be read.
+        """
+        raise NotImplementedError()
+
+    def process_files(self, jobs):
+        """
+        Optional batch version of `process_file`: takes a list of
+        (input_path, output_path) pairs and processes them all, e.g. with a
+        single invocation of a compiler. When this is implemented
+        `collectstatic` uses it in place of `process_file`.
+        """
         raise NotImplementedError()
+
+    def get_dependencies(self, input_path):
+        """
+        Returns a list of the files, other than `input_path`, which were
+        used in producing the output from the last call to `process_file`.
+        Returns None if this isn't known, in which case the output will
+        never be cached.
+        """
+        return None
+
+    def get_extra_sources(self):
+        """
+        Returns a list of (directory, name) pairs for source files which this
+        processor has generated outside the static directories, but which the
+        finders should treat as though they were inside them
+        """
+        return []
+
+
+def overrides(processor, method_name):
+    """
+    Whether the processor's class overrides the BaseProcessor implementation
+    of `method_name`
+    """
+    if not isinstance(processor, BaseProcessor):
+        return True
+    method = getattr(type(processor), method_name)
+    base_method = getattr(BaseProcessor, method_name)
+    # Unwrap Python 2 unbound methods
+    return getattr(method, '__func__', method) is not \
+        getattr(base_method, '__func__', base_method)
+
+
+def processes_content(processor):
+    """
+    Whether the processor can work in memory using `process_content`
+    """
+    return hasattr(processor, 'process_content') and \
+        overrides(processor, 'process_content')
+
+
+def processes_batches(processor):
+    """
+    Whether the processor can handle many files at once using `process_files`
+    """
+    return hasattr(processor, 'process_files') and \
+        overrides(processor, 'process_files')
+
+
+def get_extra_sources(processor):
+    """
+    Returns the processor's extra sources, allowing for processors which
+    don't inherit from BaseProcessor
+    """
+    if not hasattr(processor, 'get_extra_sources'):
+        return []
+    return processor.get_extra_sources()
@@ -0,0 +1,92 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+import threading
+
+from ..lib.dependency_graph import DependencyGraph
+from ..lib.import_scanner import ImportScanner
+from ..utils import get_staticfiles_dirs, get_tmp_dir, get_stat_index, paths_modified_since
+
+
+class ImportTrackingMixin(object):
+    """
+    For processors of stylesheet languages: records the files each stylesheet
+    imports in a persistent graph so that stylesheets are only rebuilt when
+    something they actually import changes
+    """
+    # Extensions to try, in order, for imports which don't specify one
+    import_extensions = ()
+    # Whether imports can refer to partials and directory index files
+    import_partials = False
+    # Directory within STATICFILESPLUS_TMP_DIR in which to keep the graph
+    import_graph_dir = None
+
+    import_graph = None
+    import_scanner = None
+
+    def __init__(self, *args, **kwargs):
+        super(ImportTrackingMixin, self).__init__(*args, **kwargs)
+        # Processors are shared between threads when processing in parallel
+        self.import_lock = threading.Lock()
+
+    def __getstate__(self):
+        # These get recreated as needed in worker processes
+        state = self.__dict__.copy()
+        for name in ('import_graph', 'import_scanner'):
+            state.pop(name, None)
+        # Locks can't be pickled. Leaving a placeholder also keeps the state
+        # from being empty, which would mean __setstate__ isn't called.
+        state['import_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.import_lock = threading.Lock()
+
+    def get_import_graph(self):
+        with self.import_lock:
+            if self.import_graph is None:
+                self.import_scanner = ImportScanner(get_staticfiles_dirs(),
+                        self.import_extensions, partials=self.import_partials)
+                self.import_graph = DependencyGraph(
+                        os.path.join(get_tmp_dir(), self.import_graph_dir)).load()
+            return self.import_graph
+
+    def record_imports(self, input_path, contents=None):
+        """
+        Scans `input_path` (or `contents`, if supplied) for imports and
+        records them in the graph
+        """
+        graph = self.get_import_graph()
+        with self.import_lock:
+            edges = self.import_scanner.scan(input_path, contents)
+            if edges is None:
+                graph.remove_bundle(input_path)
+            else:
+                graph.set_bundle(input_path, edges)
+
+    def get_recorded_imports(self, input_path):
+        """
+        Returns every file `input_path` imported when it was last processed,
+        or None if we don't know
+        """
+        graph = self.get_import_graph()
+        with self.import_lock:
+            if input_path not in graph.get_bundles():
+                return None
+            return graph.get_dependencies(input_path)
+
+    def is_up_to_date(self, input_path, output_path):
+        imports = self.get_recorded_imports(input_path)
+        if imports is None:
+            return False
+        return not paths_modified_since(output_path, [input_path] + list(imports))
+
+    def get_dependencies(self, input_path):
+        imports = self.get_recorded_imports(input_path)
+        if imports is None:
+            # We don't know exactly which files were imported so assume
+            # that it could have been any of them
+            return list(get_stat_index(get_staticfiles_dirs(),
+                    self.import_extensions).get_files())
+        return list(imports)
@@ -1,13 +1,202 @@
 from __future__ import absolute_import, unicode_literals
 
+import codecs
+import errno
+import hashlib
+import json
 import os
 
 from django.conf import settings
+from django.dispatch import receiver
 from django.template.loader import get_template_from_string, Context
+from django.test.signals import setting_changed
 
 from . import BaseProcessor
+from ..lib.dependency_graph import DependencyGraph
 from ..lib.directive_processor import DirectiveProcessor
-from ..utils import get_staticfiles_dirs, call_command
+from ..lib.lru_cache import LRUCache
+from ..signals import directive_file_loaded
+from ..utils import (get_staticfiles_dirs, call_command, get_tmp_dir, get_stat_index,
+        write_atomic)
+
+
+_parse_cache = None
+_template_cache = None
+# The last chunk plan read, along with the stat of the file it came from
+_chunk_plan = None
+# Incremented whenever settings change, to invalidate rendered templates
+_settings_version = 0
+
+
+def get_parse_cache():
+    """
+    Returns the cache of parsed JavaScript files, which is shared by every
+    directive processor in this process so it survives across bundles and
+    requests. Returns None if caching is disabled.
+    """
+    global _parse_cache
+    max_size = getattr(settings, 'STATICFILESPLUS_JS_CACHE_SIZE', 32 * 1024 * 1024)
+    if not max_size:
+        return None
+    if _parse_cache is None:
+        _parse_cache = LRUCache(max_size)
+    _parse_cache.resize(max_size)
+    return _parse_cache
+
+
+def get_template_cache():
+    """
+    Returns the cache of compiled `.djtmpl.js` templates and their rendered
+    output, or None if caching is disabled
+    """
+    global _template_cache
+    max_size = getattr(settings, 'STATICFILESPLUS_JS_TEMPLATE_CACHE_SIZE', 4 * 1024 * 1024)
+    if not max_size:
+        return None
+    if _template_cache is None:
+        _template_cache = LRUCache(max_size)
+    _template_cache.resize(max_size)
+    return _template_cache
+
+
+@receiver(setting_changed)
+def invalidate_template_output(**kwargs):
+    # Templates can read any setting, so their output is no longer valid.
+    # Old entries are left for the cache to evict.
+    global _settings_version
+    _settings_version += 1
+
+
+def render_template(source):
+    """
+    Renders the source of a `.djtmpl.js` file, compiling it only once and,
+    if STATICFILESPLUS_JS_CACHE_TEMPLATE_OUTPUT is set, reusing its output
+    while neither it nor the context has changed
+    """
+    context = dict(getattr(settings, 'STATICFILESPLUS_JS_CONTEXT', {}))
+    cache = get_template_cache()
+    if cache is None:
+        return get_template_from_string(source).render(get_template_context(context))
+    source_hash = hashlib.sha1(source.encode('utf-8')).hexdigest()
+    cache_output = getattr(settings, 'STATICFILESPLUS_JS_CACHE_TEMPLATE_OUTPUT', False)
+    if cache_output:
+        output_key = ('output', source_hash, get_context_fingerprint(context),
+                _settings_version)
+        output = cache.get(output_key)
+        if output is not None:
+            return output
+    template_key = ('template', source_hash)
+    template = cache.get(template_key)
+    if template is None:
+        template = get_template_from_string(source)
+        # Compiled templates are roughly proportional to their source
+        cache.set(template_key, template, size=len(source.encode('utf-8')))
+    output = template.render(get_template_context(context))
+    if cache_output:
+        cache.set(output_key, output, size=len(output.encode('utf-8')))
+    return output
+
+
+def get_template_context(context):
+    context.setdefault('settings', settings)
+    return Context(context)
+
+
+def get_context_fingerprint(context):
+    # Values without a useful repr fall back to one including their id, so
+    # at worst we miss the cache rather than serve stale output
+    items = sorted((key, repr(value)) for key, value in context.items())
+    return hashlib.sha1(repr(items).encode('utf-8')).hexdigest()
+
+
+def get_dependency_graph_dir():
+    return os.path.join(get_tmp_dir(), '.js_dependencies')
+
+
+def get_dependency_graph():
+    """
+    Returns the require graph of every JavaScript bundle built so far
+    """
+    return DependencyGraph(get_dependency_graph_dir()).load()
+
+
+def get_chunk_plan_path():
+    return os.path.join(get_tmp_dir(), '.js_chunks.json')
+
+
+def load_chunk_plan():
+    """
+    Returns the shared chunk plan written by the `jschunks` command, or None
+    if there isn't one. The plan is only read again when the file changes,
+    so this is cheap enough for the finders to call on every request.
+    """
+    global _chunk_plan
+    path = get_chunk_plan_path()
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise
+    # The plan is replaced by renaming, so a new plan means a new inode
+    key = (path, stat.st_ino, stat.st_mtime, stat.st_size)
+    if _chunk_plan is None or _chunk_plan[0] != key:
+        try:
+            with open(path, 'rb') as f:
+                plan = json.loads(f.read().decode('utf-8'))
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        _chunk_plan = (key, plan)
+    return _chunk_plan[1]
+
+
+def save_chunk_plan(name, modules, bundles):
+    """
+    Records that `modules` should be moved out of `bundles` into a shared
+    chunk called `name`, and writes a placeholder source for the chunk so
+    that the finders can find it
+    """
+    directory = os.path.join(get_tmp_dir(), '.js_chunks')
+    write_atomic(os.path.join(directory, name), b'')
+    plan = {'name': name, 'directory': directory, 'modules': modules,
+            'bundles': sorted(bundles)}
+    write_atomic(get_chunk_plan_path(),
+                 json.dumps(plan, indent=2, sort_keys=True).encode('utf-8'))
+    return plan
+
+
+def delete_chunk_plan():
+    try:
+        os.remove(get_chunk_plan_path())
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def find_shared_modules(bundles, min_bundles=2):
+    """
+    Takes a dict mapping each bundle to the list of files included in it,
+    in the order they appear, and returns the files included in at least
+    `min_bundles` bundles in an order which keeps each file after the files
+    it requires. Bundles themselves are never shared, as their own pages
+    would then load them twice.
+    """
+    counts = {}
+    for files in bundles.values():
+        for path in set(files):
+            counts[path] = counts.get(path, 0) + 1
+    shared = []
+    seen = set(bundles)
+    # Anything a shared file requires is in at least as many bundles, so
+    # will already have been added by the time the file is reached
+    for bundle in sorted(bundles):
+        for path in bundles[bundle]:
+            if path not in seen and counts[path] >= min_bundles:
+                seen.add(path)
+                shared.append(path)
+    return shared
 
 
 class DjangoDirectiveProcessor(DirectiveProcessor):
@@ -24,46 +213,162 @@ class DjangoDirectiveProcessor(DirectiveProcessor):
 
     def __init__(self):
         staticfiles_dirs = get_staticfiles_dirs()
-        super(DjangoDirectiveProcessor, self).__init__(load_paths=staticfiles_dirs)
+        super(DjangoDirectiveProcessor, self).__init__(load_paths=staticfiles_dirs,
+                cache=get_parse_cache(),
+                file_index=get_stat_index(staticfiles_dirs, '', track_mtimes=False))
+
+    def is_cacheable(self, path):
+        # Template output can change even when the template doesn't
+        return not path.endswith(self.DJANGO_TEMPLATE_SUFFIX)
+
+    def file_loaded(self, path, duration, size, cache_hit):
+        directive_file_loaded.send(sender=self.__class__, path=path,
+                duration=duration, bytes_in=size, cache_hit=cache_hit)
 
-    def get_file_contents(self, path):
-        contents = super(DjangoDirectiveProcessor, self).get_file_contents(path)
+    def decode_contents(self, path, contents):
+        contents = super(DjangoDirectiveProcessor, self).decode_contents(path, contents)
         if path.endswith(self.DJANGO_TEMPLATE_SUFFIX):
-            template = get_template_from_string(contents)
-            context = getattr(settings, 'STATICFILESPLUS_JS_CONTEXT', {})
-            context.setdefault('settings', settings)
-            contents = template.render(Context(context))
+            contents = render_template(contents)
         return contents
 
 
 class JavaScriptProcessor(BaseProcessor):
     original_suffix = '.js'
     processed_suffix = '.js'
+    # Directive processing is pure Python, so use processes to get
+    # around the GIL
+    parallel_mode = 'processes'
+    settings_names = ('STATICFILESPLUS_JS_COMPRESS', 'STATICFILESPLUS_JS_COMPRESS_BIN',
+            'STATICFILESPLUS_JS_COMPRESS_ARGS', 'STATICFILES_DIRS')
 
     directive_processor = None
+    dependency_graph = None
+
+    def __getstate__(self):
+        # Don't send the directive processor (and its cache) along when
+        # we're pickled for a worker process; it will get recreated there
+        state = self.__dict__.copy()
+        state.pop('directive_processor', None)
+        return state
 
     def is_ignored_file(self, path):
         return any(part.startswith('_') for part in path.split(os.sep))
 
-    def process_file(self, input_path, output_path):
+    def get_extra_sources(self):
+        plan = load_chunk_plan()
+        if plan is None:
+            return []
+        return [(plan['directory'], plan['name'])]
+
+    def get_stubbed_files(self, input_path):
+        """
+        Returns the files which have been moved out of `input_path` into a
+        shared chunk
+        """
+        plan = load_chunk_plan()
+        if plan is None or input_path not in plan['bundles']:
+            return set()
+        return set(plan['modules'])
+
+    def get_chunk_modules(self, input_path):
+        """
+        Returns the files which make up `input_path` if it's the shared chunk,
+        or an empty list otherwise. These are handed to the directive
+        processor directly, so their paths needn't be valid directive text.
+        """
+        plan = load_chunk_plan()
+        if plan is None or \
+                input_path != os.path.join(plan['directory'], plan['name']):
+            return []
+        return plan['modules']
+
+    def init_directive_processor(self):
         # Initialise DirectiveProcessor if not already done so
         if not self.directive_processor:
             self.directive_processor = DjangoDirectiveProcessor()
-        compress = getattr(settings, 'STATICFILESPLUS_JS_COMPRESS',
-                not settings.DEBUG)
+            self.dependency_graph = DependencyGraph(get_dependency_graph_dir())
+
+    def process_file(self, input_path, output_path):
+        if self.should_compress():
+            # The compressor needs the whole file at once anyway
+            return super(JavaScriptProcessor, self).process_file(
+                    input_path, output_path)
+        self.init_directive_processor()
         with open(output_path, 'wb') as f:
-            contents = self.directive_processor.load(input_path)
-            if compress:
-                contents = self.compress(contents)
-            f.write(contents.encode('utf-8'))
+            # Write each file out as we go, to avoid holding large bundles
+            # in memory
+            self.directive_processor.write(input_path,
+                    codecs.getwriter('utf-8')(f),
+                    files_seen=self.get_stubbed_files(input_path),
+                    requires=self.get_chunk_modules(input_path))
+        self.dependency_graph.set_bundle(input_path, self.directive_processor.edges)
+
+    def process_content(self, content, input_path):
+        self.init_directive_processor()
+        contents = self.directive_processor.load(input_path,
+                files_seen=self.get_stubbed_files(input_path), contents=content,
+                requires=self.get_chunk_modules(input_path))
+        self.dependency_graph.set_bundle(input_path, self.directive_processor.edges)
+        if self.should_compress():
+            contents = self.compress(contents)
+        return contents.encode('utf-8')
+
+    def should_compress(self):
+        return getattr(settings, 'STATICFILESPLUS_JS_COMPRESS', not settings.DEBUG)
+
+    def get_dependencies(self, input_path):
+        if self.dependency_graph is None or \
+                input_path not in self.dependency_graph.get_bundles():
+            return None
+        files_seen = self.dependency_graph.get_dependencies(input_path)
+        # The output of templates can depend on anything (URLconfs, settings,
+        # the database ...) so we can't cache these
+        suffix = DjangoDirectiveProcessor.DJANGO_TEMPLATE_SUFFIX
+        if any(path.endswith(suffix) for path in files_seen):
+            return None
+        # Output changes when files are moved in or out of a shared chunk
+        return list(files_seen) + [get_chunk_plan_path()]
 
     def compress(self, contents):
-        compress_bin = getattr(settings, 'STATICFILESPLUS_JS_COMPRESS_BIN', 'uglifyjs')
-        compress_args = getattr(settings, 'STATICFILESPLUS_JS_COMPRESS_ARGS',
-                ['-', '--mangle', '--compress'])
-        cmd_args = [compress_bin] + compress_args
-        if 'uglifyjs' in compress_bin:
-            hint = "Have you installed UglifyJS? See https://github.com/mishoo/UglifyJS2"
-        else:
-            hint = ''
-        return call_command(cmd_args, input=contents.encode('utf8'), hint=hint).decode('utf8')
+        return compress(contents)
+
+
+class JavaScriptBundler(JavaScriptProcessor):
+    """
+    Only expands directives, leaving compression to a separate
+    JavaScriptCompressor stage when used in a pipeline
+    """
+    settings_names = ('STATICFILES_DIRS',)
+
+    def should_compress(self):
+        return False
+
+
+class JavaScriptCompressor(BaseProcessor):
+    """
+    Compresses JavaScript files, usually as the last stage in a pipeline
+    """
+    original_suffix = '.js'
+    processed_suffix = '.js'
+    settings_names = ('STATICFILESPLUS_JS_COMPRESS_BIN', 'STATICFILESPLUS_JS_COMPRESS_ARGS')
+
+    def process_content(self, content, input_path):
+        return compress(content.decode('utf-8')).encode('utf-8')
+
+    def get_dependencies(self, input_path):
+        # The output only depends on the content we're given
+        return []
+
+
+def compress(contents):
+    compress_bin = getattr(settings, 'STATICFILESPLUS_JS_COMPRESS_BIN', 'uglifyjs')
+    compress_args = getattr(settings, 'STATICFILESPLUS_JS_COMPRESS_ARGS',
+            ['-', '--mangle', '--compress'])
+    cmd_args = [compress_bin] + compress_args
+    if 'uglifyjs' in compress_bin:
+        hint = "Have you installed UglifyJS? See https://github.com/mishoo/UglifyJS2"
+    else:
+        hint = ''
+    worker = getattr(settings, 'STATICFILESPLUS_JS_COMPRESS_WORKER', None)
+    return call_command(cmd_args, input=contents.encode('utf8'), hint=hint,
+            worker=worker).decode('utf8')
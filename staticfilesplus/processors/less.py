@@ -5,29 +5,44 @@ import os
 from django.conf import settings
 
 from . import BaseProcessor
-from ..utils import call_command, get_staticfiles_dirs, any_files_modified_since
+from .imports import ImportTrackingMixin
+from ..utils import call_command, get_staticfiles_dirs
 
 
-class LESSProcessor(BaseProcessor):
+class LESSProcessor(ImportTrackingMixin, BaseProcessor):
     original_suffix = '.less'
     processed_suffix = '.css'
+    settings_names = ('STATICFILESPLUS_LESS_COMPRESS', 'STATICFILESPLUS_LESS_BIN',
+            'STATICFILES_DIRS')
+    import_extensions = ('.less',)
+    import_graph_dir = '.less_imports'
 
     def is_ignored_file(self, path):
         return any(part.startswith('_') for part in path.split(os.sep))
 
     def process_file(self, input_path, output_path):
-        staticfiles_dirs = get_staticfiles_dirs()
-        # Bail early if no LESS files have changed since we last processed
-        # this file
-        if settings.DEBUG and not any_files_modified_since(output_path,
-                directories=staticfiles_dirs,
-                extension=self.original_suffix):
+        # Bail early if nothing this file imports has changed since we last
+        # processed it
+        if settings.DEBUG and self.is_up_to_date(input_path, output_path):
             return
+        self.call_lessc(get_staticfiles_dirs(), [input_path, output_path])
+        self.record_imports(input_path)
+
+    def process_content(self, content, input_path):
+        # Read from stdin and write to stdout, adding the file's own directory
+        # to the include path so relative imports still work
+        include_dirs = [os.path.dirname(input_path)] + get_staticfiles_dirs()
+        output = self.call_lessc(include_dirs, ['-'], input=content)
+        self.record_imports(input_path, content)
+        return output
+
+    def call_lessc(self, include_dirs, args, input=None):
         compress = getattr(settings, 'STATICFILESPLUS_LESS_COMPRESS',
                 not settings.DEBUG)
         less_bin = getattr(settings, 'STATICFILESPLUS_LESS_BIN', 'lessc')
         extra_args = ['--compress'] if compress else []
-        include_path = os.pathsep.join(staticfiles_dirs)
-        call_command([less_bin, '--include-path={}'.format(include_path)]
-                    + extra_args + [input_path, output_path],
-               hint="Have you installed LESS? See http://lesscss.org")
+        include_path = os.pathsep.join(include_dirs)
+        return call_command([less_bin, '--include-path={}'.format(include_path)]
+                    + extra_args + args, input=input,
+               hint="Have you installed LESS? See http://lesscss.org",
+               worker=getattr(settings, 'STATICFILESPLUS_LESS_WORKER', None))
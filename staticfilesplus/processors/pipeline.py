@@ -0,0 +1,153 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+
+from .base import BaseProcessor, processes_content, get_extra_sources
+from ..cache import StageCache
+from ..utils import get_tmp_dir
+
+
+class Pipeline(BaseProcessor):
+    """
+    Chains several processors together, passing the output of each stage to
+    the next in memory. Each stage's output is cached separately, so changing
+    the settings of a later stage doesn't mean re-running the earlier ones.
+
+    Stages which only implement `process_file` still work, but their input
+    has to be written to a temporary file first.
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        if not self.stages:
+            raise ValueError('A pipeline needs at least one stage')
+        self.original_suffix = self.stages[0].original_suffix
+        self.processed_suffix = self.stages[-1].processed_suffix
+        self.settings_names = tuple(name for stage in self.stages
+                                    for name in stage.settings_names)
+        # Use processes if any stage needs them
+        if any(stage.parallel_mode == 'processes' for stage in self.stages):
+            self.parallel_mode = 'processes'
+        self.stage_cache = None
+        # Maps (stage, input path) -> the dependencies recorded by the stage
+        # cache, for stages we didn't have to run
+        self.cached_dependencies = {}
+
+    def __repr__(self):
+        return 'Pipeline({!r})'.format(self.stages)
+
+    def get_original_name(self, name):
+        for stage in reversed(self.stages):
+            name = stage.get_original_name(name)
+            if name is None:
+                return None
+        return name
+
+    def get_processed_name(self, name):
+        for stage in self.stages:
+            name = stage.get_processed_name(name)
+            if name is None:
+                return None
+        return name
+
+    def is_ignored_file(self, path):
+        return self.stages[0].is_ignored_file(path)
+
+    def get_extra_sources(self):
+        return get_extra_sources(self.stages[0])
+
+    def process_file(self, input_path, output_path):
+        with open(input_path, 'rb') as f:
+            content = f.read()
+        content = self.run_stages(content, input_path, input_is_file=True)
+        with open(output_path, 'wb') as f:
+            f.write(content)
+
+    def process_content(self, content, input_path):
+        return self.run_stages(content, input_path)
+
+    def run_stages(self, content, input_path, input_is_file=False):
+        for n, (stage, stage_path) in enumerate(self.get_stage_paths(input_path)):
+            content = self.run_stage(stage, content, stage_path,
+                    input_is_file=(input_is_file and n == 0))
+        return content
+
+    def get_stage_paths(self, input_path):
+        """
+        Returns each stage along with the path of its input, which for all
+        but the first stage is where the file would be if the previous stages
+        had written it out alongside the original
+        """
+        directory, name = os.path.split(input_path)
+        stage_paths = []
+        for stage in self.stages:
+            stage_paths.append((stage, os.path.join(directory, name)))
+            name = stage.get_processed_name(name) or name
+        return stage_paths
+
+    def run_stage(self, stage, content, input_path, input_is_file=False):
+        stage_cache = self.get_stage_cache()
+        if stage_cache is not None:
+            cached = stage_cache.get(stage, input_path, content)
+            if cached is not None:
+                output, self.cached_dependencies[stage, input_path] = cached
+                return output
+        self.cached_dependencies.pop((stage, input_path), None)
+        if processes_content(stage):
+            output = stage.process_content(content, input_path)
+        else:
+            output = process_content_with_files(stage, content, input_path,
+                    input_is_file=input_is_file)
+        if stage_cache is not None:
+            stage_cache.set(stage, input_path, content, output)
+        return output
+
+    def get_stage_cache(self):
+        if not getattr(settings, 'STATICFILESPLUS_BUILD_CACHE', True):
+            return None
+        if self.stage_cache is None:
+            self.stage_cache = StageCache(os.path.join(get_tmp_dir(), '.stage_cache'),
+                    max_size=getattr(settings, 'STATICFILESPLUS_STAGE_CACHE_SIZE',
+                                     256 * 1024 * 1024))
+        return self.stage_cache
+
+    def get_dependencies(self, input_path):
+        dependencies = set()
+        for stage, stage_path in self.get_stage_paths(input_path):
+            # Stages which were skipped won't know their dependencies (e.g.
+            # the bundler only learns them by parsing), so use the ones the
+            # stage cache recorded when the stage last ran
+            stage_dependencies = self.cached_dependencies.get((stage, stage_path))
+            if stage_dependencies is None:
+                stage_dependencies = stage.get_dependencies(stage_path)
+            if stage_dependencies is None:
+                return None
+            dependencies.update(stage_dependencies)
+        dependencies.discard(input_path)
+        return list(dependencies)
+
+
+def process_content_with_files(processor, content, input_path, input_is_file=False):
+    """
+    Runs a file-based processor over `content`, writing it to a temporary
+    file unless `input_is_file` says that `input_path` already holds it
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        name = os.path.basename(input_path)
+        if not input_is_file:
+            input_path = os.path.join(tmp_dir, name)
+            with open(input_path, 'wb') as f:
+                f.write(content)
+        output_dir = os.path.join(tmp_dir, 'output')
+        os.mkdir(output_dir)
+        output_path = os.path.join(output_dir, processor.get_processed_name(name) or name)
+        processor.process_file(input_path, output_path)
+        with open(output_path, 'rb') as f:
+            return f.read()
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -5,25 +5,48 @@ import os
 from django.conf import settings
 
 from . import BaseProcessor
+from .imports import ImportTrackingMixin
 from ..utils import get_staticfiles_dirs, call_command
 
 
-class SassProcessor(BaseProcessor):
+class SassProcessor(ImportTrackingMixin, BaseProcessor):
     original_suffix = '.sass'
     processed_suffix = '.css'
+    settings_names = ('STATICFILESPLUS_SASS_COMPRESS', 'STATICFILESPLUS_SASS_BIN',
+            'STATICFILES_DIRS')
+    # Sass can import files in either syntax
+    import_extensions = ('.sass', '.scss')
+    import_partials = True
+    import_graph_dir = '.sass_imports'
 
     def is_ignored_file(self, path):
         return any(part.startswith('_') for part in path.split(os.sep))
 
     def process_file(self, input_path, output_path):
+        self.process_files([(input_path, output_path)])
+
+    def process_files(self, jobs):
+        # Skip files where nothing they import has changed since we last
+        # processed them
+        if settings.DEBUG:
+            jobs = [(input_path, output_path) for input_path, output_path in jobs
+                    if not self.is_up_to_date(input_path, output_path)]
+            if not jobs:
+                return
+        # Sass accepts any number of input:output pairs, and compiling them
+        # together saves starting it up again for each file
         compress = getattr(settings, 'STATICFILESPLUS_SASS_COMPRESS',
                 not settings.DEBUG)
         sass_bin = getattr(settings, 'STATICFILESPLUS_SASS_BIN', 'sass')
         extra_args = ['--style', 'compressed'] if compress else []
         load_path = os.pathsep.join(get_staticfiles_dirs())
         call_command([sass_bin, '--load-path', load_path]
-                + extra_args + ['--update', input_path + ':' + output_path],
-            hint="Have you installed Sass? See http://sass-lang.com")
+                + extra_args + ['--update']
+                + [input_path + ':' + output_path for input_path, output_path in jobs],
+            hint="Have you installed Sass? See http://sass-lang.com",
+            worker=getattr(settings, 'STATICFILESPLUS_SASS_WORKER', None))
+        for input_path, _ in jobs:
+            self.record_imports(input_path)
 
 
 class ScssProcessor(SassProcessor):
@@ -0,0 +1,24 @@
+"""
+Signals sent while processing files, so that the time and work spent on each
+processor and each file can be measured. See `staticfilesplus.stats` for a
+receiver which aggregates them.
+"""
+from django.dispatch import Signal
+
+
+# Sent by the finders each time a file is processed, or found to be fresh in
+# the build cache. `shared_cache_hit` is None unless the shared cache was
+# checked, and `dependency_count` is None if the processor can't tell us what
+# files it used (or there's no cache which needs to know).
+file_processed = Signal(providing_args=['processor', 'input_path', 'output_path',
+        'duration', 'subprocess_time', 'bytes_in', 'bytes_out', 'cache_hit',
+        'shared_cache_hit', 'dependency_count'])
+
+# Sent each time an external command is run, either directly or via a
+# persistent worker
+command_called = Signal(providing_args=['args', 'worker', 'duration',
+        'bytes_in', 'bytes_out'])
+
+# Sent by the JavaScript directive processor for each source file it loads
+directive_file_loaded = Signal(providing_args=['path', 'duration', 'bytes_in',
+        'cache_hit'])
@@ -0,0 +1,153 @@
+"""
+Collects the timings and counts sent by `staticfilesplus.signals` and
+summarises them by processor, by file and by external command.
+"""
+from __future__ import unicode_literals
+
+import json
+import threading
+
+from .signals import file_processed, command_called, directive_file_loaded
+
+
+class StatsCollector(object):
+
+    def __init__(self):
+        self.files = []
+        self.commands = []
+        self.directive_files = []
+        self.lock = threading.Lock()
+
+    def connect(self):
+        # Receivers are only weakly referenced by default, which would make
+        # a collector's bound methods disappear immediately
+        file_processed.connect(self.on_file_processed, weak=False)
+        command_called.connect(self.on_command_called, weak=False)
+        directive_file_loaded.connect(self.on_directive_file_loaded, weak=False)
+        return self
+
+    def disconnect(self):
+        file_processed.disconnect(self.on_file_processed)
+        command_called.disconnect(self.on_command_called)
+        directive_file_loaded.disconnect(self.on_directive_file_loaded)
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc_info):
+        self.disconnect()
+
+    def on_file_processed(self, sender, processor, input_path, output_path,
+            **kwargs):
+        cls = processor.__class__
+        record = {
+            'processor': '{}.{}'.format(cls.__module__, cls.__name__),
+            'input_path': input_path,
+            'output_path': output_path,
+        }
+        for key in ('duration', 'subprocess_time', 'bytes_in', 'bytes_out',
+                    'cache_hit', 'shared_cache_hit', 'dependency_count'):
+            record[key] = kwargs.get(key)
+        with self.lock:
+            self.files.append(record)
+
+    def on_command_called(self, sender, args, worker, **kwargs):
+        record = {
+            'command': args[0],
+            'worker': bool(worker),
+            'duration': kwargs.get('duration'),
+            'bytes_in': kwargs.get('bytes_in'),
+            'bytes_out': kwargs.get('bytes_out'),
+        }
+        with self.lock:
+            self.commands.append(record)
+
+    def on_directive_file_loaded(self, sender, path, **kwargs):
+        record = {
+            'path': path,
+            'duration': kwargs.get('duration'),
+            'bytes_in': kwargs.get('bytes_in'),
+            'cache_hit': kwargs.get('cache_hit'),
+        }
+        with self.lock:
+            self.directive_files.append(record)
+
+    def get_processor_totals(self):
+        """
+        Returns a dict mapping each processor name to its total time, bytes
+        and counts of files processed and cache hits
+        """
+        totals = {}
+        for record in self.files:
+            total = totals.setdefault(record['processor'], {
+                'files': 0, 'cache_hits': 0, 'duration': 0.0,
+                'subprocess_time': 0.0, 'bytes_in': 0, 'bytes_out': 0})
+            total['files'] += 1
+            total['cache_hits'] += 1 if record['cache_hit'] else 0
+            for key in ('duration', 'subprocess_time', 'bytes_in', 'bytes_out'):
+                total[key] += record[key] or 0
+        return totals
+
+    def get_shared_cache_totals(self):
+        totals = {'hits': 0, 'misses': 0}
+        for record in self.files:
+            if record['shared_cache_hit'] is not None:
+                totals['hits' if record['shared_cache_hit'] else 'misses'] += 1
+        return totals
+
+    def get_command_totals(self):
+        totals = {}
+        for record in self.commands:
+            total = totals.setdefault(record['command'], {
+                'calls': 0, 'duration': 0.0, 'bytes_in': 0, 'bytes_out': 0})
+            total['calls'] += 1
+            for key in ('duration', 'bytes_in', 'bytes_out'):
+                total[key] += record[key] or 0
+        return totals
+
+    def get_slowest_files(self, top=10):
+        return sorted(self.files, key=lambda record: record['duration'],
+                      reverse=True)[:top]
+
+    def as_dict(self):
+        return {
+            'processors': self.get_processor_totals(),
+            'commands': self.get_command_totals(),
+            'shared_cache': self.get_shared_cache_totals(),
+            'files': self.files,
+            'directive_files': {
+                'loaded': len(self.directive_files),
+                'cache_hits': sum(1 for record in self.directive_files
+                                  if record['cache_hit']),
+                'duration': sum(record['duration'] for record in self.directive_files),
+            },
+        }
+
+    def dump_json(self, stream):
+        json.dump(self.as_dict(), stream, indent=2, sort_keys=True)
+
+    def format_summary(self, top=10):
+        lines = ['Processors:']
+        totals = sorted(self.get_processor_totals().items(),
+                        key=lambda item: item[1]['duration'], reverse=True)
+        for name, total in totals:
+            lines.append('  {name}: {files} files ({cache_hits} cached) in '
+                         '{duration:.3f}s ({subprocess_time:.3f}s in subprocesses), '
+                         '{bytes_in} bytes in, {bytes_out} bytes out'.format(
+                             name=name, **total))
+        shared_cache = self.get_shared_cache_totals()
+        if shared_cache['hits'] or shared_cache['misses']:
+            lines.append('Shared cache: {hits} hits, {misses} misses'.format(
+                **shared_cache))
+        commands = sorted(self.get_command_totals().items(),
+                          key=lambda item: item[1]['duration'], reverse=True)
+        if commands:
+            lines.append('Commands:')
+            for name, total in commands:
+                lines.append('  {name}: {calls} calls in {duration:.3f}s'.format(
+                    name=name, **total))
+        lines.append('Slowest {} files:'.format(top))
+        for record in self.get_slowest_files(top):
+            lines.append('  {duration:.3f}s {input_path}{cached}'.format(
+                cached=' (cached)' if record['cache_hit'] else '', **record))
+        return '\n'.join(lines) + '\n'
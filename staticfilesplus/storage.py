@@ -1,29 +1,87 @@
 import errno
+import gzip
+import io
 import os
 import json
+import mmap
+import struct
+from multiprocessing.pool import ThreadPool
 
+try:
+    from urllib.parse import unquote, urlsplit, urlunsplit
+except ImportError:
+    from urllib import unquote
+    from urlparse import urlsplit, urlunsplit
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.contrib.staticfiles.storage import (CachedFilesMixin,
         StaticFilesStorage)
 
+from .cache import BuildCache, DigestCache, get_hash_algorithm, get_digest
+from .utils import get_tmp_dir, write_atomic
+
 
 class CachedFilesPlusMixin(CachedFilesMixin):
     """
     Use a simple manifest.json file for storing the mapping of original
     asset filenames to their hash-keyed versions.
 
-    Also provides an option to remove the original unversioned files.
+    Also provides an option to remove the original unversioned files, and
+    to write pre-compressed versions of each file for servers which can
+    serve these directly.
+
+    Files are hashed with STATICFILESPLUS_HASH_ALGORITHM, and only read to
+    do so if their digest isn't already known from processing them, from
+    the last deploy or from earlier in this one.
     """
     remove_unversioned = True
+    precompress_extensions = ('.css', '.js', '.svg', '.html', '.txt', '.json',
+                              '.xml', '.map', '.ttf', '.eot', '.ico')
+    hash_chunk_size = 1024 * 1024
 
     def __init__(self, *args, **kwargs):
         self.remove_unversioned = kwargs.pop('remove_unversioned',
                 self.remove_unversioned)
+        self.precompress_formats = kwargs.pop('precompress_formats',
+                getattr(settings, 'STATICFILESPLUS_PRECOMPRESS', ()))
+        for precompress_format in self.precompress_formats:
+            if precompress_format not in COMPRESSORS:
+                raise ImproperlyConfigured(
+                    "Unknown STATICFILESPLUS_PRECOMPRESS format '{}': expected "
+                    "one of {}".format(precompress_format, ', '.join(COMPRESSORS)))
+            if precompress_format == 'brotli' and brotli is None:
+                raise ImproperlyConfigured(
+                    "Brotli pre-compression requires the 'brotli' package")
+        self.precompress_min_size = getattr(settings,
+                'STATICFILESPLUS_PRECOMPRESS_MIN_SIZE', 256)
+        self.precompress_min_saving = getattr(settings,
+                'STATICFILESPLUS_PRECOMPRESS_MIN_SAVING', 0.05)
         super(CachedFilesPlusMixin, self).__init__(*args, **kwargs)
+        manifest_format = getattr(settings, 'STATICFILESPLUS_MANIFEST_FORMAT', 'json')
+        if manifest_format not in MANIFEST_BACKENDS:
+            raise ImproperlyConfigured(
+                "Unknown STATICFILESPLUS_MANIFEST_FORMAT '{}': expected one "
+                "of {}".format(manifest_format, ', '.join(MANIFEST_BACKENDS)))
+        backend, extension = MANIFEST_BACKENDS[manifest_format]
         manifest_file = getattr(settings, 'STATICFILESPLUS_MANIFEST',
-                os.path.join(settings.STATIC_ROOT, 'static_manifest.json'))
-        self.cache = JSONFileCache(manifest_file)
+                os.path.join(settings.STATIC_ROOT, 'static_manifest' + extension))
+        self.cache = backend(manifest_file)
+        self.hash_algorithm = get_hash_algorithm()
+        # Only used during post_process: the digests remembered between
+        # deploys and the hashes of the files handled so far
+        self.digest_cache = None
+        self.file_hashes = None
+        self.tmp_dir = os.path.abspath(get_tmp_dir())
+        if getattr(settings, 'STATICFILESPLUS_BUILD_CACHE', True):
+            self.build_cache = BuildCache(os.path.join(self.tmp_dir, '.build_cache'))
+        else:
+            self.build_cache = None
 
     def cache_key(self, name):
         # Because we're using our own cache backend there's no point doing
@@ -32,22 +90,195 @@ class CachedFilesPlusMixin(CachedFilesMixin):
         # applications if necessary
         return name
 
+    def file_hash(self, name, content=None):
+        """
+        Stream the content through the configured digest, unless we already
+        know what it will be
+        """
+        if content is None:
+            return None
+        # Files referred to from CSS are hashed when the CSS is rewritten
+        # as well as in their own right
+        if self.file_hashes is not None and name in self.file_hashes:
+            return self.file_hashes[name]
+        path, stat = get_file_stat(content)
+        digest = None
+        if path is not None:
+            digest = self.get_known_digest(path, stat)
+        if digest is None:
+            digest = get_digest(content.chunks(self.hash_chunk_size),
+                                self.hash_algorithm)
+            if path is not None and self.digest_cache is not None:
+                self.digest_cache.set(path, stat, digest)
+        file_hash = digest[:12]
+        if self.file_hashes is not None:
+            self.file_hashes[name] = file_hash
+        return file_hash
+
+    if not hasattr(CachedFilesMixin, 'file_hash'):
+        # Django 1.4 hashes files with md5 inside hashed_name, so route it
+        # through file_hash as later versions do
+        def hashed_name(self, name, content=None):
+            parsed_name = urlsplit(unquote(name))
+            clean_name = parsed_name.path.strip()
+            opened = False
+            if content is None:
+                if not self.exists(clean_name):
+                    raise ValueError("The file '%s' could not be found with %r." %
+                                     (clean_name, self))
+                try:
+                    content = self.open(clean_name)
+                except IOError:
+                    # Handle directory paths and fragments
+                    return name
+                opened = True
+            try:
+                file_hash = self.file_hash(clean_name, content)
+            finally:
+                if opened:
+                    content.close()
+            path, filename = os.path.split(clean_name)
+            root, ext = os.path.splitext(filename)
+            hashed_name = os.path.join(path, '%s.%s%s' % (root, file_hash, ext))
+            unparsed_name = list(parsed_name)
+            unparsed_name[2] = hashed_name
+            # Special casing for a @font-face hack, like url(myfont.eot?#iefix")
+            if '?#' in name and not unparsed_name[3]:
+                unparsed_name[2] += '?'
+            return urlunsplit(unparsed_name)
+
+    def get_known_digest(self, path, stat):
+        if self.digest_cache is not None:
+            digest = self.digest_cache.get(path, stat)
+            if digest is not None:
+                return digest
+        # Processed files had their digest recorded when they were built
+        if self.build_cache is not None and path.startswith(self.tmp_dir + os.sep):
+            digest = self.build_cache.get_output_digest(path, stat, self.hash_algorithm)
+            if digest is not None and self.digest_cache is not None:
+                self.digest_cache.set(path, stat, digest)
+            return digest
+        return None
+
     def post_process(self, *args, **kwargs):
         """
         Wrap the original post_process method and delete the unversioned files
         if that option is enabled
         """
         to_delete = []
-        files = super(CachedFilesPlusMixin, self).post_process(*args, **kwargs)
-        for name, hashed_name, processed in files:
-            if self.remove_unversioned and name != hashed_name:
-                to_delete.append(name)
-            yield name, hashed_name, processed
+        hashed_names = {}
+        self.file_hashes = {}
+        if self.build_cache is not None:
+            self.digest_cache = DigestCache(os.path.join(self.tmp_dir, '.digests.json'),
+                                            self.hash_algorithm)
+        try:
+            files = super(CachedFilesPlusMixin, self).post_process(*args, **kwargs)
+            for name, hashed_name, processed in files:
+                if self.remove_unversioned and name != hashed_name:
+                    to_delete.append(name)
+                hashed_names[name] = hashed_name
+                yield name, hashed_name, processed
+            # Nothing is hashed in a dry run, and saving would forget
+            # everything we knew
+            if self.digest_cache is not None and hashed_names:
+                self.digest_cache.save()
+        finally:
+            self.file_hashes = None
+            self.digest_cache = None
+        if self.precompress_formats and hashed_names:
+            self.cache.set_many(self.precompress(hashed_names))
         # Remove unversioned files only at the end of processing in
         # case they're needed during the rewrite-URLs-in-CSS phase
         for name in to_delete:
             self.delete(name)
 
+    def precompress(self, hashed_names):
+        """
+        Write compressed versions of each of the hashed files in parallel
+        and return a dict mapping the compressed names of the originals to
+        the compressed names of the hashed files
+        """
+        jobs = []
+        for name, hashed_name in sorted(hashed_names.items()):
+            if os.path.splitext(hashed_name)[1] not in self.precompress_extensions:
+                continue
+            for precompress_format in self.precompress_formats:
+                jobs.append((name, hashed_name, precompress_format))
+        pool = ThreadPool(max(1, getattr(settings, 'STATICFILESPLUS_WORKERS', 1)))
+        try:
+            results = pool.map(self.precompress_file, jobs)
+        finally:
+            pool.terminate()
+            pool.join()
+        return dict(result for result in results if result is not None)
+
+    def precompress_file(self, job):
+        """
+        Compress a single file, returning a (name, hashed_name) pair for the
+        compressed version or None if it wasn't worth compressing
+        """
+        name, hashed_name, precompress_format = job
+        suffix, compress = COMPRESSORS[precompress_format]
+        path = self.path(hashed_name)
+        compressed_path = path + suffix
+        result = (name + suffix, hashed_name + suffix)
+        try:
+            if os.path.getmtime(compressed_path) >= os.path.getmtime(path):
+                return result
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        with open(path, 'rb') as f:
+            content = f.read()
+        compressed = None
+        if len(content) >= self.precompress_min_size:
+            compressed = compress(content)
+            if len(compressed) > len(content) * (1 - self.precompress_min_saving):
+                compressed = None
+        if compressed is None:
+            # Remove any out-of-date compressed version
+            try:
+                os.remove(compressed_path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            return None
+        write_atomic(compressed_path, compressed, mode=0o644)
+        return result
+
+
+def get_file_stat(content):
+    """
+    Returns the path and stat of the file on disk behind a Django File, or
+    (None, None) if there isn't one (e.g. it's a ContentFile)
+    """
+    name = getattr(content, 'name', None)
+    if not name or not os.path.isabs(name):
+        return None, None
+    try:
+        return name, os.fstat(content.fileno())
+    except (AttributeError, ValueError, EnvironmentError):
+        return None, None
+
+
+def gzip_compress(content):
+    output = io.BytesIO()
+    # Fix the mtime so the output only depends on the input
+    with gzip.GzipFile(filename='', mode='wb', fileobj=output,
+                       compresslevel=9, mtime=0) as f:
+        f.write(content)
+    return output.getvalue()
+
+
+def brotli_compress(content):
+    return brotli.compress(content)
+
+
+COMPRESSORS = {
+    'gzip': ('.gz', gzip_compress),
+    'brotli': ('.br', brotli_compress),
+}
+
 
 class CachedStaticFilesPlusStorage(CachedFilesPlusMixin, StaticFilesStorage):
     """
@@ -93,3 +324,110 @@ class JSONFileCache(object):
         # matter
         with open(self.cache_file, 'wb') as f:
             json.dump(self.cache_dict, f, indent=2)
+
+
+class MmapFileCache(object):
+    """
+    An alternative to JSONFileCache which stores its contents in a compact
+    binary file, read through mmap. Lookups don't require parsing the whole
+    file and, as the file is mapped read-only, its pages are shared between
+    all the processes using it (e.g. forked server workers).
+
+    The file consists of a header (a magic string and the number of entries)
+    followed by an index of fixed-size records, sorted by key, which give the
+    offset and length of each key and value. The UTF-8 encoded keys and
+    values follow the index. Lookups are a binary search over the index.
+    """
+
+    MAGIC = b'SFPMMAP1'
+    HEADER = struct.Struct('<8sI')
+    RECORD = struct.Struct('<IIII')
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        # Values which have been set but not yet written out
+        self.pending = {}
+        self.mmap = None
+        self.count = 0
+        self.open()
+
+    def open(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        self.count = 0
+        try:
+            f = open(self.cache_file, 'rb')
+        except IOError as e:
+            # If it doesn't exist, start with an empty cache
+            # (All other errors should be raised)
+            if e.errno == errno.ENOENT:
+                return
+            raise
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = self.HEADER.unpack_from(self.mmap, 0)
+        if magic != self.MAGIC:
+            raise ValueError("'{}' is not a valid manifest file".format(self.cache_file))
+
+    def get(self, key, default=None):
+        if key in self.pending:
+            return self.pending[key]
+        encoded_key = key.encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            key_offset, key_length, value_offset, value_length = self.get_record(middle)
+            record_key = self.mmap[key_offset:key_offset + key_length]
+            if record_key < encoded_key:
+                low = middle + 1
+            elif record_key > encoded_key:
+                high = middle
+            else:
+                return self.mmap[value_offset:value_offset + value_length].decode('utf-8')
+        return default
+
+    def get_record(self, n):
+        return self.RECORD.unpack_from(self.mmap, self.HEADER.size + n * self.RECORD.size)
+
+    def items(self):
+        for n in range(self.count):
+            key_offset, key_length, value_offset, value_length = self.get_record(n)
+            yield (self.mmap[key_offset:key_offset + key_length].decode('utf-8'),
+                   self.mmap[value_offset:value_offset + value_length].decode('utf-8'))
+
+    def set(self, key, value, timeout=None):
+        self.pending[key] = value
+
+    def set_many(self, values, timeout=None):
+        contents = dict(self.items())
+        contents.update(self.pending)
+        contents.update(values)
+        self.write(contents)
+        self.pending = {}
+        self.open()
+
+    def write(self, contents):
+        entries = sorted((key.encode('utf-8'), value.encode('utf-8'))
+                         for key, value in contents.items())
+        offset = self.HEADER.size + len(entries) * self.RECORD.size
+        index, data = [], []
+        for key, value in entries:
+            index.append(self.RECORD.pack(offset, len(key),
+                                          offset + len(key), len(value)))
+            data.extend((key, value))
+            offset += len(key) + len(value)
+        # Renaming a new file into place leaves processes which have the old
+        # one mapped unaffected
+        write_atomic(self.cache_file,
+                     self.HEADER.pack(self.MAGIC, len(entries)) + b''.join(index) +
+                     b''.join(data),
+                     mode=0o644)
+
+
+MANIFEST_BACKENDS = {
+    'json': (JSONFileCache, '.json'),
+    'binary': (MmapFileCache, '.bin'),
+}
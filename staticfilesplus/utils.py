@@ -1,29 +1,132 @@
+import atexit
 import errno
 import os
 import subprocess
+import tempfile
+import threading
+import time
 
+from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.contrib.staticfiles.finders import (get_finders,
         AppDirectoriesFinder, FileSystemFinder)
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+
+from .lib.stat_index import StatIndex
+from .lib import worker_pool
+from .lib.worker_pool import WorkerPool, WorkerError
+from .signals import command_called
+
+
+_stat_indexes = {}
+_stat_indexes_lock = threading.Lock()
+
+_worker_pools = {}
+_worker_pools_lock = threading.Lock()
+
+_subprocess_time = threading.local()
+
+_staticfiles_dirs = None
+
+# Settings which can change the directories the finders search
+STATICFILES_DIRS_SETTINGS = ('STATICFILES_DIRS', 'STATICFILES_FINDERS',
+        'INSTALLED_APPS')
 
 
 def get_staticfiles_dirs():
-    dirs = []
-    for finder in get_finders():
-        if isinstance(finder, (AppDirectoriesFinder, FileSystemFinder)):
-            for storage in finder.storages.values():
-                dirs.append(storage.location)
-    return dirs
+    """
+    Returns the directories searched by the staticfiles finders. These are
+    only worked out once per process, as doing so means walking every
+    finder; call `clear_staticfiles_dirs` if they change.
+    """
+    global _staticfiles_dirs
+    if _staticfiles_dirs is None:
+        dirs = []
+        for finder in get_finders():
+            if isinstance(finder, (AppDirectoriesFinder, FileSystemFinder)):
+                for storage in finder.storages.values():
+                    dirs.append(storage.location)
+        _staticfiles_dirs = dirs
+    # Return a copy so callers can't change the cached list
+    return list(_staticfiles_dirs)
+
+
+def clear_staticfiles_dirs():
+    global _staticfiles_dirs
+    _staticfiles_dirs = None
+
+
+@receiver(setting_changed)
+def on_setting_changed(setting, **kwargs):
+    if setting in STATICFILES_DIRS_SETTINGS:
+        clear_staticfiles_dirs()
+
+
+def get_tmp_dir():
+    return getattr(settings, 'STATICFILESPLUS_TMP_DIR',
+                   os.path.join(settings.STATIC_ROOT, 'staticfilesplus_tmp'))
+
+
+def write_atomic(path, content, mode=None):
+    """
+    Writes the bytes `content` to `path`, creating any missing directories.
+    The content goes to a temporary file which is then renamed into place,
+    so readers never see a partially written file. If `mode` is given the
+    file's permissions are set to it.
+    """
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, 0o775)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    if mode is not None:
+        os.chmod(tmp_path, mode)
+    os.rename(tmp_path, path)
 
 
 def call_command(*args, **kwargs):
     """
     Wraps subprocess.Popen to produce slightly more readable
     and informative error output
+
+    If a `worker` command is supplied then the arguments are sent to a
+    persistent worker process instead of starting a new process (where
+    workers are supported)
     """
-    executable = args[0][0]
     hint = kwargs.pop('hint', '')
     input = kwargs.pop('input', None)
+    worker = kwargs.pop('worker', None)
+    if not worker_pool.is_supported():
+        worker = None
+    start = time.time()
+    try:
+        if worker:
+            output = call_worker(worker, args[0], input, hint)
+        else:
+            output = call_subprocess(args, kwargs, input, hint)
+    finally:
+        duration = time.time() - start
+        _subprocess_time.total = get_subprocess_time() + duration
+    command_called.send(sender=None, args=args[0], worker=worker,
+            duration=duration, bytes_in=len(input or b''), bytes_out=len(output))
+    return output
+
+
+def get_subprocess_time():
+    """
+    Returns the total time the current thread has spent waiting for external
+    commands, so callers can tell how much of their time was their own
+    """
+    return getattr(_subprocess_time, 'total', 0.0)
+
+
+def call_subprocess(args, kwargs, input, hint):
+    executable = args[0][0]
     for key in ('stdin', 'stdout', 'stderr'):
         kwargs.setdefault(key, subprocess.PIPE)
     proc = subprocess.Popen(*args, **kwargs)
@@ -44,6 +147,51 @@ def call_command(*args, **kwargs):
     return stdout
 
 
+def call_worker(worker, cmd_args, input, hint):
+    pool = get_worker_pool(worker)
+    try:
+        returncode, stdout, stderr = pool.run(cmd_args[1:], input)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            if hint:
+                hint = '\n' + hint
+            raise ImproperlyConfigured(
+                "Couldn't find worker executable '{executable}'{hint}".format(
+                    executable=worker[0], hint=hint))
+        raise
+    except WorkerError as e:
+        raise CalledProcessError(-1, cmd_args,
+                output='Worker {}: {}'.format(' '.join(worker), e).encode('utf8'))
+    if returncode != 0:
+        raise CalledProcessError(returncode, cmd_args,
+                output=b'\n'.join(filter(None, (stdout, stderr))))
+    return stdout
+
+
+def get_worker_pool(worker):
+    """
+    Returns the pool of persistent worker processes running the `worker`
+    command, starting one if necessary
+    """
+    key = (os.getpid(), tuple(worker))
+    with _worker_pools_lock:
+        if key not in _worker_pools:
+            size = getattr(settings, 'STATICFILESPLUS_WORKERS', 1)
+            timeout = getattr(settings, 'STATICFILESPLUS_WORKER_TIMEOUT', 300)
+            _worker_pools[key] = WorkerPool(worker, size=size, job_timeout=timeout)
+        return _worker_pools[key]
+
+
+@atexit.register
+def close_worker_pools():
+    with _worker_pools_lock:
+        for (pid, _), pool in _worker_pools.items():
+            # Pools inherited from a parent process aren't ours to close
+            if pid == os.getpid():
+                pool.close()
+        _worker_pools.clear()
+
+
 class CalledProcessError(subprocess.CalledProcessError):
     """
     Wraps subprocess.CalledProcessError to produce slightly more readable
@@ -59,6 +207,10 @@ class CalledProcessError(subprocess.CalledProcessError):
                     returncode=self.returncode,
                     output=self.output.decode('utf8'))
 
+    def __reduce__(self):
+        # Allows errors to be passed back from worker processes
+        return (self.__class__, (self.returncode, self.cmd, self.output))
+
 
 def any_files_modified_since(target_file, directories, extension):
     """
@@ -71,12 +223,43 @@ def any_files_modified_since(target_file, directories, extension):
         if e.errno == errno.ENOENT:
             return True
         raise
-    for directory in directories:
-        for root, _, files in os.walk(directory):
-            for filename in files:
-                if not filename.endswith(extension):
-                    continue
-                last_modified = os.path.getmtime(os.path.join(root, filename))
-                if last_modified > target_last_modified:
-                    return True
+    last_modified = get_stat_index(directories, extension).get_latest_mtime()
+    return last_modified is not None and last_modified > target_last_modified
+
+
+def paths_modified_since(target_file, paths):
+    """
+    Checks whether any of `paths` have been modified (or deleted) since
+    `target_file` was last modified
+    """
+    try:
+        target_last_modified = os.path.getmtime(target_file)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return True
+        raise
+    for path in paths:
+        try:
+            if os.path.getmtime(path) > target_last_modified:
+                return True
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return True
+            raise
     return False
+
+
+def get_stat_index(directories, extension, track_mtimes=True):
+    """
+    Returns a StatIndex of the files in `directories` matching `extension`
+    (which can be a string or a tuple of strings). Indexes are kept for the
+    life of the process and refreshed incrementally on each use (or, where
+    they have to poll, at most every STATICFILESPLUS_POLL_INTERVAL seconds).
+    """
+    key = (tuple(directories), extension, track_mtimes)
+    with _stat_indexes_lock:
+        if key not in _stat_indexes:
+            _stat_indexes[key] = StatIndex(directories, extension,
+                    track_mtimes=track_mtimes,
+                    poll_interval=getattr(settings, 'STATICFILESPLUS_POLL_INTERVAL', 1))
+        return _stat_indexes[key]
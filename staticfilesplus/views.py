@@ -0,0 +1,210 @@
+"""
+A replacement for the `django.contrib.staticfiles` development view which
+keeps recently served files in memory and supports conditional requests
+using ETags, so reloading a page doesn't mean re-reading every asset.
+Conditional requests are answered without consulting the finders at all
+while nothing the file was built from has changed.
+
+Like the original, this should only be used in development.
+"""
+import errno
+import hashlib
+import mimetypes
+import os
+import posixpath
+import time
+try:
+    from urllib.parse import unquote
+except ImportError:     # Python 2
+    from urllib import unquote
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import ImproperlyConfigured
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date
+
+from .cache import BuildCache
+from .lib.lru_cache import LRUCache
+from .lib.stat_index import StatIndex
+from .utils import get_staticfiles_dirs, get_stat_index, get_tmp_dir
+
+
+_asset_cache = None
+_served_files = None
+_build_caches = {}
+
+
+def get_asset_cache():
+    global _asset_cache
+    max_size = getattr(settings, 'STATICFILESPLUS_SERVE_CACHE_SIZE', 64 * 1024 * 1024)
+    if _asset_cache is None:
+        _asset_cache = LRUCache(max_size)
+    _asset_cache.resize(max_size)
+    return _asset_cache
+
+
+def get_served_files():
+    """
+    Returns the cache mapping each requested path to the ServedFile last
+    served for it
+    """
+    global _served_files
+    if _served_files is None:
+        _served_files = LRUCache(10000)
+    return _served_files
+
+
+def get_build_cache():
+    if not getattr(settings, 'STATICFILESPLUS_BUILD_CACHE', True):
+        return None
+    directory = os.path.join(get_tmp_dir(), '.build_cache')
+    # Keep one per directory so its memo of file hashes is reused
+    if directory not in _build_caches:
+        _build_caches[directory] = BuildCache(directory)
+    return _build_caches[directory]
+
+
+def serve(request, path, insecure=False, **kwargs):
+    """
+    Serve static files from locations inferred from the staticfiles finders.
+
+    To use, put a URL pattern such as::
+
+        (r'^static/(?P<path>.*)$', 'staticfilesplus.views.serve')
+
+    in your URLconf and run `runserver` with the `--nostatic` option so that
+    the default view isn't used instead.
+    """
+    if not settings.DEBUG and not insecure:
+        raise ImproperlyConfigured("The staticfiles view can only be used in "
+                                   "debug mode or if the --insecure "
+                                   "option of 'runserver' is used")
+    normalized_path = posixpath.normpath(unquote(path)).lstrip('/')
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    # Answer revalidations without going near the finders (and so the
+    # processors) as long as nothing the file was built from has changed
+    served = get_served_files().get(normalized_path)
+    if served is not None and etag_matches(if_none_match, served.etag) and \
+            served.is_fresh():
+        response = HttpResponseNotModified()
+        response['ETag'] = served.etag
+        response['Last-Modified'] = http_date(served.last_modified)
+        return response
+    absolute_path = finders.find(normalized_path)
+    if not absolute_path:
+        if path.endswith('/') or path == '':
+            raise Http404("Directory indexes are not allowed here.")
+        raise Http404("'%s' could not be found" % path)
+    if os.path.isdir(absolute_path):
+        raise Http404("Directory indexes are not allowed here.")
+    content, etag, last_modified = get_asset(absolute_path)
+    get_served_files().set(normalized_path,
+            ServedFile(absolute_path, etag, last_modified, len(content)), size=1)
+    if etag_matches(if_none_match, etag):
+        response = HttpResponseNotModified()
+    else:
+        mimetype, encoding = mimetypes.guess_type(absolute_path)
+        response = HttpResponse(content,
+                content_type=mimetype or 'application/octet-stream')
+        response['Content-Length'] = len(content)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def get_asset(path):
+    """
+    Returns a (content, etag, last_modified) tuple for the file at `path`,
+    only reading the file if it has changed since we last read it
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_mtime, stat.st_size)
+    cache = get_asset_cache()
+    asset = cache.get(key)
+    if asset is None:
+        with open(path, 'rb') as f:
+            content = f.read()
+        etag = '"{}"'.format(hashlib.sha1(content).hexdigest())
+        asset = (content, etag, stat.st_mtime)
+        cache.set(key, asset, size=len(content))
+    return asset
+
+
+class ServedFile(object):
+    """
+    Records what was served for a path along with enough about the files it
+    was built from to tell, without processing it again, whether it would
+    still be the same
+    """
+
+    def __init__(self, path, etag, last_modified, size):
+        self.path = path
+        self.etag = etag
+        self.last_modified = last_modified
+        self.output = [last_modified, size]
+        # Adding or removing a file can change which file a path resolves to
+        self.file_index = get_stat_index(get_staticfiles_dirs(), '', track_mtimes=False)
+        self.generation = self.file_index.get_generation()
+        self.build_cache = get_build_cache()
+        # A list of (path, digest) pairs for the files a processed file was
+        # built from, or None if these aren't known
+        self.sources = []
+        self.latest_mtime = None
+        if self.is_processed():
+            self.sources = self.get_sources()
+            if self.sources is None:
+                self.latest_mtime = self.get_latest_mtime()
+                # Files modified within the resolution of their timestamps
+                # could change again without it showing
+                if self.latest_mtime is not None and \
+                        time.time() - self.latest_mtime < StatIndex.RACY_INTERVAL:
+                    self.latest_mtime = None
+
+    def is_processed(self):
+        return self.path.startswith(os.path.join(os.path.abspath(get_tmp_dir()), ''))
+
+    def get_sources(self):
+        if self.build_cache is None:
+            return None
+        entry = self.build_cache.read_entry(self.path)
+        if entry is None or entry['output'] != self.output:
+            return None
+        return entry['files']
+
+    def get_latest_mtime(self):
+        # With nothing better to go on, any change to any static file could
+        # have changed the output
+        return get_stat_index(get_staticfiles_dirs(), '').get_latest_mtime()
+
+    def is_fresh(self):
+        if self.file_index.get_generation() != self.generation:
+            return False
+        try:
+            stat = os.stat(self.path)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return False
+            raise
+        if [stat.st_mtime, stat.st_size] != self.output:
+            return False
+        if self.sources is not None:
+            return all(self.build_cache.get_file_hash(path) == digest
+                       for path, digest in self.sources)
+        return self.latest_mtime is not None and \
+            self.get_latest_mtime() == self.latest_mtime
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        # If-None-Match uses the weak comparison function
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == '*' or candidate == etag:
+            return True
+    return False
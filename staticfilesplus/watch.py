@@ -0,0 +1,79 @@
+"""
+Lets the `watchstatic` command tell the finders what it's doing, so that in
+development they can serve the files it has built ahead of time rather than
+processing them during the request.
+
+The command records its pid, and whether it has changes it hasn't finished
+rebuilding yet, in a small JSON file in STATICFILESPLUS_TMP_DIR.
+"""
+import errno
+import json
+import os
+import time
+
+from django.conf import settings
+
+from .utils import get_tmp_dir, write_atomic
+
+
+def get_state_path():
+    return os.path.join(get_tmp_dir(), '.watcher.json')
+
+
+def write_state(busy):
+    write_atomic(get_state_path(),
+                 json.dumps({'pid': os.getpid(), 'busy': busy}).encode('utf-8'))
+
+
+def clear_state():
+    try:
+        os.remove(get_state_path())
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def read_state():
+    """
+    Returns the state written by a running watcher, or None if there isn't
+    one
+    """
+    try:
+        with open(get_state_path(), 'rb') as f:
+            state = json.loads(f.read().decode('utf-8'))
+    except IOError as e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise
+    except ValueError:
+        return None
+    # The watcher may have been killed without tidying up after itself
+    if not is_running(state['pid']):
+        return None
+    return state
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def wait_for_watcher():
+    """
+    Waits for a running watcher to finish any rebuild in progress, for at
+    most STATICFILESPLUS_WATCH_WAIT seconds. Returns True if the watcher is
+    running and idle, and so everything it builds is up to date.
+    """
+    deadline = time.time() + getattr(settings, 'STATICFILESPLUS_WATCH_WAIT', 30)
+    while True:
+        state = read_state()
+        if state is None:
+            return False
+        if not state['busy']:
+            return True
+        if time.time() >= deadline:
+            return False
+        time.sleep(0.05)
@@ -0,0 +1,61 @@
+"""
+A stand-in for a persistent compiler process, used to test the worker
+protocol. See staticfilesplus.lib.worker_pool for details.
+
+Supports the following "command line arguments":
+
+  --upper       return the input in upper case
+  --pid         return the worker's process ID
+  --fail        exit with a non-zero status
+  --crash       exit the worker process entirely
+  --hang        stop responding to requests, including health checks
+  --hang-after  as --hang, but only after responding to this request
+"""
+import json
+import os
+import sys
+
+
+def read_message(stream):
+    length = stream.readline()
+    if not length:
+        return None
+    return json.loads(stream.read(int(length)).decode('utf-8'))
+
+
+def write_message(stream, message):
+    payload = json.dumps(message).encode('utf-8')
+    stream.write(str(len(payload)).encode('ascii') + b'\n' + payload)
+    stream.flush()
+
+
+def main():
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+    hung = False
+    while True:
+        request = read_message(stdin)
+        if request is None:
+            break
+        if hung:
+            continue
+        response = {'status': 0, 'stdout': '', 'stderr': ''}
+        args = request.get('args', [])
+        if '--upper' in args:
+            response['stdout'] = request['input'].upper()
+        if '--pid' in args:
+            response['stdout'] = str(os.getpid())
+        if '--fail' in args:
+            response.update(status=1, stderr='failed')
+        if '--crash' in args:
+            os._exit(1)
+        if '--hang' in args:
+            hung = True
+            continue
+        write_message(stdout, response)
+        if '--hang-after' in args:
+            hung = True
+
+
+if __name__ == '__main__':
+    main()
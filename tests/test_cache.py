@@ -0,0 +1,305 @@
+from __future__ import absolute_import, unicode_literals
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from staticfilesplus.cache import BuildCache, DigestCache, SharedCache, StageCache
+from staticfilesplus.processors import BaseProcessor
+from staticfilesplus.processors.less import LESSProcessor
+
+
+class CountingProcessor(BaseProcessor):
+    original_suffix = '.in'
+    processed_suffix = '.out'
+    settings_names = ('TEST_PROCESSOR_SETTING',)
+
+    def __init__(self, dependencies=()):
+        self.dependencies = list(dependencies)
+
+    def process_file(self, input_path, output_path):
+        with open(output_path, 'wb') as f:
+            f.write(b'output')
+
+    def get_dependencies(self, input_path):
+        return self.dependencies
+
+
+class UnknownDependenciesProcessor(CountingProcessor):
+
+    def get_dependencies(self, input_path):
+        return None
+
+
+class BuildCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = BuildCache(os.path.join(self.tmp, 'cache'))
+        self.input_path = self.write('input.in', 'input')
+        self.dep_path = self.write('dep.in', 'dependency')
+        self.output_path = os.path.join(self.tmp, 'input.out')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, contents):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(contents.encode('utf8'))
+        return path
+
+    def build(self, processor):
+        processor.process_file(self.input_path, self.output_path)
+        self.cache.store(processor, self.input_path, self.output_path)
+
+    def is_fresh(self, processor):
+        # Use a new cache instance each time so we're testing what was
+        # persisted, not what was held in memory
+        cache = BuildCache(self.cache.directory)
+        return cache.is_fresh(processor, self.input_path, self.output_path)
+
+    def test_recently_modified_file_hash_is_not_remembered(self):
+        self.cache.get_file_hash(self.input_path)
+        self.assertNotIn(self.input_path, self.cache.file_hashes)
+        os.utime(self.input_path, (1000, 1000))
+        self.cache.get_file_hash(self.input_path)
+        self.assertIn(self.input_path, self.cache.file_hashes)
+
+    def test_unbuilt_file_is_not_fresh(self):
+        self.assertFalse(self.is_fresh(CountingProcessor()))
+
+    def test_unchanged_file_is_fresh(self):
+        processor = CountingProcessor([self.dep_path])
+        self.build(processor)
+        self.assertTrue(self.is_fresh(processor))
+
+    def test_changed_input_is_not_fresh(self):
+        processor = CountingProcessor([self.dep_path])
+        self.build(processor)
+        self.write('input.in', 'changed input')
+        self.assertFalse(self.is_fresh(processor))
+
+    def test_changed_dependency_is_not_fresh(self):
+        processor = CountingProcessor([self.dep_path])
+        self.build(processor)
+        self.write('dep.in', 'changed dependency')
+        self.assertFalse(self.is_fresh(processor))
+
+    def test_changed_settings_are_not_fresh(self):
+        processor = CountingProcessor()
+        with override_settings(TEST_PROCESSOR_SETTING=1):
+            self.build(processor)
+            self.assertTrue(self.is_fresh(processor))
+        with override_settings(TEST_PROCESSOR_SETTING=2):
+            self.assertFalse(self.is_fresh(processor))
+
+    def test_deleted_output_is_not_fresh(self):
+        processor = CountingProcessor()
+        self.build(processor)
+        os.remove(self.output_path)
+        self.assertFalse(self.is_fresh(processor))
+
+    def test_unknown_dependencies_are_never_fresh(self):
+        processor = UnknownDependenciesProcessor()
+        self.build(processor)
+        self.assertFalse(self.is_fresh(processor))
+
+    def test_records_output_digest(self):
+        self.build(CountingProcessor())
+        cache = BuildCache(self.cache.directory)
+        stat = os.stat(self.output_path)
+        self.assertEqual(cache.get_output_digest(self.output_path, stat, 'md5'),
+                         hashlib.md5(b'output').hexdigest())
+        self.assertEqual(cache.get_output_digest(self.output_path, stat, 'sha1'), None)
+        self.write('input.out', 'changed output')
+        self.assertEqual(cache.get_output_digest(
+            self.output_path, os.stat(self.output_path), 'md5'), None)
+
+
+class DigestCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.tmp, 'digests.json')
+        self.path = os.path.join(self.tmp, 'file.txt')
+        with open(self.path, 'wb') as f:
+            f.write(b'contents')
+        # Recently modified files aren't remembered
+        os.utime(self.path, (1000, 1000))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_digests_are_persisted(self):
+        cache = DigestCache(self.cache_file, 'md5')
+        cache.set(self.path, os.stat(self.path), 'abc123')
+        cache.save()
+        cache = DigestCache(self.cache_file, 'md5')
+        self.assertEqual(cache.get(self.path, os.stat(self.path)), 'abc123')
+        # Digests from another algorithm are discarded
+        cache = DigestCache(self.cache_file, 'sha1')
+        self.assertEqual(cache.get(self.path, os.stat(self.path)), None)
+
+    def test_changed_file_is_a_miss(self):
+        cache = DigestCache(self.cache_file, 'md5')
+        cache.set(self.path, os.stat(self.path), 'abc123')
+        with open(self.path, 'wb') as f:
+            f.write(b'changed contents')
+        self.assertEqual(cache.get(self.path, os.stat(self.path)), None)
+
+    def test_recently_modified_file_is_not_remembered(self):
+        cache = DigestCache(self.cache_file, 'md5')
+        os.utime(self.path, None)
+        cache.set(self.path, os.stat(self.path), 'abc123')
+        self.assertEqual(cache.get(self.path, os.stat(self.path)), None)
+
+    def test_only_used_digests_are_saved(self):
+        cache = DigestCache(self.cache_file, 'md5')
+        cache.set(self.path, os.stat(self.path), 'abc123')
+        cache.set('/gone.txt', os.stat(self.path), 'def456')
+        cache.save()
+        cache = DigestCache(self.cache_file, 'md5')
+        cache.get(self.path, os.stat(self.path))
+        cache.save()
+        self.assertEqual(list(DigestCache(self.cache_file, 'md5').digests), [self.path])
+
+
+class StageCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = StageCache(os.path.join(self.tmp, 'cache'), max_size=1024 * 1024)
+        self.input_path = os.path.join(self.tmp, 'input.in')
+        self.dep_path = os.path.join(self.tmp, 'dep.in')
+        with open(self.dep_path, 'wb') as f:
+            f.write(b'dependency')
+        self.processor = CountingProcessor([self.dep_path])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_returns_output_and_dependencies(self):
+        self.cache.set(self.processor, self.input_path, b'input', b'output')
+        cache = StageCache(self.cache.directory, max_size=1024 * 1024)
+        self.assertEqual(cache.get(self.processor, self.input_path, b'input'),
+                         (b'output', [self.dep_path]))
+
+    def test_evicts_least_recently_used_entries(self):
+        self.cache.set(self.processor, self.input_path, b'old', b'output')
+        for filename in os.listdir(self.cache.directory):
+            os.utime(os.path.join(self.cache.directory, filename), (1000, 1000))
+        self.cache.set(self.processor, self.input_path, b'new', b'output')
+        self.cache.max_size = sum(
+                os.path.getsize(os.path.join(self.cache.directory, filename))
+                for filename in os.listdir(self.cache.directory)) // 2
+        self.cache.evict()
+        self.assertEqual(self.cache.get(self.processor, self.input_path, b'old'), None)
+        self.assertNotEqual(self.cache.get(self.processor, self.input_path, b'new'), None)
+
+
+class SharedCacheTest(SimpleTestCase):
+    """
+    Simulates two build nodes, with their source trees in different places,
+    sharing a cache directory
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp, 'shared')
+        self.node1 = self.make_node('node1')
+        self.node2 = self.make_node('node2')
+        self.processor = CountingProcessor()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def make_node(self, name):
+        root = os.path.join(self.tmp, name)
+        os.makedirs(os.path.join(root, 'src'))
+        os.makedirs(os.path.join(root, 'out'))
+        node = {
+            'cache': SharedCache(self.cache_dir, root=os.path.join(root, 'out'),
+                                 max_size=1024 * 1024),
+            'input': self.write(root, 'src/input.in', 'input'),
+            'dep': self.write(root, 'src/dep.in', 'dependency'),
+            'output': os.path.join(root, 'out', 'input.out'),
+        }
+        return node
+
+    def write(self, root, name, contents):
+        path = os.path.join(root, name)
+        with open(path, 'wb') as f:
+            f.write(contents.encode('utf8'))
+        return path
+
+    def publish(self, node):
+        self.processor.process_file(node['input'], node['output'])
+        node['cache'].publish(self.processor, node['input'], node['output'], [node['dep']])
+
+    def fetch(self, node):
+        return node['cache'].fetch(self.processor, node['input'], node['output'])
+
+    def test_fetches_output_published_by_another_node(self):
+        self.publish(self.node1)
+        self.assertEqual(self.fetch(self.node2), [self.node2['dep']])
+        with open(self.node2['output'], 'rb') as f:
+            self.assertEqual(f.read(), b'output')
+
+    def test_changed_dependency_is_a_miss(self):
+        self.publish(self.node1)
+        self.write(os.path.join(self.tmp, 'node2'), 'src/dep.in', 'changed')
+        self.assertEqual(self.fetch(self.node2), None)
+        self.assertFalse(os.path.exists(self.node2['output']))
+
+    def test_changed_input_is_a_miss(self):
+        self.publish(self.node1)
+        self.write(os.path.join(self.tmp, 'node2'), 'src/input.in', 'changed')
+        self.assertEqual(self.fetch(self.node2), None)
+
+    def test_unknown_dependencies_are_not_published(self):
+        self.processor.process_file(self.node1['input'], self.node1['output'])
+        self.node1['cache'].publish(self.processor, self.node1['input'],
+                                    self.node1['output'], None)
+        self.assertEqual(self.fetch(self.node2), None)
+
+    def test_shares_entries_for_processors_using_path_settings(self):
+        # LESSProcessor's settings include STATICFILES_DIRS, which differ
+        # between the two checkouts
+        self.processor = LESSProcessor()
+        for node in (self.node1, self.node2):
+            node['settings'] = override_settings(
+                    STATICFILES_DIRS=[os.path.dirname(node['input'])])
+        # Stands in for running lessc
+        self.write(self.tmp, 'node1/out/input.out', 'output')
+        with self.node1['settings']:
+            self.node1['cache'].publish(self.processor, self.node1['input'],
+                                        self.node1['output'], [self.node1['dep']])
+        with self.node2['settings']:
+            self.assertEqual(self.fetch(self.node2), [self.node2['dep']])
+
+    def test_entries_are_readable_by_other_users(self):
+        self.publish(self.node1)
+        for path in self.get_cached_files():
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+
+    def get_cached_files(self):
+        return sorted(os.path.join(dirpath, filename)
+                      for dirpath, _, filenames in os.walk(self.cache_dir)
+                      for filename in filenames)
+
+    def test_evicts_least_recently_used_files(self):
+        self.publish(self.node1)
+        manifest, output = sorted(self.get_cached_files(),
+                key=lambda path: 'objects' in path)
+        # Make the output look older than the manifest
+        os.utime(output, (1000, 1000))
+        cache = self.node1['cache']
+        cache.max_size = os.path.getsize(manifest)
+        cache.evict()
+        self.assertEqual(self.get_cached_files(), [manifest])
+        self.assertEqual(self.fetch(self.node2), None)
@@ -0,0 +1,67 @@
+from __future__ import absolute_import, unicode_literals
+
+import shutil
+import tempfile
+from unittest import TestCase
+
+from staticfilesplus.lib.dependency_graph import DependencyGraph
+
+
+class DependencyGraphTest(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.graph = DependencyGraph(self.tmp)
+        self.graph.set_bundle('/app.js', {
+            '/app.js': ['/lib/jquery.js', '/lib/plugin.js'],
+            '/lib/plugin.js': ['/lib/jquery.js'],
+            '/lib/jquery.js': [],
+        })
+        self.graph.set_bundle('/admin.js', {
+            '/admin.js': ['/lib/plugin.js'],
+            '/lib/plugin.js': ['/lib/jquery.js'],
+            '/lib/jquery.js': [],
+        })
+        self.graph.set_bundle('/other.js', {
+            '/other.js': [],
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_dependencies(self):
+        self.assertEqual(self.graph.get_dependencies('/admin.js'),
+                set(['/lib/plugin.js', '/lib/jquery.js']))
+
+    def test_dependents(self):
+        self.assertEqual(self.graph.get_dependents('/lib/jquery.js'),
+                set(['/app.js', '/admin.js', '/lib/plugin.js']))
+        self.assertEqual(self.graph.get_direct_dependents('/lib/jquery.js'),
+                set(['/app.js', '/lib/plugin.js']))
+
+    def test_affected_bundles(self):
+        self.assertEqual(self.graph.get_affected_bundles(['/lib/plugin.js']),
+                set(['/app.js', '/admin.js']))
+        self.assertEqual(self.graph.get_affected_bundles(['/other.js']),
+                set(['/other.js']))
+
+    def test_graph_is_persisted(self):
+        graph = DependencyGraph(self.tmp).load()
+        self.assertEqual(graph.bundles, self.graph.bundles)
+        self.assertEqual(graph.reverse_edges, self.graph.reverse_edges)
+
+    def test_replacing_bundle_removes_old_edges(self):
+        self.graph.set_bundle('/app.js', {'/app.js': []})
+        self.assertEqual(self.graph.get_affected_bundles(['/lib/jquery.js']),
+                set(['/admin.js']))
+        graph = DependencyGraph(self.tmp).load()
+        self.assertEqual(graph.get_dependencies('/app.js'), set())
+
+    def test_edges_shared_between_bundles_are_kept(self):
+        self.graph.set_bundle('/app.js', {'/app.js': []})
+        # /admin.js still records plugin.js -> jquery.js
+        self.assertEqual(self.graph.get_direct_dependents('/lib/jquery.js'),
+                set(['/lib/plugin.js']))
+        self.graph.remove_bundle('/admin.js')
+        self.assertEqual(self.graph.get_dependents('/lib/jquery.js'), set())
+        self.assertEqual(self.graph.reverse_edges, {})
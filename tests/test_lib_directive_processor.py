@@ -1,5 +1,9 @@
 from __future__ import absolute_import, unicode_literals
 
+import os
+import shutil
+from io import StringIO
+import tempfile
 from unittest import TestCase
 from textwrap import dedent
 
@@ -9,6 +13,7 @@ except ImportError:
     from mock import patch
 
 from staticfilesplus.lib.directive_processor import DirectiveProcessor
+from staticfilesplus.lib.lru_cache import LRUCache
 
 def clean(s):
     return dedent(s.lstrip('\n')).rstrip()
@@ -99,6 +104,146 @@ class DirectiveProcessorTest(TestCase):
             more local
             some content
             """)+"\n")
+        stream = StringIO()
+        processor.write('test.js', stream)
+        self.assertEqual(stream.getvalue(), load('test.js'))
+        self.assertEqual(processor.edges, {
+            '/lib1/test.js': set(['/lib2/somelib.js', '/lib1/localfile.js']),
+            '/lib2/somelib.js': set(['/lib2/otherlib.js']),
+            '/lib2/otherlib.js': set(),
+            '/lib1/localfile.js': set(['/lib1/sub/morelocal.js', '/lib2/otherlib.js']),
+            '/lib1/sub/morelocal.js': set(),
+        })
 
+    def test_caches_parsed_files(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        def write(name, contents, mtime):
+            path = os.path.join(tmp, name)
+            with open(path, 'wb') as f:
+                f.write(clean(contents).encode('utf-8'))
+            os.utime(path, (mtime, mtime))
+        write('a.js', """
+            //= require lib
+            a
+            """, mtime=1000)
+        write('b.js', """
+            //= require lib
+            b
+            """, mtime=1000)
+        write('lib.js', 'lib', mtime=1000)
+        processor = DirectiveProcessor(load_paths=[tmp], cache=LRUCache(1024))
+        with patch.object(processor, 'get_file_contents',
+                wraps=processor.get_file_contents) as mock_get_file_contents:
+            processor.load(os.path.join(tmp, 'a.js'))
+            self.assertEqual(processor.load(os.path.join(tmp, 'b.js')), 'lib\nb')
+            self.assertEqual(mock_get_file_contents.call_count, 3)
+            # Changed files get read again
+            write('lib.js', 'new lib', mtime=2000)
+            self.assertEqual(processor.load(os.path.join(tmp, 'b.js')), 'new lib\nb')
+            self.assertEqual(mock_get_file_contents.call_count, 4)
 
+    def test_cache_sizes_are_in_bytes(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'a.js')
+        with open(path, 'wb') as f:
+            f.write('var caf\u00e9;'.encode('utf-8'))
+        os.utime(path, (1000, 1000))
+        cache = LRUCache(1024)
+        DirectiveProcessor(load_paths=[tmp], cache=cache).load(path)
+        self.assertEqual(cache.size, os.path.getsize(path))
 
+    def test_recently_modified_files_are_not_cached(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'a.js')
+        with open(path, 'wb') as f:
+            f.write(b'a')
+        cache = LRUCache(1024)
+        processor = DirectiveProcessor(load_paths=[tmp], cache=cache)
+        processor.load(path)
+        self.assertEqual(cache.size, 0)
+        os.utime(path, (1000, 1000))
+        processor.load(path)
+        self.assertEqual(cache.size, 1)
+
+    def test_load_with_supplied_contents(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with open(os.path.join(tmp, 'lib.js'), 'wb') as f:
+            f.write(b'lib')
+        path = os.path.join(tmp, 'main.js')
+        processor = DirectiveProcessor(load_paths=[tmp])
+        # main.js doesn't exist on disk, only its contents are supplied
+        self.assertEqual(processor.load(path, contents=b'//= require ./lib.js\nmain'),
+                'lib\nmain')
+        self.assertEqual(processor.edges, {
+            path: set([os.path.join(tmp, 'lib.js')]),
+            os.path.join(tmp, 'lib.js'): set(),
+        })
+
+    def test_load_with_supplied_requires(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        # Names which couldn't be written as directives
+        lib = os.path.join(tmp, 'jquery@3+ui.js')
+        with open(lib, 'wb') as f:
+            f.write(b'lib')
+        with open(os.path.join(tmp, 'other.js'), 'wb') as f:
+            f.write(b'other')
+        path = os.path.join(tmp, 'main.js')
+        processor = DirectiveProcessor(load_paths=[tmp])
+        self.assertEqual(processor.load(path, contents=b'//= require other\nmain',
+                                        requires=[lib]),
+                'lib\nother\nmain')
+        self.assertEqual(processor.included, [lib, os.path.join(tmp, 'other.js'), path])
+
+    def test_records_included_files_in_order(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        for name, contents in (('lib.js', b'lib'), ('stubbed.js', b'stubbed'),
+                               ('seen.js', b'seen')):
+            with open(os.path.join(tmp, name), 'wb') as f:
+                f.write(contents)
+        path = os.path.join(tmp, 'main.js')
+        processor = DirectiveProcessor(load_paths=[tmp])
+        output = processor.load(path, files_seen=set([os.path.join(tmp, 'seen.js')]),
+                contents=b'//= require lib\n//= stub stubbed\n//= require seen\nmain')
+        self.assertEqual(output, 'lib\nmain')
+        self.assertEqual(processor.included, [os.path.join(tmp, 'lib.js'), path])
+
+    @patch('staticfilesplus.lib.directive_processor.os.path.exists')
+    def test_file_finding_with_index(self, mock_os_exists):
+        # vendor is a symlink in lib1, which the index doesn't follow
+        mock_os_exists.side_effect = lambda path: path == '/home/lib1/vendor/linked.js'
+        class FileIndex(object):
+            def get_paths(self):
+                return frozenset(['/home/lib2/testfile.js', '/home/lib2/sub/other.js',
+                                  '/home/lib1/vendor', '/home/lib2/vendor/linked.js'])
+            def get_dirs(self):
+                return frozenset(['/home/lib1', '/home/lib2', '/home/lib2/sub',
+                                  '/home/lib2/vendor'])
+        processor = DirectiveProcessor(load_paths=['/home/lib1', '/home/lib2'],
+                file_index=FileIndex())
+        processor.indexed_files = processor.file_index.get_paths()
+        processor.indexed_dirs = processor.file_index.get_dirs()
+        self.assertEqual(processor.find_path('testfile', '/x.js'), '/home/lib2/testfile.js')
+        self.assertEqual(processor.find_path('./other.js', '/home/lib2/sub/x.js'),
+                '/home/lib2/sub/other.js')
+        # Neither hits nor misses under the indexed directories need a stat
+        self.assertRaises(DirectiveProcessor.DirectiveError,
+                processor.find_path, 'nodir/missing.js', '/x.js')
+        self.assertFalse(mock_os_exists.called)
+        # Earlier load paths take precedence, even through a symlink
+        self.assertEqual(processor.find_path('vendor/linked.js', '/x.js'),
+                '/home/lib1/vendor/linked.js')
+        # Paths outside the indexed directories are checked on disk
+        self.assertRaises(DirectiveProcessor.DirectiveError,
+                processor.find_path, '/elsewhere/x.js', '/x.js')
+        mock_os_exists.assert_called_with('/elsewhere/x.js')
+        # Missing files still report every location tried
+        with self.assertRaises(DirectiveProcessor.DirectiveError) as cm:
+            processor.find_path('missing.js', '')
+        self.assertIn('/home/lib1/missing.js', str(cm.exception))
+        self.assertIn('/home/lib2/missing.js', str(cm.exception))
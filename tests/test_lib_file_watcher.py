@@ -0,0 +1,55 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+import shutil
+import sys
+import tempfile
+from unittest import TestCase, skipIf
+
+from staticfilesplus.lib.file_watcher import InotifyWatcher, PollingWatcher
+
+
+class PollingWatcherTest(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.existing = self.write('existing.txt')
+        self.watcher = self.get_watcher()
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.tmp)
+
+    def get_watcher(self):
+        return PollingWatcher([self.tmp], interval=0.01)
+
+    def write(self, name, contents='text'):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as f:
+            f.write(contents)
+        return path
+
+    def test_reports_new_and_modified_files(self):
+        new = self.write('new.txt')
+        self.write('existing.txt', 'more text')
+        self.assertEqual(self.watcher.wait(timeout=1), set([new, self.existing]))
+
+    def test_reports_deleted_files(self):
+        os.remove(self.existing)
+        self.assertIn(self.existing, self.watcher.wait(timeout=1))
+
+    def test_reports_files_in_new_directories(self):
+        os.mkdir(os.path.join(self.tmp, 'dir'))
+        self.watcher.wait(timeout=0.1)
+        path = self.write(os.path.join('dir', 'new.txt'))
+        self.assertIn(path, self.watcher.wait(timeout=1))
+
+    def test_times_out_without_changes(self):
+        self.assertEqual(self.watcher.wait(timeout=0.05), set())
+
+
+@skipIf(not sys.platform.startswith('linux'), 'inotify is only available on Linux')
+class InotifyWatcherTest(PollingWatcherTest):
+
+    def get_watcher(self):
+        return InotifyWatcher([self.tmp])
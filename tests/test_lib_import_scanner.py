@@ -0,0 +1,82 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from staticfilesplus.lib.import_scanner import ImportScanner
+
+
+class ImportScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.load_path = os.path.join(self.tmp, 'lib')
+        os.mkdir(self.load_path)
+        self.scanner = ImportScanner([self.load_path], ('.scss', '.sass'),
+                                     partials=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, contents=''):
+        path = os.path.join(self.tmp, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(contents)
+        return path
+
+    def test_parse(self):
+        self.assertEqual(self.scanner.parse(
+            '@import "a", \'b\' screen;\n'
+            '@use "c" as d;\n'
+            '@import url(e);\n'
+            '/* @import "ignored"; */\n'
+            '// @import "also-ignored";\n'
+            '@import "plain.css";\n'
+            '@use "sass:math";\n'
+            '@import (reference) "f";'),
+            ['a', 'b', 'c', 'e', 'f'])
+
+    def test_interpolated_imports_are_unknown(self):
+        self.assertRaises(ImportScanner.UnknownImport,
+                self.scanner.parse, '@import "#{$theme}/vars";')
+
+    def test_scan_follows_partials_indexes_and_load_paths(self):
+        main = self.write('main.scss', '@import "partial"; @import "dir";')
+        partial = self.write('_partial.scss', '@import "library";')
+        index = self.write('dir/index.sass')
+        library = self.write('lib/library.scss')
+        self.assertEqual(self.scanner.scan(main), {
+            main: set([partial, index]),
+            partial: set([library]),
+            index: set(),
+            library: set(),
+        })
+
+    def test_partials_and_indexes_are_optional(self):
+        scanner = ImportScanner([self.load_path], ('.less',))
+        main = self.write('main.less', '@import "vars";')
+        self.write('_vars.less')
+        self.write('vars/index.less')
+        self.assertEqual(scanner.scan(main), None)
+        vars = self.write('vars.less')
+        self.assertEqual(scanner.scan(main), {main: set([vars]), vars: set()})
+
+    def test_scan_uses_supplied_contents(self):
+        main = self.write('main.scss', '@import "missing";')
+        self.assertEqual(self.scanner.scan(main, b'body {}'), {main: set()})
+
+    def test_recently_modified_files_are_not_cached(self):
+        main = self.write('main.scss', 'body {}')
+        self.scanner.scan(main)
+        self.assertNotIn(main, self.scanner.parsed)
+        os.utime(main, (1000, 1000))
+        self.scanner.scan(main)
+        self.assertIn(main, self.scanner.parsed)
+
+    def test_missing_imports_make_scan_fail(self):
+        main = self.write('main.scss', '@import "missing";')
+        self.assertEqual(self.scanner.scan(main), None)
@@ -0,0 +1,48 @@
+from __future__ import absolute_import, unicode_literals
+
+from unittest import TestCase
+
+from staticfilesplus.lib.lru_cache import LRUCache
+
+
+class LRUCacheTest(TestCase):
+
+    def test_get_and_set(self):
+        cache = LRUCache(10)
+        cache.set('a', 'value', size=5)
+        self.assertEqual(cache.get('a'), 'value')
+        self.assertEqual(cache.get('b'), None)
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(10)
+        cache.set('a', 1, size=4)
+        cache.set('b', 2, size=4)
+        cache.get('a')
+        cache.set('c', 3, size=4)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.size, 8)
+
+    def test_ignores_items_larger_than_cache(self):
+        cache = LRUCache(10)
+        cache.set('a', 1, size=4)
+        cache.set('b', 2, size=11)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b'), None)
+
+    def test_replacing_item_updates_size(self):
+        cache = LRUCache(10)
+        cache.set('a', 1, size=4)
+        cache.set('a', 2, size=6)
+        self.assertEqual(cache.size, 6)
+        self.assertEqual(len(cache), 1)
+
+    def test_shrinking_evicts_least_recently_used(self):
+        cache = LRUCache(10)
+        cache.set('a', 1, size=4)
+        cache.set('b', 2, size=4)
+        cache.resize(5)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual(cache.size, 4)
@@ -0,0 +1,107 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase, skipUnless
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from staticfilesplus.lib import stat_index
+from staticfilesplus.lib.stat_index import StatIndex, inotify_available
+
+
+class PollingStatIndexTest(TestCase):
+
+    use_inotify = False
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.write('a.less', mtime=1000)
+        self.write('ignored.txt', mtime=5000)
+        self.write('sub/b.less', mtime=2000)
+        self.index = StatIndex([self.tmp], '.less', use_inotify=self.use_inotify)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, mtime):
+        path = os.path.join(self.tmp, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(b'content')
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def get_files(self):
+        return dict((os.path.relpath(path, self.tmp), mtime)
+                    for path, mtime in self.index.get_files().items())
+
+    def test_indexes_matching_files(self):
+        self.assertEqual(self.get_files(), {'a.less': 1000, 'sub/b.less': 2000})
+        self.assertEqual(self.index.get_latest_mtime(), 2000)
+
+    def test_picks_up_modified_files(self):
+        self.get_files()
+        self.write('a.less', mtime=3000)
+        self.assertEqual(self.index.get_latest_mtime(), 3000)
+
+    def test_picks_up_new_files_and_directories(self):
+        self.get_files()
+        self.write('sub/new/c.less', mtime=4000)
+        self.assertEqual(self.get_files(),
+                {'a.less': 1000, 'sub/b.less': 2000, 'sub/new/c.less': 4000})
+
+    def test_picks_up_deleted_files_and_directories(self):
+        self.get_files()
+        os.remove(os.path.join(self.tmp, 'a.less'))
+        shutil.rmtree(os.path.join(self.tmp, 'sub'))
+        self.assertEqual(self.get_files(), {})
+        self.assertEqual(self.index.get_latest_mtime(), None)
+
+    def test_get_paths(self):
+        paths = self.index.get_paths()
+        self.assertEqual(paths, frozenset([os.path.join(self.tmp, 'a.less'),
+                                           os.path.join(self.tmp, 'sub/b.less')]))
+        # Modifying a file doesn't change the set of paths
+        self.write('a.less', mtime=3000)
+        self.assertIs(self.index.get_paths(), paths)
+        self.write('c.less', mtime=3000)
+        self.assertIn(os.path.join(self.tmp, 'c.less'), self.index.get_paths())
+
+    def test_get_dirs(self):
+        self.assertEqual(self.index.get_dirs(),
+                         frozenset([self.tmp, os.path.join(self.tmp, 'sub')]))
+        self.write('sub/new/c.less', mtime=4000)
+        self.assertIn(os.path.join(self.tmp, 'sub/new'), self.index.get_dirs())
+
+
+    def test_polling_is_rate_limited(self):
+        if self.use_inotify:
+            self.skipTest('only applies to polling')
+        index = StatIndex([self.tmp], '.less', use_inotify=False, poll_interval=60)
+        index.get_files()
+        self.write('c.less', mtime=3000)
+        with patch('os.stat') as mock_stat:
+            self.assertEqual(index.get_latest_mtime(), 2000)
+        self.assertFalse(mock_stat.called)
+        index.last_polled -= 60
+        self.assertEqual(index.get_latest_mtime(), 3000)
+
+
+@skipUnless(inotify_available(), 'inotify not available')
+class InotifyStatIndexTest(PollingStatIndexTest):
+
+    use_inotify = True
+
+
+class LibcLoadingTest(TestCase):
+
+    def test_inotify_unavailable_without_libc(self):
+        # As on Windows
+        with patch('ctypes.util.find_library', return_value=None):
+            self.assertEqual(stat_index._load_libc(), None)
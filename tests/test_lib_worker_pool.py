@@ -0,0 +1,58 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+import sys
+from unittest import TestCase
+
+from staticfilesplus.lib.worker_pool import WorkerPool, WorkerError, WorkerTimeout
+
+
+STUB_WORKER = [sys.executable, os.path.join(os.path.dirname(__file__), 'stub_worker.py')]
+
+
+class WorkerPoolTest(TestCase):
+
+    def setUp(self):
+        self.pool = WorkerPool(STUB_WORKER)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_runs_job(self):
+        self.assertEqual(self.pool.run(['--upper'], b'hello'), (0, b'HELLO', b''))
+
+    def test_reuses_worker(self):
+        first_pid = self.pool.run(['--pid'])[1]
+        self.assertEqual(self.pool.run(['--pid'])[1], first_pid)
+
+    def test_returns_failure_status(self):
+        self.assertEqual(self.pool.run(['--fail']), (1, b'', b'failed'))
+
+    def test_restarts_crashed_worker(self):
+        first_pid = self.pool.run(['--pid'])[1]
+        with self.assertRaises(WorkerError):
+            self.pool.run(['--crash'])
+        self.assertNotEqual(self.pool.run(['--pid'])[1], first_pid)
+
+    def test_fails_health_check(self):
+        pool = WorkerPool([sys.executable, '-c', 'pass'])
+        with self.assertRaises(WorkerError):
+            pool.run(['--upper'], b'hello')
+
+    def test_kills_worker_on_job_timeout(self):
+        pool = WorkerPool(STUB_WORKER, job_timeout=0.5)
+        try:
+            first_pid = pool.run(['--pid'])[1]
+            with self.assertRaises(WorkerTimeout):
+                pool.run(['--hang'])
+            self.assertNotEqual(pool.run(['--pid'])[1], first_pid)
+        finally:
+            pool.close()
+
+    def test_replaces_unresponsive_idle_worker(self):
+        pool = WorkerPool(STUB_WORKER, timeout=0.5)
+        try:
+            first_pid = pool.run(['--pid', '--hang-after'])[1]
+            self.assertNotEqual(pool.run(['--pid'])[1], first_pid)
+        finally:
+            pool.close()
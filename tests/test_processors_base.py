@@ -1,14 +1,23 @@
 from __future__ import absolute_import, unicode_literals
 
+import os
+import shutil
+import tempfile
 from unittest import TestCase
 
-from staticfilesplus.processors import BaseProcessor
+from staticfilesplus.processors import BaseProcessor, processes_content
 
 
 class TestProcessor(BaseProcessor):
     original_suffix = '.orig'
     processed_suffix = '.proc'
 
+
+class ContentTestProcessor(TestProcessor):
+
+    def process_content(self, content, input_path):
+        return content.upper()
+
 processor = TestProcessor()
 
 
@@ -29,3 +38,25 @@ class BaseProcessorTest(TestCase):
     def test_get_processed_ignores_unknown_file(self):
         self.assertEqual(processor.get_processed_name('otherfile.foo'),
                          None)
+
+
+class ProcessContentTest(TestCase):
+
+    def test_processes_content(self):
+        self.assertFalse(processes_content(processor))
+        self.assertTrue(processes_content(ContentTestProcessor()))
+
+    def test_process_file_falls_back_to_process_content(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        input_path = os.path.join(tmp, 'in.orig')
+        output_path = os.path.join(tmp, 'out.proc')
+        with open(input_path, 'wb') as f:
+            f.write(b'some text')
+        ContentTestProcessor().process_file(input_path, output_path)
+        with open(output_path, 'rb') as f:
+            self.assertEqual(f.read(), b'SOME TEXT')
+
+    def test_process_file_requires_an_implementation(self):
+        with self.assertRaises(NotImplementedError):
+            processor.process_file('in.orig', 'out.proc')
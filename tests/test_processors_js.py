@@ -0,0 +1,205 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from django.utils.six import StringIO
+from django.test.utils import override_settings
+
+from staticfilesplus.management.commands.jschunks import Command
+from staticfilesplus.processors import js
+from staticfilesplus.processors.js import JavaScriptProcessor
+from staticfilesplus.utils import clear_staticfiles_dirs
+
+from .utils import BaseStaticfilesPlusTest
+
+
+@override_settings(
+    STATICFILESPLUS_PROCESSORS=('staticfilesplus.processors.js.JavaScriptProcessor',),
+    STATICFILESPLUS_JS_COMPRESS=False)
+class JavaScriptProcessorTest(BaseStaticfilesPlusTest):
+
+    def setUp(self):
+        super(JavaScriptProcessorTest, self).setUp()
+        self.static_dir = settings.STATICFILES_DIRS[0]
+        with open(os.path.join(self.static_dir, 'lib.js'), 'wb') as f:
+            f.write(b'var lib;')
+
+    def test_process_content(self):
+        path = os.path.join(self.static_dir, 'app.js')
+        output = JavaScriptProcessor().process_content(
+                b'//= require lib.js\nvar app;', path)
+        self.assertEqual(output, b'var lib;\nvar app;')
+
+    def test_process_content_renders_templates(self):
+        path = os.path.join(self.static_dir, 'config.djtmpl.js')
+        output = JavaScriptProcessor().process_content(
+                b'var url = "{{ settings.STATIC_URL }}";', path)
+        self.assertEqual(output, 'var url = "{}";'.format(settings.STATIC_URL).encode('utf-8'))
+
+
+class TemplateCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        js._template_cache = None
+
+    def tearDown(self):
+        js._template_cache = None
+
+    def count_compilations(self):
+        return patch('staticfilesplus.processors.js.get_template_from_string',
+                wraps=js.get_template_from_string)
+
+    @override_settings(STATICFILESPLUS_JS_CONTEXT={'name': 'a'},
+                       STATICFILESPLUS_JS_CACHE_TEMPLATE_OUTPUT=True)
+    def test_compiles_and_renders_once(self):
+        with self.count_compilations() as mock_compile:
+            self.assertEqual(js.render_template('{{ name }}'), 'a')
+            self.assertEqual(js.render_template('{{ name }}'), 'a')
+        self.assertEqual(mock_compile.call_count, 1)
+        self.assertEqual(len(js._template_cache), 2)
+
+    @override_settings(STATICFILESPLUS_JS_CACHE_TEMPLATE_OUTPUT=True)
+    def test_rerenders_when_context_changes(self):
+        with self.count_compilations() as mock_compile:
+            with override_settings(STATICFILESPLUS_JS_CONTEXT={'name': 'a'}):
+                self.assertEqual(js.render_template('{{ name }}'), 'a')
+            with override_settings(STATICFILESPLUS_JS_CONTEXT={'name': 'b'}):
+                self.assertEqual(js.render_template('{{ name }}'), 'b')
+        # The compiled template is still reused
+        self.assertEqual(mock_compile.call_count, 1)
+
+    @override_settings(STATICFILESPLUS_JS_CACHE_TEMPLATE_OUTPUT=True)
+    def test_rerenders_when_settings_change(self):
+        with override_settings(SOME_TITLE='a'):
+            self.assertEqual(js.render_template('{{ settings.SOME_TITLE }}'), 'a')
+        with override_settings(SOME_TITLE='b'):
+            self.assertEqual(js.render_template('{{ settings.SOME_TITLE }}'), 'b')
+
+    def test_output_is_not_cached_by_default(self):
+        with patch('django.template.base.Template.render', autospec=True,
+                   return_value='output') as mock_render:
+            js.render_template('{{ name }}')
+            js.render_template('{{ name }}')
+        self.assertEqual(mock_render.call_count, 2)
+
+    @override_settings(STATICFILESPLUS_JS_CACHE_TEMPLATE_OUTPUT=True)
+    def test_sizes_are_counted_in_bytes(self):
+        js.render_template('\u00e9{{ name }}')
+        # The template source and its rendered output
+        self.assertEqual(js._template_cache.size, len('\u00e9{{ name }}'.encode('utf-8')) +
+                         len('\u00e9'.encode('utf-8')))
+
+    @override_settings(STATICFILESPLUS_JS_TEMPLATE_CACHE_SIZE=0)
+    def test_cache_can_be_disabled(self):
+        js.render_template('{{ name }}')
+        self.assertEqual(js._template_cache, None)
+
+
+class FindSharedModulesTest(SimpleTestCase):
+
+    def test_finds_modules_in_enough_bundles_in_dependency_order(self):
+        bundles = {
+            'a.js': ['jquery.js', 'plugin.js', 'a-only.js', 'a.js'],
+            'b.js': ['jquery.js', 'plugin.js', 'b.js'],
+            'c.js': ['jquery.js', 'c.js'],
+        }
+        self.assertEqual(js.find_shared_modules(bundles), ['jquery.js', 'plugin.js'])
+        self.assertEqual(js.find_shared_modules(bundles, min_bundles=3), ['jquery.js'])
+
+    def test_never_shares_bundles(self):
+        bundles = {
+            'a.js': ['a.js'],
+            'b.js': ['a.js', 'b.js'],
+            'c.js': ['a.js', 'c.js'],
+        }
+        self.assertEqual(js.find_shared_modules(bundles), [])
+
+
+@override_settings(
+    STATICFILESPLUS_PROCESSORS=('staticfilesplus.processors.js.JavaScriptProcessor',),
+    STATICFILESPLUS_JS_COMPRESS=False)
+class SharedChunkTest(BaseStaticfilesPlusTest):
+
+    def setUp(self):
+        super(SharedChunkTest, self).setUp()
+        self.static_dir = self.make_static_dir()
+        self.write('_lib/core.js', 'var core;')
+        self.write('_lib/plugin.js', '//= require ./core\nvar plugin;')
+        self.write('a.js', '//= require _lib/plugin\nvar a;')
+        self.write('b.js', '//= require _lib/core\nvar b;')
+        self.write('c.js', 'var c;')
+
+    def make_static_dir(self):
+        return settings.STATICFILES_DIRS[0]
+
+    def write(self, name, contents):
+        path = os.path.join(self.static_dir, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(contents)
+
+    def read(self, name):
+        with open(finders.find(name), 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def run_command(self, **extra_options):
+        stdout = StringIO()
+        command = Command()
+        options = dict((option.dest, option.default) for option in command.option_list
+                       if option.dest)
+        options.update(stdout=stdout, **extra_options)
+        command.execute(**options)
+        return stdout.getvalue()
+
+    def test_moves_shared_files_into_chunk(self):
+        self.assertEqual(self.read('a.js'), 'var core;\nvar plugin;\nvar a;')
+        output = self.run_command()
+        self.assertIn('common.js: 1 files, 10 bytes', output)
+        self.assertIn('saving 10 bytes', output)
+        self.assertEqual(self.read('common.js'), 'var core;\n')
+        self.assertEqual(self.read('a.js'), 'var plugin;\nvar a;')
+        self.assertEqual(self.read('b.js'), 'var b;')
+        self.assertEqual(self.read('c.js'), 'var c;')
+        self.run_command(clear=True)
+        self.assertEqual(finders.find('common.js'), None)
+        self.assertEqual(self.read('a.js'), 'var core;\nvar plugin;\nvar a;')
+
+    def test_find_cache_follows_chunk_plan(self):
+        # A long-lived finder, as under runserver
+        finder = finders.get_finder('staticfilesplus.finders.FileSystemFinder')
+        self.assertFalse(finder.find('common.js'))
+        self.run_command()
+        self.assertTrue(finder.find('common.js'))
+        self.run_command(clear=True)
+        self.assertFalse(finder.find('common.js'))
+
+    def test_dry_run_changes_nothing(self):
+        self.assertIn('saving 10 bytes', self.run_command(dry_run=True))
+        self.assertEqual(finders.find('common.js'), None)
+
+    def test_chunk_is_collected(self):
+        self.run_command()
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(settings.STATIC_ROOT, 'common.js'), 'rb') as f:
+            self.assertEqual(f.read(), b'var core;\n')
+
+
+class SharedChunkUnusualPathsTest(SharedChunkTest):
+
+    def make_static_dir(self):
+        # A path which couldn't be written in a require directive
+        static_dir = os.path.join(self.tmp_dir(), 'my+app@3')
+        os.makedirs(static_dir)
+        settings.STATICFILES_DIRS = (static_dir,)
+        clear_staticfiles_dirs()
+        return static_dir
@@ -1,21 +1,40 @@
 from __future__ import absolute_import, unicode_literals
 
+import os
+import pickle
+import shutil
+import tempfile
+from multiprocessing.pool import ThreadPool
+
 try:
     from unittest.mock import patch
 except ImportError:
     from mock import patch
 
+from django.conf import settings
 from django.test import SimpleTestCase
 from django.test.utils import override_settings
 
 from staticfilesplus.processors.less import LESSProcessor
 
+from .utils import BaseStaticfilesPlusTest
+
 
 @override_settings(
         STATICFILES_DIRS=('/dev/null', '/dev/zero'),
         STATICFILESPLUS_LESS_COMPRESS=False)
 class LESSProcessorTest(SimpleTestCase):
 
+    def setUp(self):
+        # Keep the import graph out of the working directory
+        self.tmp = tempfile.mkdtemp()
+        self.tmp_settings = override_settings(STATICFILESPLUS_TMP_DIR=self.tmp)
+        self.tmp_settings.enable()
+
+    def tearDown(self):
+        self.tmp_settings.disable()
+        shutil.rmtree(self.tmp)
+
     @patch('staticfilesplus.processors.less.call_command', autospec=True)
     def test_calls_out_to_lessc(self, mock_call_command):
         LESSProcessor().process_file('inpath', 'outpath')
@@ -29,6 +48,15 @@ class LESSProcessorTest(SimpleTestCase):
         self.assertEqual(mock_call_command.call_args[0][0],
                 ['lessc', '--include-path=/dev/null:/dev/zero', '--compress', 'inpath', 'outpath'])
 
+    @patch('staticfilesplus.processors.less.call_command', autospec=True)
+    def test_process_content_uses_stdin_and_stdout(self, mock_call_command):
+        mock_call_command.return_value = b'output'
+        output = LESSProcessor().process_content(b'input', '/some/dir/in.less')
+        self.assertEqual(output, b'output')
+        self.assertEqual(mock_call_command.call_args[0][0],
+                ['lessc', '--include-path=/some/dir:/dev/null:/dev/zero', '-'])
+        self.assertEqual(mock_call_command.call_args[1]['input'], b'input')
+
     def test_ignores_paths_with_underscores(self):
         processor = LESSProcessor()
         self.assertTrue(processor.is_ignored_file('_dir/path/file'))
@@ -38,3 +66,79 @@ class LESSProcessorTest(SimpleTestCase):
         processor = LESSProcessor()
         self.assertFalse(processor.is_ignored_file('dir_/path/file'))
         self.assertFalse(processor.is_ignored_file('dir/path_sep/file'))
+
+
+class LESSImportTrackingTest(BaseStaticfilesPlusTest):
+
+    def setUp(self):
+        super(LESSImportTrackingTest, self).setUp()
+        self.source_dir = settings.STATICFILES_DIRS[0]
+        self.debug_settings = override_settings(DEBUG=True,
+                STATICFILESPLUS_LESS_COMPRESS=False,
+                STATICFILESPLUS_PROCESSORS=('staticfilesplus.processors.less.LESSProcessor',))
+        self.debug_settings.enable()
+        self.main = self.write('main.less', '@import "_vars";\n// @import "commented";\nbody {}')
+        self.vars = self.write('_vars.less', '@colour: red;')
+        self.other = self.write('other.less', 'p {}')
+        self.output = os.path.join(settings.STATIC_ROOT, 'main.css')
+
+    def tearDown(self):
+        self.debug_settings.disable()
+
+    def write(self, name, contents, mtime=1000):
+        path = os.path.join(self.source_dir, name)
+        with open(path, 'w') as f:
+            f.write(contents)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def process(self):
+        with patch('staticfilesplus.processors.less.call_command', autospec=True) as mock:
+            LESSProcessor().process_file(self.main, self.output)
+            if mock.called:
+                with open(self.output, 'w') as f:
+                    f.write('output')
+                os.utime(self.output, (2000, 2000))
+            return mock.called
+
+    def test_dependencies_are_only_the_imported_files(self):
+        self.process()
+        self.assertEqual(LESSProcessor().get_dependencies(self.main), [self.vars])
+
+    def test_dependencies_fall_back_to_every_file_when_unknown(self):
+        self.assertEqual(sorted(LESSProcessor().get_dependencies(self.main)),
+                sorted([self.main, self.vars, self.other]))
+
+    def test_only_rebuilds_when_an_import_changes(self):
+        self.assertTrue(self.process())
+        self.assertFalse(self.process())
+        self.write('other.less', 'p { }', mtime=3000)
+        self.assertFalse(self.process())
+        self.write('_vars.less', '@colour: blue;', mtime=3000)
+        self.assertTrue(self.process())
+
+    def test_imports_are_not_resolved_to_partials(self):
+        # Unlike Sass, LESS doesn't look for "_vars.less"
+        self.write('main.less', '@import "vars";')
+        self.process()
+        self.assertEqual(len(LESSProcessor().get_dependencies(self.main)), 3)
+
+    def test_unresolvable_imports_are_not_recorded(self):
+        self.write('main.less', '@import "@{theme}/vars";')
+        self.process()
+        self.assertEqual(len(LESSProcessor().get_dependencies(self.main)), 3)
+
+    def test_threads_share_one_import_graph(self):
+        processor = LESSProcessor()
+        pool = ThreadPool(8)
+        try:
+            graphs = pool.map(lambda _: processor.get_import_graph(), range(32))
+        finally:
+            pool.terminate()
+            pool.join()
+        self.assertEqual(len(set(id(graph) for graph in graphs)), 1)
+
+    def test_unpickled_processor_has_a_lock(self):
+        processor = pickle.loads(pickle.dumps(LESSProcessor()))
+        self.process()
+        self.assertEqual(processor.get_dependencies(self.main), [self.vars])
@@ -0,0 +1,116 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.test.utils import override_settings
+
+from staticfilesplus.processors import BaseProcessor
+from staticfilesplus.processors.pipeline import Pipeline
+
+from .utils import BaseStaticfilesPlusTest
+
+
+class CountingStage(BaseProcessor):
+    calls = 0
+
+    def process_content(self, content, input_path):
+        type(self).calls += 1
+        return self.transform(content)
+
+    def get_dependencies(self, input_path):
+        return []
+
+
+class UpperStage(CountingStage):
+    original_suffix = '.txt'
+    processed_suffix = '.upper'
+
+    def transform(self, content):
+        return content.upper()
+
+
+class ReverseStage(CountingStage):
+    original_suffix = '.upper'
+    processed_suffix = '.reversed'
+    settings_names = ('TEST_REVERSE_SETTING',)
+
+    def transform(self, content):
+        return content[::-1]
+
+
+class GraphStage(UpperStage):
+    """
+    Like the bundler, only knows its dependencies once it has run
+    """
+
+    def process_content(self, content, input_path):
+        self.seen = [input_path + '.dep']
+        return super(GraphStage, self).process_content(content, input_path)
+
+    def get_dependencies(self, input_path):
+        return getattr(self, 'seen', None)
+
+
+class FileStage(BaseProcessor):
+    """
+    A stage which only knows how to work with files
+    """
+    original_suffix = '.reversed'
+    processed_suffix = '.final'
+
+    def process_file(self, input_path, output_path):
+        with open(input_path, 'rb') as in_file:
+            with open(output_path, 'wb') as out_file:
+                out_file.write(b'[' + in_file.read() + b']')
+
+
+@override_settings(
+    STATICFILESPLUS_PROCESSORS=(
+        ('tests.test_processors_pipeline.UpperStage',
+         'tests.test_processors_pipeline.ReverseStage',
+         'tests.test_processors_pipeline.FileStage'),
+    )
+)
+class PipelineTest(BaseStaticfilesPlusTest):
+
+    def setUp(self):
+        super(PipelineTest, self).setUp()
+        self.pipeline = Pipeline([UpperStage(), ReverseStage(), FileStage()])
+        self.input_path = os.path.join(settings.STATICFILES_DIRS[0], 'test.txt')
+        with open(self.input_path, 'wb') as f:
+            f.write(b'abc')
+        UpperStage.calls = ReverseStage.calls = 0
+
+    def test_names(self):
+        self.assertEqual(self.pipeline.get_processed_name('a/test.txt'), 'a/test.final')
+        self.assertEqual(self.pipeline.get_original_name('a/test.final'), 'a/test.txt')
+        self.assertEqual(self.pipeline.get_original_name('a/test.upper'), None)
+
+    def test_process_content_runs_each_stage(self):
+        self.assertEqual(self.pipeline.process_content(b'abc', self.input_path), b'[CBA]')
+
+    def test_finder_builds_pipeline_from_settings(self):
+        with open(finders.find('test.final'), 'rb') as f:
+            self.assertEqual(f.read(), b'[CBA]')
+
+    def test_stages_are_cached_separately(self):
+        self.pipeline.process_content(b'abc', self.input_path)
+        self.assertEqual((UpperStage.calls, ReverseStage.calls), (1, 1))
+        self.pipeline.process_content(b'abc', self.input_path)
+        self.assertEqual((UpperStage.calls, ReverseStage.calls), (1, 1))
+        # Changing a later stage's settings doesn't re-run earlier stages
+        with override_settings(TEST_REVERSE_SETTING=True):
+            self.pipeline.process_content(b'abc', self.input_path)
+        self.assertEqual((UpperStage.calls, ReverseStage.calls), (1, 2))
+
+    def test_dependencies_of_cached_stages_are_known(self):
+        GraphStage.calls = 0
+        Pipeline([GraphStage(), ReverseStage()]).process_content(b'abc', self.input_path)
+        # As if in a new process, with nothing held in memory
+        pipeline = Pipeline([GraphStage(), ReverseStage()])
+        pipeline.process_content(b'abc', self.input_path)
+        self.assertEqual(GraphStage.calls, 1)
+        self.assertEqual(pipeline.get_dependencies(self.input_path),
+                         [self.input_path + '.dep'])
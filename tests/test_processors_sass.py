@@ -0,0 +1,37 @@
+from __future__ import absolute_import, unicode_literals
+
+import shutil
+import tempfile
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from staticfilesplus.processors.sass import SassProcessor
+
+
+@override_settings(
+        STATICFILES_DIRS=('/dev/null', '/dev/zero'),
+        STATICFILESPLUS_SASS_COMPRESS=False)
+class SassProcessorTest(SimpleTestCase):
+
+    def setUp(self):
+        # Keep the import graph out of the working directory
+        self.tmp = tempfile.mkdtemp()
+        self.tmp_settings = override_settings(STATICFILESPLUS_TMP_DIR=self.tmp)
+        self.tmp_settings.enable()
+
+    def tearDown(self):
+        self.tmp_settings.disable()
+        shutil.rmtree(self.tmp)
+
+    @patch('staticfilesplus.processors.sass.call_command', autospec=True)
+    def test_compiles_batch_in_one_call(self, mock_call_command):
+        SassProcessor().process_files([('in1', 'out1'), ('in2', 'out2')])
+        self.assertEqual(mock_call_command.call_args[0][0],
+                ['sass', '--load-path', '/dev/null:/dev/zero', '--update',
+                 'in1:out1', 'in2:out2'])
@@ -0,0 +1,139 @@
+from __future__ import absolute_import, unicode_literals
+
+import json
+import os
+import sys
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+
+from staticfilesplus.lib.directive_processor import DirectiveProcessor
+from staticfilesplus.lib.lru_cache import LRUCache
+from staticfilesplus.management.commands.collectstatic import Command
+from staticfilesplus.stats import StatsCollector
+from staticfilesplus.utils import call_command, get_subprocess_time
+
+from .test_lib_worker_pool import STUB_WORKER
+from .tests_functional import SimpleTestProcessor, AnotherTestProcessor
+from .utils import BaseStaticfilesPlusTest
+
+
+class CacheableTestProcessor(SimpleTestProcessor):
+
+    def get_dependencies(self, input_path):
+        return []
+
+
+class CommandTestProcessor(AnotherTestProcessor):
+
+    def process_file(self, input_path, output_path):
+        call_command([sys.executable, '-c', 'pass'])
+        super(CommandTestProcessor, self).process_file(input_path, output_path)
+
+
+@override_settings(
+    STATICFILESPLUS_PROCESSORS=(
+        CacheableTestProcessor,
+        AnotherTestProcessor
+    )
+)
+class StatsTest(BaseStaticfilesPlusTest):
+
+    def setUp(self):
+        super(StatsTest, self).setUp()
+        self.static_dir = settings.STATICFILES_DIRS[0]
+        for name in ('test.original', 'test.another'):
+            with open(os.path.join(self.static_dir, name), 'wb') as f:
+                f.write(b'some text')
+
+    def test_find_sends_file_processed(self):
+        with StatsCollector() as collector:
+            finders.find('test.processed')
+            finders.find('test.processed')
+        first, second = collector.files
+        self.assertEqual(first['processor'], 'tests.test_stats.CacheableTestProcessor')
+        self.assertEqual(first['input_path'], os.path.join(self.static_dir, 'test.original'))
+        self.assertEqual(first['bytes_in'], len(b'some text'))
+        self.assertEqual(first['bytes_out'], len(b'processed\nsome text'))
+        self.assertFalse(first['cache_hit'])
+        self.assertTrue(second['cache_hit'])
+
+    @override_settings(STATICFILESPLUS_BUILD_CACHE=False)
+    def test_dependencies_not_needed_without_build_cache(self):
+        with patch.object(CacheableTestProcessor, 'get_dependencies') as mock_get_dependencies:
+            with StatsCollector() as collector:
+                finders.find('test.processed')
+        self.assertFalse(mock_get_dependencies.called)
+        self.assertEqual(collector.files[0]['dependency_count'], None)
+
+    @override_settings(STATICFILESPLUS_WORKERS=2)
+    def test_parallel_list_sends_file_processed_in_this_process(self):
+        with StatsCollector() as collector:
+            list(finders.get_finder('staticfilesplus.finders.FileSystemFinder').list([]))
+        totals = collector.get_processor_totals()
+        # AnotherTestProcessor runs in a separate process
+        self.assertEqual(totals['tests.tests_functional.AnotherTestProcessor']['files'], 1)
+        self.assertEqual(totals['tests.test_stats.CacheableTestProcessor']['files'], 1)
+
+    @override_settings(STATICFILESPLUS_WORKERS=2,
+                       STATICFILESPLUS_PROCESSORS=(CommandTestProcessor,))
+    def test_parallel_list_relays_signals_from_worker_processes(self):
+        with StatsCollector() as collector:
+            list(finders.get_finder('staticfilesplus.finders.FileSystemFinder').list([]))
+        self.assertEqual([command['command'] for command in collector.commands],
+                         [sys.executable])
+        self.assertNotIn('signals', collector.files[0])
+
+    def test_collectstatic_prints_summary_and_writes_json(self):
+        json_path = os.path.join(self.tmp_dir(), 'stats.json')
+        stdout = StringIO()
+        command = Command()
+        options = dict((option.dest, option.default) for option in command.option_list
+                       if option.dest)
+        options.update(interactive=False, verbosity=1, stdout=stdout,
+                stats=True, stats_top=1, stats_json=json_path)
+        command.execute(**options)
+        self.assertIn('Slowest 1 files:', stdout.getvalue())
+        self.assertIn('CacheableTestProcessor: 1 files', stdout.getvalue())
+        with open(json_path) as f:
+            stats = json.load(f)
+        self.assertEqual(len(stats['files']), 2)
+
+
+class CommandStatsTest(BaseStaticfilesPlusTest):
+
+    def test_call_command_sends_command_called(self):
+        start = get_subprocess_time()
+        with StatsCollector() as collector:
+            call_command(['tool', '--upper'], input=b'hello', worker=STUB_WORKER)
+        self.assertEqual(collector.commands, [{'command': 'tool', 'worker': True,
+            'duration': collector.commands[0]['duration'], 'bytes_in': 5, 'bytes_out': 5}])
+        self.assertGreater(get_subprocess_time(), start)
+
+
+class DirectiveProcessorStatsTest(BaseStaticfilesPlusTest):
+
+    def test_file_loaded_hook_reports_cache_hits(self):
+        loaded = []
+
+        class RecordingDirectiveProcessor(DirectiveProcessor):
+            def file_loaded(self, path, duration, size, cache_hit):
+                loaded.append((path, size, cache_hit))
+
+        path = os.path.join(self.tmp_dir(), 'test.js')
+        with open(path, 'wb') as f:
+            f.write('var caf\u00e9;'.encode('utf-8'))
+        # Recently modified files aren't cached
+        os.utime(path, (1000, 1000))
+        processor = RecordingDirectiveProcessor(cache=LRUCache(1024))
+        processor.load(path)
+        processor.load(path)
+        # Sizes are in bytes whether or not the file came from the cache
+        self.assertEqual(loaded, [(path, 10, False), (path, 10, True)])
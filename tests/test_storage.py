@@ -0,0 +1,179 @@
+from __future__ import absolute_import, unicode_literals
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from django.test.utils import override_settings
+from django.conf import settings
+from django.contrib.staticfiles import storage
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+
+from staticfilesplus import storage as plus_storage
+from staticfilesplus.lib.stat_index import StatIndex
+from staticfilesplus.storage import MmapFileCache, CachedStaticFilesPlusStorage
+
+from .utils import BaseStaticfilesPlusTest
+
+
+@override_settings(
+    STATICFILESPLUS_PROCESSORS=(),
+    STATICFILES_STORAGE='staticfilesplus.storage.CachedStaticFilesPlusStorage',
+    STATICFILESPLUS_PRECOMPRESS=('gzip',),
+    STATICFILESPLUS_PRECOMPRESS_MIN_SIZE=100,
+)
+class PrecompressTest(BaseStaticfilesPlusTest):
+
+    def write_contents(self, name, contents):
+        with open(os.path.join(settings.STATICFILES_DIRS[0], name), 'wb') as f:
+            f.write(contents.encode('utf8'))
+
+    def collectstatic(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(settings.STATIC_ROOT, 'static_manifest.json'), 'rb') as f:
+            return json.loads(f.read().decode('utf8'))
+
+    def test_writes_compressed_files(self):
+        contents = 'body { color: red; }\n' * 20
+        self.write_contents('styles.css', contents)
+        manifest = self.collectstatic()
+        hashed_name = manifest['styles.css']
+        self.assertEqual(manifest['styles.css.gz'], hashed_name + '.gz')
+        path = os.path.join(settings.STATIC_ROOT, hashed_name + '.gz')
+        with gzip.open(path, 'rb') as f:
+            self.assertEqual(f.read().decode('utf8'), contents)
+
+    def test_skips_small_files(self):
+        self.write_contents('small.css', 'p {}')
+        manifest = self.collectstatic()
+        self.assertNotIn('small.css.gz', manifest)
+
+    @override_settings(STATICFILESPLUS_PRECOMPRESS_MIN_SAVING=0.99)
+    def test_skips_files_with_insufficient_saving(self):
+        self.write_contents('styles.css', 'body { color: red; }\n' * 20)
+        manifest = self.collectstatic()
+        self.assertNotIn('styles.css.gz', manifest)
+
+    def test_skips_up_to_date_files(self):
+        self.write_contents('styles.css', 'body { color: red; }\n' * 20)
+        manifest = self.collectstatic()
+        path = os.path.join(settings.STATIC_ROOT, manifest['styles.css.gz'])
+        os.utime(path, (2000000000, 2000000000))
+        self.collectstatic()
+        self.assertEqual(os.path.getmtime(path), 2000000000)
+
+
+class MmapFileCacheTest(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.tmp, 'manifest.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_missing_file_is_empty(self):
+        self.assertEqual(MmapFileCache(self.cache_file).get('a.css'), None)
+
+    def test_values_are_persisted(self):
+        values = dict(('file{}.css'.format(n), 'file{}.abc123.css'.format(n))
+                      for n in range(100))
+        values['caf\xe9.css'] = 'caf\xe9.abc123.css'
+        cache = MmapFileCache(self.cache_file)
+        cache.set('extra.js', 'extra.def456.js')
+        cache.set_many(values)
+        cache = MmapFileCache(self.cache_file)
+        for key, value in values.items():
+            self.assertEqual(cache.get(key), value)
+        self.assertEqual(cache.get('extra.js'), 'extra.def456.js')
+        self.assertEqual(cache.get('missing.css'), None)
+        self.assertEqual(cache.get('missing.css', 'default'), 'default')
+
+    def test_set_many_merges_with_existing_values(self):
+        MmapFileCache(self.cache_file).set_many({'a.css': 'a.1.css', 'b.css': 'b.1.css'})
+        MmapFileCache(self.cache_file).set_many({'b.css': 'b.2.css'})
+        cache = MmapFileCache(self.cache_file)
+        self.assertEqual(dict(cache.items()), {'a.css': 'a.1.css', 'b.css': 'b.2.css'})
+
+
+@override_settings(
+    STATICFILESPLUS_PROCESSORS=(),
+    STATICFILES_STORAGE='staticfilesplus.storage.CachedStaticFilesPlusStorage',
+    STATICFILESPLUS_MANIFEST_FORMAT='binary',
+)
+class BinaryManifestTest(BaseStaticfilesPlusTest):
+
+    def test_collectstatic_writes_binary_manifest(self):
+        with open(os.path.join(settings.STATICFILES_DIRS[0], 'styles.css'), 'wb') as f:
+            f.write(b'p {}')
+        call_command('collectstatic', interactive=False, verbosity=0)
+        cache = MmapFileCache(os.path.join(settings.STATIC_ROOT, 'static_manifest.bin'))
+        self.assertEqual(cache.get('styles.css'), 'styles.c3ee3d7a4380.css')
+        self.assertEqual(storage.staticfiles_storage.url('styles.css'),
+                '/styles.c3ee3d7a4380.css')
+
+
+@override_settings(
+    STATICFILESPLUS_PROCESSORS=('tests.test_cache.CountingProcessor',),
+    STATICFILES_STORAGE='staticfilesplus.storage.CachedStaticFilesPlusStorage',
+)
+class HashingTest(BaseStaticfilesPlusTest):
+
+    def write_contents(self, name, contents):
+        with open(os.path.join(settings.STATICFILES_DIRS[0], name), 'wb') as f:
+            f.write(contents)
+
+    def collectstatic(self):
+        """
+        Returns the manifest and the number of files which had to be read
+        to hash them
+        """
+        with patch.object(plus_storage, 'get_digest',
+                          wraps=plus_storage.get_digest) as get_digest:
+            call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(settings.STATIC_ROOT, 'static_manifest.json'), 'rb') as f:
+            return json.loads(f.read().decode('utf8')), get_digest.call_count
+
+    @override_settings(STATICFILESPLUS_HASH_ALGORITHM='sha1')
+    def test_uses_configured_algorithm(self):
+        self.write_contents('styles.css', b'p {}')
+        manifest, reads = self.collectstatic()
+        self.assertEqual(manifest['styles.css'], 'styles.{}.css'.format(
+            hashlib.sha1(b'p {}').hexdigest()[:12]))
+
+    @override_settings(STATICFILESPLUS_HASH_ALGORITHM='not-an-algorithm')
+    def test_unknown_algorithm_is_an_error(self):
+        self.assertRaises(ImproperlyConfigured, CachedStaticFilesPlusStorage)
+
+    def test_reuses_digests_from_processing(self):
+        self.write_contents('data.in', b'input')
+        manifest, reads = self.collectstatic()
+        self.assertEqual(manifest['data.out'], 'data.{}.out'.format(
+            hashlib.md5(b'output').hexdigest()[:12]))
+        self.assertEqual(reads, 0)
+
+    # The files are only just written, so would otherwise be too recent to
+    # remember digests for
+    @patch.object(StatIndex, 'RACY_INTERVAL', 0)
+    def test_unchanged_files_are_not_read_again(self):
+        self.write_contents('styles.css', b'body { background: url("img.png"); }')
+        self.write_contents('img.png', b'image')
+        manifest, reads = self.collectstatic()
+        # Each file is only read once, even though img.png is needed when
+        # rewriting styles.css as well as in its own right
+        self.assertEqual(reads, 2)
+        self.write_contents('img.png', b'changed image')
+        second_manifest, reads = self.collectstatic()
+        self.assertEqual(reads, 1)
+        self.assertEqual(second_manifest['styles.css'], manifest['styles.css'])
+        self.assertNotEqual(second_manifest['img.png'], manifest['img.png'])
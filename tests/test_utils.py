@@ -0,0 +1,94 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+import shutil
+import stat
+import sys
+import tempfile
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.finders import get_finders
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from staticfilesplus.utils import (call_command, CalledProcessError,
+        get_staticfiles_dirs, clear_staticfiles_dirs, write_atomic)
+
+from .test_lib_worker_pool import STUB_WORKER
+
+
+class CallCommandWorkerTest(SimpleTestCase):
+
+    def test_sends_job_to_worker(self):
+        output = call_command(['tool', '--upper'], input=b'hello', worker=STUB_WORKER)
+        self.assertEqual(output, b'HELLO')
+
+    def test_raises_error_on_failure(self):
+        with self.assertRaises(CalledProcessError) as cm:
+            call_command(['tool', '--fail'], worker=STUB_WORKER)
+        self.assertEqual(cm.exception.returncode, 1)
+        self.assertEqual(cm.exception.output, b'failed')
+
+    def test_runs_command_where_workers_unsupported(self):
+        with patch('staticfilesplus.lib.worker_pool.is_supported', return_value=False):
+            output = call_command([sys.executable, '-c', 'print("not a worker")'],
+                    worker=STUB_WORKER)
+        self.assertEqual(output.strip(), b'not a worker')
+
+
+class StaticfilesDirsTest(SimpleTestCase):
+
+    def setUp(self):
+        clear_staticfiles_dirs()
+        # Django memoizes finders, so we'd never see new settings
+        self.patcher = patch.object(finders, 'get_finder', finders._get_finder)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        clear_staticfiles_dirs()
+
+    @override_settings(STATICFILES_DIRS=('/dev/null',))
+    def test_dirs_are_only_found_once(self):
+        with patch('staticfilesplus.utils.get_finders', wraps=get_finders) as mock:
+            self.assertEqual(get_staticfiles_dirs(), ['/dev/null'])
+            self.assertEqual(get_staticfiles_dirs(), ['/dev/null'])
+        self.assertEqual(mock.call_count, 1)
+
+    def test_dirs_are_found_again_when_settings_change(self):
+        with override_settings(STATICFILES_DIRS=('/dev/null',)):
+            self.assertEqual(get_staticfiles_dirs(), ['/dev/null'])
+        with override_settings(STATICFILES_DIRS=('/dev/zero',)):
+            self.assertEqual(get_staticfiles_dirs(), ['/dev/zero'])
+
+    @override_settings(STATICFILES_DIRS=('/dev/null',))
+    def test_returns_a_copy(self):
+        get_staticfiles_dirs().append('/dev/zero')
+        self.assertEqual(get_staticfiles_dirs(), ['/dev/null'])
+
+
+class WriteAtomicTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_creates_directories_and_replaces_file(self):
+        path = os.path.join(self.tmp, 'a', 'b', 'file.txt')
+        write_atomic(path, b'old')
+        write_atomic(path, b'new')
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'new')
+        self.assertEqual(os.listdir(os.path.dirname(path)), ['file.txt'])
+
+    def test_sets_mode(self):
+        path = os.path.join(self.tmp, 'file.txt')
+        write_atomic(path, b'text', mode=0o644)
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o644)
@@ -0,0 +1,116 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from django.conf import settings
+from django.http import Http404
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from staticfilesplus.views import serve, get_asset_cache
+
+from .test_stats import CacheableTestProcessor
+from .tests_functional import SimpleTestProcessor
+from .utils import BaseStaticfilesPlusTest
+
+
+@override_settings(
+    DEBUG=True,
+    STATICFILESPLUS_PROCESSORS=(SimpleTestProcessor,),
+)
+class ServeViewTest(BaseStaticfilesPlusTest):
+
+    def setUp(self):
+        super(ServeViewTest, self).setUp()
+        self.factory = RequestFactory()
+        self.write('test.original', b'some text')
+
+    def write(self, name, contents, mtime=1000):
+        path = os.path.join(settings.STATICFILES_DIRS[0], name)
+        with open(path, 'wb') as f:
+            f.write(contents)
+        # Keep clear of the racy interval
+        os.utime(path, (mtime, mtime))
+
+    def get(self, path, **headers):
+        return serve(self.factory.get('/static/' + path, **headers), path)
+
+    def test_serves_processed_file(self):
+        response = self.get('test.processed')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'processed\nsome text')
+        self.assertTrue(response['ETag'].startswith('"'))
+
+    def test_returns_not_modified_for_matching_etag(self):
+        etag = self.get('test.processed')['ETag']
+        response = self.get('test.processed', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+    def test_returns_content_for_stale_etag(self):
+        response = self.get('test.processed', HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_shrinking_asset_cache_evicts_entries(self):
+        with override_settings(STATICFILESPLUS_SERVE_CACHE_SIZE=10):
+            cache = get_asset_cache()
+            cache.set('key', b'value', size=5)
+        with override_settings(STATICFILESPLUS_SERVE_CACHE_SIZE=4):
+            self.assertEqual(get_asset_cache().size, 0)
+
+    def test_missing_file(self):
+        with self.assertRaises(Http404):
+            self.get('missing.processed')
+
+    def test_revalidation_does_not_process_file(self):
+        etag = self.get('test.processed')['ETag']
+        with patch('staticfilesplus.views.finders.find') as find:
+            response = self.get('test.processed', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(find.called)
+
+    def test_revalidation_after_change_processes_file(self):
+        etag = self.get('test.processed')['ETag']
+        self.write('test.original', b'changed text', mtime=2000)
+        response = self.get('test.processed', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'processed\nchanged text')
+
+    def test_revalidation_after_adding_file_processes_file(self):
+        etag = self.get('test.processed')['ETag']
+        self.write('other.original', b'other')
+        with patch('staticfilesplus.views.finders.find', return_value=None) as find:
+            with self.assertRaises(Http404):
+                self.get('test.processed', HTTP_IF_NONE_MATCH=etag)
+        self.assertTrue(find.called)
+
+
+class ServeViewBuildCacheTest(ServeViewTest):
+    """
+    As above, but with dependencies recorded in the build cache
+    """
+
+    def setUp(self):
+        # The parent's class decorator would take precedence over ours
+        self.processor_settings = override_settings(
+                STATICFILESPLUS_PROCESSORS=(CacheableTestProcessor,))
+        self.processor_settings.enable()
+        super(ServeViewBuildCacheTest, self).setUp()
+
+    def tearDown(self):
+        self.processor_settings.disable()
+
+    def test_revalidation_ignores_unrelated_changes(self):
+        self.write('other.txt', b'other')
+        etag = self.get('test.processed')['ETag']
+        self.write('other.txt', b'changed', mtime=2000)
+        with patch('staticfilesplus.views.finders.find') as find:
+            response = self.get('test.processed', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(find.called)
@@ -0,0 +1,135 @@
+from __future__ import absolute_import, unicode_literals
+
+import os
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.utils.six import StringIO
+from django.test.utils import override_settings
+
+from staticfilesplus import watch
+from staticfilesplus.management.commands.watchstatic import Command, Rebuilder
+
+from .tests_functional import SimpleTestProcessor
+from .utils import BaseStaticfilesPlusTest
+
+
+class TrackedTestProcessor(SimpleTestProcessor):
+    calls = []
+
+    def process_file(self, input_path, output_path):
+        self.calls.append(os.path.basename(input_path))
+        if b'fail' in open(input_path, 'rb').read():
+            raise ValueError('failed')
+        super(TrackedTestProcessor, self).process_file(input_path, output_path)
+
+    def get_dependencies(self, input_path):
+        # Each file depends on shared.txt
+        return [os.path.join(os.path.dirname(input_path), 'shared.txt')]
+
+
+@override_settings(
+    STATICFILESPLUS_PROCESSORS=(TrackedTestProcessor,),
+    DEBUG=True
+)
+class WatchTest(BaseStaticfilesPlusTest):
+
+    def setUp(self):
+        super(WatchTest, self).setUp()
+        TrackedTestProcessor.calls = []
+        self.static_dir = settings.STATICFILES_DIRS[0]
+        self.shared = self.write('shared.txt')
+        self.a = self.write('a.original')
+        self.b = self.write('b.original')
+        self.rebuilder = Rebuilder(workers=2)
+
+    def tearDown(self):
+        self.rebuilder.close()
+        watch.clear_state()
+
+    def write(self, name, contents='text'):
+        path = os.path.join(self.static_dir, name)
+        with open(path, 'w') as f:
+            f.write(contents)
+        return path
+
+    def test_rebuilds_only_affected_files(self):
+        self.assertEqual(sorted(self.rebuilder.rebuild()[0]), [self.a, self.b])
+        TrackedTestProcessor.calls = []
+        self.write('a.original', 'changed')
+        self.assertEqual(self.rebuilder.rebuild([self.a]), ([self.a], []))
+        self.assertEqual(TrackedTestProcessor.calls, ['a.original'])
+        self.write('shared.txt', 'changed')
+        self.assertEqual(sorted(self.rebuilder.rebuild([self.shared])[0]),
+                         [self.a, self.b])
+
+    def test_failed_files_are_left_for_the_finder(self):
+        self.rebuilder.rebuild()
+        self.write('a.original', 'will fail')
+        built, errors = self.rebuilder.rebuild([self.a])
+        self.assertEqual([path for path, error in errors], [self.a])
+        watch.write_state(busy=False)
+        self.assertRaises(ValueError, finders.find, 'a.processed')
+
+    def test_finder_serves_prebuilt_files_while_watcher_is_running(self):
+        self.rebuilder.rebuild()
+        watch.write_state(busy=False)
+        TrackedTestProcessor.calls = []
+        with open(finders.find('a.processed'), 'rb') as f:
+            self.assertEqual(f.read(), b'processed\ntext')
+        self.assertEqual(TrackedTestProcessor.calls, [])
+
+    def test_finder_processes_changes_the_watcher_has_not_seen(self):
+        self.rebuilder.rebuild()
+        watch.write_state(busy=False)
+        self.write('a.original', 'changed')
+        with open(finders.find('a.processed'), 'rb') as f:
+            self.assertEqual(f.read(), b'processed\nchanged')
+
+    def test_finder_processes_files_without_watcher(self):
+        self.rebuilder.rebuild()
+        watch.write_state(busy=False)
+        watch.clear_state()
+        self.write('a.original', 'changed')
+        with open(finders.find('a.processed'), 'rb') as f:
+            self.assertEqual(f.read(), b'processed\nchanged')
+
+    @override_settings(STATICFILESPLUS_WATCH_WAIT=0.1)
+    def test_busy_watcher_times_out(self):
+        watch.write_state(busy=True)
+        self.assertFalse(watch.wait_for_watcher())
+
+    def test_command_rebuilds_changes_until_interrupted(self):
+        test = self
+
+        class FakeWatcher(object):
+            changes = [set([self.a]), set(), KeyboardInterrupt()]
+
+            def wait(self, timeout=None):
+                change = self.changes.pop(0)
+                if isinstance(change, KeyboardInterrupt):
+                    raise change
+                # Requests are held off from the first change
+                test.assertEqual(watch.read_state()['busy'], bool(timeout))
+                if change:
+                    test.write('a.original', 'changed')
+                return change
+
+            def close(self):
+                pass
+
+        with patch('staticfilesplus.management.commands.watchstatic.get_watcher',
+                   return_value=FakeWatcher()):
+            command = Command()
+            options = dict((option.dest, option.default)
+                           for option in command.option_list if option.dest)
+            options.update(stdout=StringIO(), stderr=StringIO())
+            command.execute(**options)
+        self.assertEqual(sorted(TrackedTestProcessor.calls),
+                         ['a.original', 'a.original', 'b.original'])
+        self.assertEqual(watch.read_state(), None)
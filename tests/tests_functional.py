@@ -7,7 +7,15 @@ from django.test.utils import override_settings
 from django.conf import settings
 from django.contrib.staticfiles import finders
 from django.core.management import call_command
+from django.contrib.staticfiles.finders import (
+        FileSystemFinder as DjangoFileSystemFinder)
 
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from staticfilesplus.finders import FileSystemFinder
 from staticfilesplus.processors import BaseProcessor
 
 from .utils import BaseStaticfilesPlusTest
@@ -35,11 +43,29 @@ class AnotherTestProcessor(SimpleTestProcessor):
 
     original_suffix = '.another'
     string_to_add = 'another processor\n'
+    parallel_mode = 'processes'
+
+
+# Suffixes needn't start with a dot
+class DashSuffixTestProcessor(SimpleTestProcessor):
+
+    original_suffix = '-src.txt'
+    processed_suffix = '-min.txt'
+    string_to_add = 'minified\n'
+
+
+class FailingTestProcessor(SimpleTestProcessor):
+
+    original_suffix = '.fail'
+
+    def process_file(self, input_path, output_path):
+        raise ValueError('failed to process {}'.format(input_path))
 
 @override_settings(
     STATICFILESPLUS_PROCESSORS=(
         SimpleTestProcessor,
-        AnotherTestProcessor
+        AnotherTestProcessor,
+        DashSuffixTestProcessor
     )
 )
 class ProcessorTest(BaseStaticfilesPlusTest):
@@ -100,3 +126,107 @@ class CollectStaticTest(ProcessorTest):
             if e.errno != errno.ENOENT:
                 raise
             return None
+
+
+@override_settings(STATICFILESPLUS_WORKERS=3)
+class ParallelCollectStaticTest(CollectStaticTest):
+    """
+    Run the collectstatic tests again, this time processing files in
+    parallel
+    """
+
+    @override_settings(
+        STATICFILESPLUS_PROCESSORS=(
+            SimpleTestProcessor,
+            FailingTestProcessor
+        )
+    )
+    def test_processing_error_aborts_run(self):
+        for n in range(5):
+            self.write_contents(os.path.join(settings.STATICFILES_DIRS[0],
+                    'test{}.original'.format(n)), 'some text')
+        self.write_contents(os.path.join(settings.STATICFILES_DIRS[0],
+                'test.fail'), 'some text')
+        with self.assertRaises(ValueError):
+            call_command('collectstatic', interactive=False, verbosity=0)
+
+
+@override_settings(
+    STATICFILESPLUS_PROCESSORS=(
+        SimpleTestProcessor,
+        AnotherTestProcessor
+    )
+)
+class FindCacheTest(BaseStaticfilesPlusTest):
+
+    def setUp(self):
+        super(FindCacheTest, self).setUp()
+        self.finder = FileSystemFinder()
+
+    def write_contents(self, name, contents='some text'):
+        with open(os.path.join(settings.STATICFILES_DIRS[0], name), 'wb') as f:
+            f.write(contents.encode('utf8'))
+
+    def test_results_are_cached(self):
+        self.write_contents('test.original')
+        with patch.object(DjangoFileSystemFinder, 'find',
+                autospec=True, side_effect=DjangoFileSystemFinder.find) as mock_find:
+            first = self.finder.find('test.processed')
+            call_count = mock_find.call_count
+            self.assertEqual(self.finder.find('test.processed'), first)
+            self.assertEqual(self.finder.find('test.processed'), first)
+            self.assertEqual(mock_find.call_count, call_count)
+
+    def test_cache_is_invalidated_by_new_files(self):
+        self.assertEqual(self.finder.find('test.processed'), [])
+        self.write_contents('test.another')
+        with open(self.finder.find('test.processed'), 'rb') as f:
+            self.assertEqual(f.read(), b'another processor\nsome text')
+        # Files from earlier processors take priority
+        self.write_contents('test.original')
+        with open(self.finder.find('test.processed'), 'rb') as f:
+            self.assertEqual(f.read(), b'processed\nsome text')
+
+
+class BatchTestProcessor(SimpleTestProcessor):
+
+    original_suffix = '.batch'
+    batches = []
+
+    def process_files(self, jobs):
+        self.batches.append(sorted(os.path.basename(path) for path, _ in jobs))
+        for input_path, output_path in jobs:
+            self.process_file(input_path, output_path)
+
+
+@override_settings(
+    STATICFILESPLUS_PROCESSORS=(
+        SimpleTestProcessor,
+        BatchTestProcessor
+    )
+)
+class BatchCollectStaticTest(BaseStaticfilesPlusTest):
+
+    def setUp(self):
+        super(BatchCollectStaticTest, self).setUp()
+        BatchTestProcessor.batches = []
+        for n in range(4):
+            path = os.path.join(settings.STATICFILES_DIRS[0], 'test{}.batch'.format(n))
+            with open(path, 'wb') as f:
+                f.write(b'some text')
+
+    def assertCollected(self, names):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        for name in names:
+            with open(os.path.join(settings.STATIC_ROOT, name), 'rb') as f:
+                self.assertEqual(f.read(), b'processed\nsome text')
+
+    def test_processes_files_in_one_batch(self):
+        self.assertCollected(['test0.processed', 'test3.processed'])
+        self.assertEqual(BatchTestProcessor.batches,
+                [['test0.batch', 'test1.batch', 'test2.batch', 'test3.batch']])
+
+    @override_settings(STATICFILESPLUS_WORKERS=2)
+    def test_splits_batches_between_workers(self):
+        self.assertCollected(['test0.processed', 'test3.processed'])
+        self.assertEqual(sorted(len(batch) for batch in BatchTestProcessor.batches), [2, 2])
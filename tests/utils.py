@@ -7,6 +7,8 @@ import django
 from django.test.utils import override_settings
 from django.conf import settings
 from django.contrib.staticfiles import finders, storage
+
+from staticfilesplus.utils import clear_staticfiles_dirs
 # In Django 1.4 we can't use the override_settings decorator
 # with SimpleTestCase instances so we have to use a
 # TransactionTestCase, even though we don't touch the db
@@ -55,6 +57,8 @@ class BaseStaticfilesPlusTest(SimpleTestCase):
     def setUp(self):
         settings.STATIC_ROOT = self.tmp_dir()
         settings.STATICFILES_DIRS = (self.tmp_dir(),)
+        # Assigning to settings directly doesn't send setting_changed
+        clear_staticfiles_dirs()
         # Configure a new lazy storage instance so it will pick up our
         # new settings
         storage.staticfiles_storage = storage.ConfiguredStorage()